@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# TmServer - TissueMAPS server application.
+# Copyright (C) 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Microbenchmark of the database access for single channel layer tiles.
+
+Compares the per-tile latency of the former ORM-based retrieval, which loads
+a `ChannelLayer` and a `ChannelLayerTile` object for each tile, with the
+Core-level select used by the server. Caches are bypassed.
+
+Example
+-------
+python benchmarks/channel_tile_fetch.py 1 3 --n-tiles 500
+"""
+import argparse
+import random
+import time
+import numpy as np
+
+import tmlib.models as tm
+
+from tmserver.api.tile import (
+    _get_channel_layer_tile_pixels, _get_channel_layer_metadata
+)
+
+
+def fetch_with_orm(experiment_id, channel_layer_id, z, y, x):
+    with tm.utils.ExperimentSession(experiment_id) as session:
+        channel_layer = session.query(tm.ChannelLayer).get(channel_layer_id)
+        channel_layer.zplane, channel_layer.tpoint
+        tile = session.query(tm.ChannelLayerTile).\
+            filter_by(channel_layer_id=channel_layer.id, z=z, y=y, x=x).\
+            one_or_none()
+        return tile._pixels
+
+
+def fetch_with_core(experiment_id, channel_layer_id, z, y, x):
+    metadata = _get_channel_layer_metadata(experiment_id, channel_layer_id)
+    metadata['zplane'], metadata['tpoint']
+    return _get_channel_layer_tile_pixels(
+        experiment_id, channel_layer_id, z, y, x
+    )
+
+
+def measure(fetch, experiment_id, channel_layer_id, coordinates):
+    timings = list()
+    for z, y, x in coordinates:
+        start = time.time()
+        fetch(experiment_id, channel_layer_id, z, y, x)
+        timings.append(time.time() - start)
+    return np.array(timings) * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='per-tile latency of channel layer tile retrieval'
+    )
+    parser.add_argument('experiment_id', type=int, help='ID of the experiment')
+    parser.add_argument(
+        'channel_layer_id', type=int, help='ID of the channel layer'
+    )
+    parser.add_argument(
+        '--n-tiles', '-n', type=int, default=1000,
+        help='number of randomly selected tiles (default: 1000)'
+    )
+    args = parser.parse_args()
+
+    with tm.utils.ExperimentSession(args.experiment_id) as session:
+        coordinates = session.query(
+                tm.ChannelLayerTile.z, tm.ChannelLayerTile.y,
+                tm.ChannelLayerTile.x
+            ).\
+            filter_by(channel_layer_id=args.channel_layer_id).\
+            all()
+    coordinates = random.sample(
+        coordinates, min(args.n_tiles, len(coordinates))
+    )
+
+    # Cached layer metadata is tied to the layer version, which is tracked
+    # by the tile cache extension and requires an application context.
+    from tmserver.appfactory import create_app
+    app = create_app()
+    with app.app_context():
+        # warm up connection pool and caches of the database server
+        measure(
+            fetch_with_orm, args.experiment_id, args.channel_layer_id,
+            coordinates[:10]
+        )
+        print('%-6s %10s %10s %10s' % ('path', 'mean', 'median', 'p95'))
+        for name, fetch in [('orm', fetch_with_orm), ('core', fetch_with_core)]:
+            timings = measure(
+                fetch, args.experiment_id, args.channel_layer_id, coordinates
+            )
+            print('%-6s %8.3fms %8.3fms %8.3fms' % (
+                name, timings.mean(), np.median(timings),
+                np.percentile(timings, 95)
+            ))
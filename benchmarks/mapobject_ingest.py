@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# TmServer - TissueMAPS server application.
+# Copyright (C) 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Microbenchmark of the insertion of the mapobjects of a site.
+
+Compares the former insertion, which adds and flushes one `Mapobject` at a
+time to obtain its ID, with the allocation of all IDs by a single query
+followed by a bulk insert, which is used by the segmentation ingest. The
+created mapobjects are deleted again after each run.
+
+Example
+-------
+python benchmarks/mapobject_ingest.py 1 2 5 --n-objects 10000
+"""
+import argparse
+import time
+
+import tmlib.models as tm
+
+from tmserver.api.mapobject import _allocate_mapobject_ids
+
+
+def insert_with_flush(session, site_id, mapobject_type_id, n):
+    ids = list()
+    for i in range(n):
+        mapobject = tm.Mapobject(site_id, mapobject_type_id)
+        session.add(mapobject)
+        session.flush()
+        ids.append(mapobject.id)
+    return ids
+
+
+def insert_with_allocation(session, site_id, mapobject_type_id, n):
+    ids = _allocate_mapobject_ids(session, n)
+    mapobjects = list()
+    for mapobject_id in ids:
+        mapobject = tm.Mapobject(site_id, mapobject_type_id)
+        mapobject.id = mapobject_id
+        mapobjects.append(mapobject)
+    session.bulk_ingest(mapobjects)
+    return ids
+
+
+def measure(insert, experiment_id, site_id, mapobject_type_id, n):
+    start = time.time()
+    with tm.utils.ExperimentSession(experiment_id, False) as session:
+        ids = insert(session, site_id, mapobject_type_id, n)
+    duration = time.time() - start
+    with tm.utils.ExperimentSession(experiment_id) as session:
+        session.query(tm.Mapobject).\
+            filter(tm.Mapobject.id.in_(ids)).\
+            delete(synchronize_session=False)
+    return duration
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='duration of the insertion of the mapobjects of a site'
+    )
+    parser.add_argument('experiment_id', type=int, help='ID of the experiment')
+    parser.add_argument(
+        'mapobject_type_id', type=int, help='ID of the mapobject type'
+    )
+    parser.add_argument('site_id', type=int, help='ID of the site')
+    parser.add_argument(
+        '--n-objects', '-n', type=int, default=10000,
+        help='number of mapobjects (default: 10000)'
+    )
+    args = parser.parse_args()
+
+    print('%-10s %10s %16s' % ('path', 'duration', 'throughput'))
+    for name, insert in [
+            ('flush', insert_with_flush),
+            ('allocate', insert_with_allocation)]:
+        duration = measure(
+            insert, args.experiment_id, args.site_id, args.mapobject_type_id,
+            args.n_objects
+        )
+        print('%-10s %9.2fs %10.0f obj/s' % (
+            name, duration, args.n_objects / duration
+        ))
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# TmServer - TissueMAPS server application.
+# Copyright (C) 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Benchmark of the segmentation ingest of a single site with many
+mapobjects.
+
+Generates a label image of the size of the site's image with square objects
+on a regular grid, uploads it as raw array and reports the duration of the
+request, which covers polygon extraction and insertion of all mapobjects
+and segmentations. Segmentations of a site can only be added once per
+segmentation layer, so each run must use another time point or z-plane.
+
+Example
+-------
+python benchmarks/segmentation_ingest.py http://localhost:5002 dG1hcHM0 \\
+    dG1hcHMx plate01 D04 2160 2560 --n-objects 10000 --tpoint 1
+"""
+import argparse
+import getpass
+import json
+import math
+import time
+import urllib
+import urllib2
+import numpy as np
+
+
+def get_token(base_url, username, password):
+    request = urllib2.Request(
+        '%s/auth' % base_url,
+        json.dumps({'username': username, 'password': password}),
+        {'Content-Type': 'application/json'}
+    )
+    return json.load(urllib2.urlopen(request))['access_token']
+
+
+def create_label_image(height, width, n_objects):
+    """Creates a label image with up to `n_objects` squares on a grid."""
+    spacing = int(math.sqrt(height * width / float(n_objects)))
+    if spacing < 3:
+        raise ValueError('Image is too small for %d objects.' % n_objects)
+    image = np.zeros((height, width), dtype=np.int32)
+    size = max(spacing * 2 // 3, 1)
+    label = 0
+    for y in range(0, height - size + 1, spacing):
+        for x in range(0, width - size + 1, spacing):
+            if label == n_objects:
+                return image
+            label += 1
+            image[y:y + size, x:x + size] = label
+    return image
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('base_url', help='URL of the server')
+    parser.add_argument('experiment_id', help='ID of the experiment')
+    parser.add_argument('mapobject_type_id', help='ID of the mapobject type')
+    parser.add_argument('plate_name', help='name of the plate')
+    parser.add_argument('well_name', help='name of the well')
+    parser.add_argument('height', type=int, help='height of the site image')
+    parser.add_argument('width', type=int, help='width of the site image')
+    parser.add_argument(
+        '--well-pos-y', type=int, default=0,
+        help='y-coordinate of the site within the well (default: 0)'
+    )
+    parser.add_argument(
+        '--well-pos-x', type=int, default=0,
+        help='x-coordinate of the site within the well (default: 0)'
+    )
+    parser.add_argument(
+        '--tpoint', '-t', type=int, default=0, help='time point (default: 0)'
+    )
+    parser.add_argument(
+        '--zplane', '-z', type=int, default=0, help='z-plane (default: 0)'
+    )
+    parser.add_argument(
+        '--n-objects', '-n', type=int, default=10000,
+        help='number of mapobjects (default: 10000)'
+    )
+    parser.add_argument(
+        '--username', '-u', default=getpass.getuser(),
+        help='name of the user (default: name of the current user)'
+    )
+    args = parser.parse_args()
+
+    base_url = args.base_url.rstrip('/')
+    token = get_token(
+        base_url, args.username, getpass.getpass('password: ')
+    )
+    image = create_label_image(args.height, args.width, args.n_objects)
+    n_objects = int(image.max())
+    query = urllib.urlencode({
+        'plate_name': args.plate_name, 'well_name': args.well_name,
+        'well_pos_y': args.well_pos_y, 'well_pos_x': args.well_pos_x,
+        'tpoint': args.tpoint, 'zplane': args.zplane, 'dtype': '<i4'
+    })
+    url = '%s/api/experiments/%s/mapobject_types/%s/segmentations/upload?%s' % (
+        base_url, args.experiment_id, args.mapobject_type_id, query
+    )
+    request = urllib2.Request(
+        url, image.astype('<i4').tostring(),
+        {
+            'Content-Type': 'application/octet-stream',
+            'Authorization': 'JWT %s' % token
+        }
+    )
+    start = time.time()
+    urllib2.urlopen(request).read()
+    duration = time.time() - start
+    print 'mapobjects: %d' % n_objects
+    print 'duration:   %.2fs' % duration
+    print 'throughput: %.0f mapobjects/s' % (n_objects / duration)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# TmServer - TissueMAPS server application.
+# Copyright (C) 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Load test of the concurrent channel layer tile throughput of a single
+worker process.
+
+Sends requests for random tiles of one zoom level with a given number of
+concurrent clients and reports the throughput and latency. To compare the
+serving modes, run the server with a single worker process once
+synchronously and once with *gevent* and disable the tile cache in both
+cases (``tile_cache_memory_size = 0``, ``tile_cache_disk_size = 0`` and
+``tile_prefetch_budget = 0``), such that each request hits the database::
+
+    uwsgi --http :5002 --module tmserver.wsgi:app --processes 1
+    uwsgi --http :5002 --module tmserver.wsgi:app --processes 1 \\
+        --gevent 100 --gevent-monkey-patch --enable-threads
+
+The benchmark needs a running server with a populated database, which
+wasn't available when it was written. The requested comparison of the
+throughput of both modes is therefore still missing: no numbers have been
+recorded for either mode, so any speed-up of the *gevent* mode is
+unverified.
+
+Example
+-------
+python benchmarks/tile_throughput.py http://localhost:5002 1 3 8 \\
+    --concurrency 50 --n-requests 2000
+"""
+import argparse
+import random
+import time
+
+from gevent import monkey
+monkey.patch_all()
+
+import gevent.pool
+import numpy as np
+import urllib2
+
+
+def fetch(url):
+    start = time.time()
+    response = urllib2.urlopen(url)
+    response.read()
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('base_url', help='URL of the server')
+    parser.add_argument('experiment_id', help='ID of the experiment')
+    parser.add_argument('channel_layer_id', help='ID of the channel layer')
+    parser.add_argument('z', type=int, help='zoom level of requested tiles')
+    parser.add_argument(
+        '--concurrency', '-c', type=int, default=50,
+        help='number of concurrent requests (default: 50)'
+    )
+    parser.add_argument(
+        '--n-requests', '-n', type=int, default=1000,
+        help='total number of requests (default: 1000)'
+    )
+    parser.add_argument(
+        '--seed', type=int, default=0, help='random seed (default: 0)'
+    )
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    n_tiles = 2 ** args.z
+    urls = [
+        '%s/api/experiments/%s/channel_layers/%s/tiles?x=%d&y=%d&z=%d' % (
+            args.base_url.rstrip('/'), args.experiment_id,
+            args.channel_layer_id, random.randrange(n_tiles),
+            random.randrange(n_tiles), args.z
+        )
+        for _ in range(args.n_requests)
+    ]
+    pool = gevent.pool.Pool(args.concurrency)
+    start = time.time()
+    timings = np.array(pool.map(fetch, urls)) * 1000
+    duration = time.time() - start
+    print 'concurrency: %d' % args.concurrency
+    print 'throughput:  %.1f tiles/s' % (args.n_requests / duration)
+    print 'latency:     mean=%.2fms median=%.2fms p95=%.2fms' % (
+        timings.mean(), np.median(timings), np.percentile(timings, 95)
+    )
+
+
+if __name__ == '__main__':
+    main()
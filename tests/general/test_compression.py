@@ -0,0 +1,120 @@
+import gzip
+import zlib
+from cStringIO import StringIO
+
+import flask
+import pytest
+
+from tmserver.compression import compress, iter_compressed, compress_response
+
+CHUNKS = ['{"type":"FeatureCollection","features":['] + [
+    '{"type":"Feature","id":%d,"properties":{}},' % i for i in range(1000)
+] + [']}']
+
+
+def test_gzip_stream_is_decodable_as_it_arrives():
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    compressed = list(iter_compressed(iter(CHUNKS), 'gzip', flush_size=4096))
+    assert len(compressed) > 2
+    decoded = decompressor.decompress(''.join(compressed[:-1]))
+    assert len(decoded) >= len(''.join(CHUNKS)) - 4096
+    data = ''.join(compressed)
+    assert gzip.GzipFile(fileobj=StringIO(data)).read() == ''.join(CHUNKS)
+    assert len(data) * 5 < len(''.join(CHUNKS))
+
+
+def test_deflate_uses_zlib_format():
+    data = ''.join(CHUNKS)
+    assert zlib.decompress(compress(data, 'deflate')) == data
+    assert zlib.decompress(
+        ''.join(iter_compressed([u'\xe4', data], 'deflate'))
+    ) == u'\xe4'.encode('utf-8') + data
+
+
+def test_unsupported_encoding():
+    with pytest.raises(ValueError):
+        compress('data', 'br')
+
+
+@pytest.fixture
+def app(monkeypatch):
+    import tmserver.compression
+    config = type('Config', (object, ), {
+        'response_compression_level': 6,
+        'response_compression_min_size': 64
+    })()
+    monkeypatch.setattr(tmserver.compression, 'cfg', config)
+    app = flask.Flask(__name__)
+
+    @app.route('/json')
+    @compress_response
+    def get_json():
+        size = flask.request.args.get('size', type=int)
+        response = flask.Response('x' * size, mimetype='application/json')
+        response.set_etag('tile')
+        return response
+
+    @app.route('/stream')
+    @compress_response
+    def get_stream():
+        n = flask.request.args.get('n', type=int)
+        return flask.Response(iter(CHUNKS[:n]), mimetype='application/json')
+
+    @app.route('/not_modified')
+    @compress_response
+    def get_not_modified():
+        response = flask.Response(status=304)
+        response.set_etag('tile')
+        return response
+
+    return app
+
+
+def test_response_is_compressed_with_accepted_encoding(app):
+    client = app.test_client()
+    response = client.get(
+        '/json?size=1000', headers={'Accept-Encoding': 'deflate, gzip;q=0.5'}
+    )
+    assert response.headers['Content-Encoding'] == 'deflate'
+    assert zlib.decompress(response.data) == 'x' * 1000
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert response.headers['ETag'] == 'W/"tile"'
+
+    response = client.get('/json?size=1000')
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == 'x' * 1000
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert response.headers['ETag'] == 'W/"tile"'
+
+
+def test_small_response_is_not_compressed(app):
+    response = app.test_client().get(
+        '/json?size=63', headers={'Accept-Encoding': 'gzip'}
+    )
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == 'x' * 63
+    assert response.headers['ETag'] == 'W/"tile"'
+
+
+def test_streamed_response_is_compressed_after_look_ahead(app):
+    client = app.test_client()
+    response = client.get('/stream?n=1', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == CHUNKS[0]
+
+    response = client.get(
+        '/stream?n=%d' % len(CHUNKS), headers={'Accept-Encoding': 'gzip'}
+    )
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    data = gzip.GzipFile(fileobj=StringIO(response.data)).read()
+    assert data == ''.join(CHUNKS)
+
+
+def test_not_modified_response_has_same_validators(app):
+    response = app.test_client().get(
+        '/not_modified', headers={'Accept-Encoding': 'gzip'}
+    )
+    assert response.status_code == 304
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert response.headers['ETag'] == 'W/"tile"'
@@ -0,0 +1,79 @@
+import functools
+
+import numpy as np
+from tmlib.metadata import SegmentationImageMetadata
+
+from tmserver import extraction
+from tmserver.extraction import (
+    get_object_bounding_boxes, iter_object_crops, extract_polygons,
+    ExtractionPool
+)
+from tmserver.api.mapobject import _extract_polygons
+
+
+def create_label_image(n_objects):
+    array = np.zeros((60, 70), dtype=np.int32)
+    for i in range(n_objects):
+        y, x = 3 * (i // 23), 3 * (i % 23)
+        array[y:y + 2, x:x + 3] = i + 1
+    # Touching and non-convex mapobjects.
+    array[0, 0] = 2
+    array[1, 2] = 0
+    return array
+
+
+def test_bounding_boxes():
+    array = np.zeros((5, 6), dtype=np.int32)
+    array[1:3, 2:5] = 7
+    array[4, 0] = 3
+    array[0, 5] = 3
+    labels, boxes = get_object_bounding_boxes(array)
+    np.testing.assert_array_equal(labels, [3, 7])
+    np.testing.assert_array_equal(boxes, [[0, 0, 5, 6], [1, 2, 3, 5]])
+    labels, boxes = get_object_bounding_boxes(np.zeros((2, 2), np.int32))
+    assert len(labels) == 0
+    assert boxes.shape == (0, 4)
+
+
+def test_crops_contain_single_mapobject_with_margin():
+    array = create_label_image(30)
+    labels, boxes = get_object_bounding_boxes(array)
+    crops = list(iter_object_crops(array, labels, boxes))
+    y, x, crop = crops[1]
+    assert (y, x) == (0, 0)
+    assert set(np.unique(crop).tolist()) == {0, 2}
+    y, x, crop = crops[24]
+    assert (y, x) == (2, 2)
+    assert crop.shape == (4, 5)
+
+
+def assert_same_polygons(polygons, expected):
+    assert [label for label, _ in polygons] == \
+        [label for label, _ in expected]
+    for (_, polygon), (_, expected_polygon) in zip(polygons, expected):
+        assert polygon.equals(expected_polygon)
+
+
+def test_parallel_extraction_matches_serial_extraction(monkeypatch):
+    monkeypatch.setattr(extraction, 'OBJECTS_PER_TASK', 16)
+    array = create_label_image(400)
+    # The extractor of the segmentation ingest, which gets pickled together
+    # with the metadata and the crops for the worker processes.
+    extract = functools.partial(
+        _extract_polygons, metadata=SegmentationImageMetadata(1, 1, 0, 0)
+    )
+    serial = extract(array, 10, 20)
+    assert len(serial) == 400
+    pool = ExtractionPool(3)
+    try:
+        assert_same_polygons(
+            extract_polygons(array, extract, 10, 20, pool), serial
+        )
+        workers = pool._get_pool()
+        # The worker processes are reused by subsequent extractions.
+        assert_same_polygons(
+            extract_polygons(array, extract, 10, 20, pool), serial
+        )
+        assert pool._get_pool() is workers
+    finally:
+        pool.close()
@@ -0,0 +1,92 @@
+import struct
+from cStringIO import StringIO
+
+import pytest
+
+from tmserver.polygonstream import pack_record, iter_records, load_polygons
+
+
+class TrickleStream(object):
+
+    # Returns at most a few bytes per read like a network stream.
+    def __init__(self, data, n=3):
+        self._f = StringIO(data)
+        self._n = n
+
+    def read(self, size):
+        return self._f.read(min(size, self._n))
+
+
+def test_records_are_read_in_order():
+    data = pack_record(3, 'abcdefgh') + pack_record(1, 'x')
+    assert list(iter_records(TrickleStream(data))) == \
+        [(3, 'abcdefgh'), (1, 'x')]
+    assert list(iter_records(StringIO(''))) == []
+
+
+@pytest.mark.parametrize('data', [
+    pack_record(1, 'abc')[:-1],
+    pack_record(1, 'abc') + '\x01\x00',
+    pack_record(0, 'abc'),
+    pack_record(-2, 'abc'),
+    struct.pack('<iI', 1, 0),
+])
+def test_malformed_records_are_rejected(data):
+    with pytest.raises(ValueError):
+        list(iter_records(StringIO(data)))
+
+
+def _pack_polygons(polygons):
+    return StringIO(''.join(
+        pack_record(label, polygon.wkb) for label, polygon in polygons
+    ))
+
+
+def test_polygons_are_transformed_to_map_coordinates():
+    geometry = pytest.importorskip('shapely.geometry')
+    # The outline of the pixels of rows 0 to 2 and columns 1 to 3 of an
+    # image with 3 rows and 4 columns.
+    square = geometry.box(1, 0, 3, 2)
+    polygons = load_polygons(
+        _pack_polygons([(5, square)]), (3, 4), y_offset=10, x_offset=20
+    )
+    assert len(polygons) == 1
+    label, polygon = polygons[0]
+    assert label == 5
+    assert polygon.bounds == (21, -12, 23, -10)
+    assert polygon.area == square.area
+
+
+@pytest.mark.parametrize('create', [
+    # beyond the centres of the last column and row or the first column
+    lambda g: g.box(0, 0, 4, 2),
+    lambda g: g.box(0, 0, 3, 3),
+    lambda g: g.box(-0.5, 0, 2, 2),
+    # not a polygon
+    lambda g: g.Point(1, 1),
+    lambda g: g.LineString([(0, 0), (1, 1)]),
+    lambda g: g.MultiPolygon([g.box(0, 0, 1, 1), g.box(2, 0, 3, 1)]),
+    # self-intersecting
+    lambda g: g.Polygon([(0, 0), (2, 2), (2, 0), (0, 2)]),
+])
+def test_invalid_polygons_are_rejected(create):
+    geometry = pytest.importorskip('shapely.geometry')
+    polygons = _pack_polygons([(1, create(geometry))])
+    with pytest.raises(ValueError):
+        load_polygons(polygons, (3, 4), 0, 0)
+
+
+def test_invalid_wkb_is_rejected():
+    pytest.importorskip('shapely')
+    with pytest.raises(ValueError):
+        load_polygons(StringIO(pack_record(1, 'no wkb')), (3, 4), 0, 0)
+
+
+def test_duplicate_labels_are_rejected():
+    geometry = pytest.importorskip('shapely.geometry')
+    square = geometry.box(0, 0, 1, 1)
+    with pytest.raises(ValueError):
+        load_polygons(
+            _pack_polygons([(1, square), (2, square), (1, square)]), (3, 4),
+            0, 0
+        )
@@ -0,0 +1,109 @@
+import uuid
+
+import pytest
+import shapely.geometry
+import tmlib.models as tm
+
+from tmserver.api.mapobject import _allocate_mapobject_ids, _add_segmentations
+
+
+@pytest.fixture(scope='function')
+def site(testexp):
+    """Position of a site of the test experiment."""
+    with tm.utils.ExperimentSession(testexp.id) as session:
+        site = session.query(tm.Site).first()
+        if site is None:
+            pytest.skip('The test experiment has no sites.')
+        return {
+            'id': site.id, 'plate_name': site.well.plate.name,
+            'well_name': site.well.name, 'y': site.y, 'x': site.x
+        }
+
+
+@pytest.fixture(scope='function')
+def mapobject_type_id(testexp):
+    """ID of a new mapobject type of the test experiment."""
+    with tm.utils.ExperimentSession(testexp.id) as session:
+        mapobject_type = session.get_or_create(
+            tm.MapobjectType, name=str(uuid.uuid4()),
+            experiment_id=testexp.id, ref_type=tm.Site.__name__
+        )
+        return mapobject_type.id
+
+
+def _get_squares(labels):
+    def get_polygons(image_size, y_offset, x_offset, metadata):
+        return [
+            (label, shapely.geometry.box(
+                x_offset + 10 * label, -y_offset - 10 * label - 5,
+                x_offset + 10 * label + 5, -y_offset - 10 * label
+            ))
+            for label in labels
+        ]
+    return get_polygons
+
+
+def _get_mapobject_ids(experiment_id, mapobject_type_id, tpoint):
+    with tm.utils.ExperimentSession(experiment_id) as session:
+        segmentation_layer = session.query(tm.SegmentationLayer).\
+            filter_by(
+                mapobject_type_id=mapobject_type_id, tpoint=tpoint, zplane=0
+            ).\
+            one()
+        return dict(
+            session.query(
+                tm.MapobjectSegmentation.label,
+                tm.MapobjectSegmentation.mapobject_id
+            ).\
+            filter_by(segmentation_layer_id=segmentation_layer.id).\
+            all()
+        )
+
+
+def test_allocated_ids_are_unique(testexp):
+    with tm.utils.ExperimentSession(testexp.id, False) as session:
+        assert _allocate_mapobject_ids(session, 0) == []
+        ids = _allocate_mapobject_ids(session, 100)
+        more_ids = _allocate_mapobject_ids(session, 1)
+    assert len(set(ids)) == 100
+    assert more_ids[0] not in ids
+
+
+def test_bulk_ingest_keeps_allocated_ids(testexp, site, mapobject_type_id):
+    with tm.utils.ExperimentSession(testexp.id, False) as session:
+        ids = _allocate_mapobject_ids(session, 3)
+        mapobjects = list()
+        for mapobject_id in ids:
+            mapobject = tm.Mapobject(site['id'], mapobject_type_id)
+            mapobject.id = mapobject_id
+            mapobjects.append(mapobject)
+        session.bulk_ingest(mapobjects)
+    with tm.utils.ExperimentSession(testexp.id) as session:
+        stored_ids = session.query(tm.Mapobject.id).\
+            filter_by(mapobject_type_id=mapobject_type_id).\
+            all()
+    assert sorted(i for i, in stored_ids) == sorted(ids)
+
+
+def test_segmentations_reuse_mapobjects_of_existing_labels(testexp, site,
+        mapobject_type_id):
+    args = (
+        testexp.id, mapobject_type_id, site['plate_name'], site['well_name'],
+        site['y'], site['x'], 0
+    )
+    _add_segmentations(*args, tpoint=0, align=False,
+        get_polygons=_get_squares([1, 2]))
+    _add_segmentations(*args, tpoint=1, align=False,
+        get_polygons=_get_squares([2, 3]))
+
+    first = _get_mapobject_ids(testexp.id, mapobject_type_id, 0)
+    second = _get_mapobject_ids(testexp.id, mapobject_type_id, 1)
+    assert sorted(first) == [1, 2]
+    assert sorted(second) == [2, 3]
+    assert second[2] == first[2]
+    assert len(set(first.values()) | set(second.values())) == 3
+    with tm.utils.ExperimentSession(testexp.id) as session:
+        n_mapobjects = session.query(tm.Mapobject).\
+            filter_by(mapobject_type_id=mapobject_type_id).\
+            count()
+    assert n_mapobjects == 3
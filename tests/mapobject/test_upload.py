@@ -0,0 +1,82 @@
+from cStringIO import StringIO
+
+import flask
+import numpy as np
+import pytest
+
+from tmserver.upload import (
+    get_upload_stream, parse_dtype, read_raw_array, load_array
+)
+
+app = flask.Flask(__name__)
+
+
+def _serialize(save, *args, **kwargs):
+    f = StringIO()
+    save(f, *args, **kwargs)
+    return f.getvalue()
+
+
+def test_raw_array_of_any_integer_type():
+    array = np.arange(12, dtype='>u2').reshape(3, 4)
+    with app.test_request_context(method='POST', data=array.tostring()):
+        dtype = parse_dtype('>u2')
+        f = get_upload_stream('segmentation')
+        loaded = read_raw_array(f, (3, 4), dtype)
+    assert loaded.dtype == np.dtype('>u2')
+    np.testing.assert_array_equal(loaded, array)
+
+
+@pytest.mark.parametrize('size', [23, 25])
+def test_raw_array_of_wrong_size_is_rejected(size):
+    with pytest.raises(ValueError):
+        read_raw_array(StringIO('\0' * size), (2, 3), np.dtype('<i4'))
+
+
+@pytest.mark.parametrize('name', ['<f4', 'object', 'no type'])
+def test_non_integer_types_are_rejected(name):
+    with pytest.raises(ValueError):
+        parse_dtype(name)
+
+
+def test_npz_body_is_spooled():
+    array = np.arange(6, dtype=np.int32).reshape(2, 3)
+    data = _serialize(np.savez_compressed, segmentation=array)
+    with app.test_request_context(method='POST', data=data):
+        f = get_upload_stream('segmentation')
+        loaded = load_array(f, spool=True)
+    np.testing.assert_array_equal(loaded, array)
+
+
+def test_npy_file_in_multipart_request():
+    array = np.arange(6, dtype=np.uint8).reshape(3, 2)
+    data = {
+        'plate_name': 'plate01',
+        'segmentation': (StringIO(_serialize(np.save, array)), 'image.npy')
+    }
+    with app.test_request_context(method='POST', data=data):
+        assert flask.request.values['plate_name'] == 'plate01'
+        loaded = load_array(get_upload_stream('segmentation'))
+    np.testing.assert_array_equal(loaded, array)
+
+
+def test_multipart_request_without_part_is_rejected():
+    with app.test_request_context(
+            method='POST', data={'plate_name': 'a'},
+            content_type='multipart/form-data'):
+        with pytest.raises(ValueError):
+            get_upload_stream('segmentation')
+
+
+def test_npz_file_without_segmentation_is_rejected():
+    data = _serialize(np.savez, labels=np.zeros((2, 2), dtype=np.int32))
+    with pytest.raises(ValueError):
+        load_array(StringIO(data))
+
+
+def test_pickled_objects_are_rejected():
+    data = _serialize(
+        np.save, np.array([{'a': 1}], dtype=object), allow_pickle=True
+    )
+    with pytest.raises(ValueError):
+        load_array(StringIO(data))
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from tmserver.composite import parse_color, blend_channel_tiles
+
+
+def test_parse_color():
+    assert parse_color('ff8000') == (255, 128, 0)
+    assert parse_color('#00ff00') == (0, 255, 0)
+    with pytest.raises(ValueError):
+        parse_color('fff')
+
+
+def test_blend_channel_tiles():
+    red = np.full((2, 2), 255, dtype=np.uint8)
+    green = np.array([[0, 100], [150, 255]], dtype=np.uint8)
+    rgb = blend_channel_tiles(
+        [red, green], [(255, 0, 0), (0, 255, 0)], [(0, 255), (100, 200)]
+    )
+    assert rgb.dtype == np.uint8
+    assert rgb.shape == (2, 2, 3)
+    np.testing.assert_array_equal(rgb[..., 0], 255)
+    np.testing.assert_array_equal(rgb[..., 1], [[0, 0], [128, 255]])
+    np.testing.assert_array_equal(rgb[..., 2], 0)
+
+
+def test_blend_channel_tiles_saturates_and_pads():
+    a = np.full((2, 2), 200, dtype=np.uint8)
+    b = np.full((1, 2), 200, dtype=np.uint8)
+    rgb = blend_channel_tiles(
+        [a, b], [(200, 0, 0), (200, 0, 0)], [(0, 200), (0, 200)]
+    )
+    np.testing.assert_array_equal(rgb[..., 0], [[255, 255], [200, 200]])
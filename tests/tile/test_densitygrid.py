@@ -0,0 +1,35 @@
+import json
+
+import numpy as np
+
+from tmserver.densitygrid import (
+    compute_density_grid, encode_density_grid, decode_density_grid,
+    encode_density_grid_as_json
+)
+
+
+def test_compute_density_grid():
+    bbox = (0, -40, 40, 0)
+    x = np.array([1, 2, 39, 25, 100])
+    y = np.array([-1, -2, -39, -5, -1])
+    counts = compute_density_grid(x, y, bbox, (4, 4))
+    assert counts.dtype == np.uint32
+    assert counts.sum() == 4
+    assert counts[0, 0] == 2
+    assert counts[3, 3] == 1
+    assert counts[0, 2] == 1
+
+
+def test_density_grid_encodings():
+    counts = np.arange(6, dtype=np.uint32).reshape(2, 3)
+    bbox = (0.0, -512.0, 768.0, 0.0)
+    decoded, decoded_bbox = decode_density_grid(
+        encode_density_grid(counts, bbox)
+    )
+    np.testing.assert_array_equal(decoded, counts)
+    assert decoded_bbox == bbox
+
+    grid = json.loads(encode_density_grid_as_json(counts, bbox))
+    assert grid['type'] == 'DensityGrid'
+    assert grid['shape'] == [2, 3]
+    assert grid['counts'] == range(6)
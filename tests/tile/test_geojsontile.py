@@ -0,0 +1,27 @@
+import json
+
+from tmserver.geojsontile import iter_feature_collection
+
+
+def test_feature_collection_splices_geometries():
+    point = '{"type":"Point","coordinates":[1.5,-2]}'
+    outlines = [(i, point) for i in range(5)]
+    chunks = list(iter_feature_collection(
+        outlines, lambda i: '{"label":"%d"}' % (i % 2), chunk_size=2
+    ))
+    assert len(chunks) == 5
+    collection = json.loads(''.join(chunks))
+    assert collection['type'] == 'FeatureCollection'
+    assert [f['id'] for f in collection['features']] == range(5)
+    assert collection['features'][3] == {
+        'type': 'Feature', 'id': 3,
+        'geometry': {'type': 'Point', 'coordinates': [1.5, -2]},
+        'properties': {'label': '1'}
+    }
+
+
+def test_empty_feature_collection():
+    chunks = iter_feature_collection([], lambda i: '{}')
+    assert json.loads(''.join(chunks)) == {
+        'type': 'FeatureCollection', 'features': []
+    }
@@ -0,0 +1,48 @@
+import threading
+
+import flask
+
+from tmserver.extensions.prefetch import (
+    TilePrefetcher, get_neighbor_tile_coordinates
+)
+
+
+def test_neighbor_tile_coordinates():
+    coordinates = get_neighbor_tile_coordinates(3, 0, 5)
+    assert (3, 0, 4) in coordinates
+    assert (3, 1, 6) in coordinates
+    assert (3, 0, 5) not in coordinates
+    assert all(y >= 0 and x >= 0 for _, y, x in coordinates)
+    assert [c for c in coordinates if c[0] == 4] == [
+        (4, 0, 10), (4, 0, 11), (4, 1, 10), (4, 1, 11)
+    ]
+
+
+def test_prefetcher_loads_scheduled_tiles_within_budget():
+    app = flask.Flask(__name__)
+    prefetcher = TilePrefetcher('test_prefetcher')
+    prefetcher.init_app(app, budget=2, max_load=1000)
+    loaded = list()
+    done = threading.Event()
+
+    def loader(experiment_id, coordinates):
+        loaded.extend((experiment_id, c) for c in coordinates)
+        done.set()
+
+    with app.app_context():
+        n = prefetcher.schedule(
+            1, [(2, 0, 0, 0), (2, 0, 0, 1), (2, 0, 1, 0)], loader
+        )
+        assert n == 2
+        assert prefetcher.stats['dropped'] == 1
+        assert done.wait(5)
+    assert (1, (2, 0, 0, 0)) in loaded
+
+
+def test_disabled_prefetcher_schedules_nothing():
+    app = flask.Flask(__name__)
+    prefetcher = TilePrefetcher('test_prefetcher')
+    prefetcher.init_app(app)
+    with app.app_context():
+        assert prefetcher.schedule(1, [(2, 0, 0, 0)], lambda *args: None) == 0
+        assert prefetcher.stats['pending'] == 0
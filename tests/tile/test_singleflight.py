@@ -0,0 +1,50 @@
+import time
+import threading
+
+import pytest
+
+from tmserver.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_computation():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = list()
+    results = list()
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'tile'
+
+    def request():
+        results.append(flights.do('key', compute))
+
+    leader = threading.Thread(target=request)
+    leader.start()
+    assert started.wait(5)
+    followers = [threading.Thread(target=request) for _ in range(3)]
+    for t in followers:
+        t.start()
+    while flights._calls['key'].n_waiting < 3:
+        time.sleep(0.001)
+    release.set()
+    for t in [leader] + followers:
+        t.join(5)
+
+    assert calls == [1]
+    assert results == ['tile'] * 4
+    assert len(flights) == 0
+
+
+def test_exceptions_are_raised_and_not_retained():
+    flights = SingleFlight()
+
+    def fail():
+        raise ValueError('boom')
+
+    with pytest.raises(ValueError):
+        flights.do('key', fail)
+    assert flights.do('key', lambda: 1) == 1
@@ -0,0 +1,225 @@
+import time
+
+import flask
+
+from tmserver.extensions.tilecache import (
+    MemoryTileStore, DiskTileStore, LayerVersions, TileOccupancy, TileCache
+)
+
+
+def test_memory_store_evicts_least_recently_used():
+    store = MemoryTileStore(max_size=10)
+    store.set((1, 1, 0, 0, 0, 0), 'aaaa')
+    store.set((1, 1, 0, 0, 0, 1), 'bbbb')
+    assert store.get((1, 1, 0, 0, 0, 0)) == 'aaaa'
+    store.set((1, 1, 0, 0, 0, 2), 'cccc')
+
+    assert store.size == 8
+    assert store.get((1, 1, 0, 0, 0, 1)) is None
+    assert store.get((1, 1, 0, 0, 0, 0)) == 'aaaa'
+    assert store.get((1, 1, 0, 0, 0, 2)) == 'cccc'
+
+
+def test_memory_store_discards_by_prefix():
+    store = MemoryTileStore(max_size=100)
+    store.set((1, 1, 0, 0, 0, 0), 'aaaa')
+    store.set((1, 2, 0, 0, 0, 0), 'bbbb')
+    store.set((1, 1, 0, 'png', 0, 0, 0), 'cc')
+    store.discard((1, 1, 0, 'png'))
+    assert store.size == 8
+    store.discard((1, 1))
+
+    assert len(store) == 1
+    assert store.size == 4
+    assert store.get((1, 2, 0, 0, 0, 0)) == 'bbbb'
+    store.discard((1, 1))
+    assert store.size == 4
+
+
+def test_disk_store_roundtrip_and_budget(tmpdir):
+    store = DiskTileStore(str(tmpdir), max_size=10)
+    store.set((1, 1, 0, 0, 0, 0), b'aaaa')
+    assert store.get((1, 1, 0, 0, 0, 0)) == b'aaaa'
+    assert store.get((1, 1, 0, 0, 0, 1)) is None
+
+    store.set((1, 1, 0, 0, 0, 1), b'bbbb')
+    store.set((1, 1, 0, 0, 0, 2), b'cccc')
+    assert store.size <= 10
+
+    store.discard((1, 1))
+    assert store.size == 0
+    assert store.get((1, 1, 0, 0, 0, 2)) is None
+
+
+def test_disk_store_discard_subtracts_size_of_layer(tmpdir):
+    store = DiskTileStore(str(tmpdir), max_size=100)
+    store.set((1, 1, 0, 0, 0, 0), b'aaaa')
+    store.set((1, 2, 0, 0, 0, 0), b'bbbbbb')
+    store.discard((1, 1))
+    store.discard((1, 3))
+    assert store.size == 6
+    assert store.get((1, 2, 0, 0, 0, 0)) == b'bbbbbb'
+    assert sorted(tmpdir.listdir()) == [tmpdir.join('1')]
+    assert DiskTileStore(str(tmpdir), max_size=100).size == 6
+
+
+def test_layer_versions_are_shared_via_directory(tmpdir):
+    versions = LayerVersions(str(tmpdir), refresh_interval=0)
+    other = LayerVersions(str(tmpdir), refresh_interval=0)
+    version = versions.get(1, 2)[0]
+    assert other.get(1, 2)[0] == version
+
+    bumped = versions.bump(1, 2)[0]
+    assert bumped > version
+    assert other.get(1, 2)[0] == bumped
+    assert other.get_layer_ids(1) == [2]
+
+
+def test_layer_versions_in_memory():
+    versions = LayerVersions()
+    version = versions.get(1, 2)[0]
+    bumped = versions.bump(1, 2)[0]
+    assert bumped > version
+    assert versions.get(1, 2)[0] == bumped
+    assert versions.get_layer_ids(1) == [2]
+
+
+def test_lost_layer_versions_are_not_reused(tmpdir):
+    versions = LayerVersions(str(tmpdir.join('versions')), refresh_interval=0)
+    served = versions.bump(1, 2)[0]
+    tmpdir.join('versions').remove()
+    time.sleep(0.01)
+    assert versions.get(1, 2)[0] > served
+    tmpdir.join('versions').remove()
+    time.sleep(0.01)
+    assert versions.bump(1, 2)[0] > served
+    time.sleep(0.01)
+    assert LayerVersions().get(1, 2)[0] > served
+
+
+def test_tile_occupancy():
+    occupancy = TileOccupancy([(0, 0, 0), (3, 2, 9), (3, 0, 1)])
+    assert (0, 0, 0) in occupancy
+    assert (3, 2, 9) in occupancy
+    assert (3, 0, 1) in occupancy
+    assert (3, 2, 8) not in occupancy
+    assert (3, 0, 100) not in occupancy
+    assert (3, -1, 1) not in occupancy
+    assert (1, 0, 0) not in occupancy
+    assert (0, 0, 0) not in TileOccupancy([])
+
+
+def test_tile_cache_keeps_formats_apart():
+    app = flask.Flask(__name__)
+    cache = TileCache('test_tile_cache')
+    cache.init_app(app, memory_size=100)
+    with app.app_context():
+        version, _ = cache.get_version(1, 2)
+        cache.set(1, 2, version, 0, 0, 0, 'jpeg')
+        cache.set(1, 2, version, 0, 0, 0, 'webp', fmt='webp')
+        assert cache.get(1, 2, version, 0, 0, 0) == 'jpeg'
+        assert cache.get(1, 2, version, 0, 0, 0, fmt='webp') == 'webp'
+
+        cache.invalidate(1, 2)
+        version, _ = cache.get_version(1, 2)
+        assert cache.get(1, 2, version, 0, 0, 0) is None
+        assert cache.get(1, 2, version, 0, 0, 0, fmt='webp') is None
+
+
+def test_tile_read_during_invalidation_is_not_served():
+    app = flask.Flask(__name__)
+    cache = TileCache('test_tile_cache')
+    cache.init_app(app, memory_size=100)
+    with app.app_context():
+        version, _ = cache.get_version(1, 2)
+        # The layer changes after the tile was read, but before it got
+        # stored.
+        cache.invalidate(1, 2)
+        cache.set(1, 2, version, 0, 0, 0, 'old')
+        current_version, _ = cache.get_version(1, 2)
+        assert current_version != version
+        assert cache.get(1, 2, current_version, 0, 0, 0) is None
+
+
+def test_tile_cache_stats():
+    app = flask.Flask(__name__)
+    cache = TileCache('test_tile_cache')
+    cache.init_app(app)
+    with app.app_context():
+        assert not cache.enabled
+        assert cache.stats['hit_rate'] == 0.0
+
+    cache.init_app(app, memory_size=100)
+    with app.app_context():
+        assert cache.enabled
+        cache.set(1, 2, 0, 0, 0, 0, 'geojson', fmt='geojson')
+        assert cache.get(1, 2, 0, 0, 0, 0, fmt='geojson') == 'geojson'
+        assert cache.get(1, 2, 0, 0, 0, 1, fmt='geojson') is None
+        stats = cache.stats
+    assert stats['memory_hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['hit_rate'] == 0.5
+
+
+def test_tile_cache_invalidates_layers_when_marker_changes(tmpdir):
+    markers = {1: '0'}
+    app = flask.Flask(__name__)
+    cache = TileCache('test_tile_cache')
+    cache.init_app(
+        app, memory_size=100, directory=str(tmpdir),
+        marker_loader=markers.get, marker_check_interval=0
+    )
+    with app.app_context():
+        version, _ = cache.get_version(1, 2)
+        cache.set(1, 2, version, 0, 0, 0, 'old')
+        assert cache.get_version(1, 2)[0] == version
+        assert cache.get(1, 2, version, 0, 0, 0) == 'old'
+
+        # A workflow step terminated.
+        markers[1] = '1-2018-01-01T00:00:00'
+        current_version, _ = cache.get_version(1, 2)
+        assert current_version != version
+        assert cache.get(1, 2, current_version, 0, 0, 0) is None
+        assert cache.get_version(1, 2)[0] == current_version
+
+
+def test_tile_cache_markers_survive_restarts(tmpdir):
+    markers = {1: '0'}
+    app = flask.Flask(__name__)
+    cache = TileCache('test_tile_cache')
+    cache.init_app(
+        app, directory=str(tmpdir), marker_loader=markers.get,
+        marker_check_interval=0
+    )
+    with app.app_context():
+        version, _ = cache.get_version(1, 2)
+
+    # The workflow terminates while the server is down.
+    markers[1] = '1-2018-01-01T00:00:00'
+    cache.init_app(
+        app, directory=str(tmpdir), marker_loader=markers.get,
+        marker_check_interval=0
+    )
+    with app.app_context():
+        assert cache.get_version(1, 2)[0] != version
+
+
+def test_tile_occupancy_is_loaded_once_per_version():
+    loads = list()
+
+    def load(experiment_id, layer_id):
+        loads.append((experiment_id, layer_id))
+        return [(0, 0, 0)]
+
+    app = flask.Flask(__name__)
+    cache = TileCache('test_tile_cache')
+    cache.init_app(app)
+    with app.app_context():
+        cache.get_occupancy(1, 2, load)
+        occupancy = cache.get_occupancy(1, 2, load)
+        assert (0, 0, 0) in occupancy
+        assert len(loads) == 1
+
+        cache.invalidate(1, 2)
+        cache.get_occupancy(1, 2, load)
+        assert len(loads) == 2
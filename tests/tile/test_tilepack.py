@@ -0,0 +1,70 @@
+import os
+import stat
+import pytest
+
+from tmserver.tilepack import TilePack, TilePackStore, write_tile_pack
+
+
+def test_write_and_read_tile_pack(tmpdir):
+    path = str(tmpdir.join('layer.tilepack'))
+    tiles = [(3, 1, 2, 'abc'), (0, 0, 0, 'd'), (3, 0, 5, 'efgh')]
+    n = write_tile_pack(path, iter(tiles), layer_version=4)
+    assert n == 3
+
+    pack = TilePack(path)
+    assert len(pack) == 3
+    assert pack.layer_version == 4
+    for z, y, x, data in tiles:
+        assert pack.get(z, y, x) == data
+    assert pack.get(3, 1, 3) is None
+    assert pack.get(4, 0, 0) is None
+    assert pack.get(-1, 0, 0) is None
+
+
+def test_empty_tile_pack(tmpdir):
+    path = str(tmpdir.join('layer.tilepack'))
+    write_tile_pack(path, [])
+    assert TilePack(path).get(0, 0, 0) is None
+
+
+def test_tile_pack_store_reopens_rebuilt_pack(tmpdir):
+    store = TilePackStore(str(tmpdir))
+    assert store.open(1, 2) is None
+
+    store.build(1, 2, [(0, 0, 0, 'a')])
+    assert store.open(1, 2).get(0, 0, 0) == 'a'
+
+    old_pack = store.open(1, 2)
+    store.build(1, 2, [(0, 0, 0, 'bb')])
+    assert store.open(1, 2).get(0, 0, 0) == 'bb'
+    assert old_pack.closed
+
+    store.remove(1)
+    assert store.open(1, 2) is None
+
+
+def test_tile_pack_store_closes_least_recently_used_packs(tmpdir):
+    store = TilePackStore(str(tmpdir), max_open=2)
+    for layer_id in (1, 2, 3):
+        store.build(1, layer_id, [(0, 0, 0, str(layer_id))])
+    pack1 = store.open(1, 1)
+    pack2 = store.open(1, 2)
+    assert store.open(1, 1) is pack1
+    pack3 = store.open(1, 3)
+    assert pack2.closed
+    assert not pack1.closed and not pack3.closed
+    with pytest.raises(ValueError):
+        pack2.get(0, 0, 0)
+    assert store.open(1, 2).get(0, 0, 0) == '2'
+    assert pack1.closed
+
+    store.close()
+    assert pack3.closed
+
+
+def test_tile_pack_is_readable_by_other_users(tmpdir):
+    path = str(tmpdir.join('layer.tilepack'))
+    write_tile_pack(path, [(0, 0, 0, 'a')])
+    umask = os.umask(0)
+    os.umask(umask)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o666 & ~umask
@@ -0,0 +1,87 @@
+import json
+import struct
+
+import numpy as np
+import pytest
+
+from tmserver.vectortile import encode_vector_tile, decode_vector_tile
+
+
+def test_vector_tile_roundtrip():
+    square = [[10, -10], [20.4, -10], [20.4, -19.6], [10, -20], [10, -10]]
+    hole = [[12, -12], [14, -12], [14, -14], [12, -12]]
+    outlines = [
+        (5, json.dumps({'type': 'Polygon', 'coordinates': [square, hole]})),
+        (2 ** 40, json.dumps({'type': 'Point', 'coordinates': [3.6, -7.2]})),
+    ]
+    features = decode_vector_tile(encode_vector_tile(outlines))
+
+    assert [f[0] for f in features] == [5, 2 ** 40]
+    rings = features[0][1]
+    assert len(rings) == 2
+    np.testing.assert_array_equal(rings[0], np.round(square))
+    np.testing.assert_array_equal(rings[1], hole)
+    np.testing.assert_array_equal(features[1][1][0], [[4, -7]])
+
+
+def test_empty_vector_tile():
+    assert decode_vector_tile(encode_vector_tile([])) == []
+
+
+def test_decode_rejects_other_data():
+    with pytest.raises(ValueError):
+        decode_vector_tile('{"type": "FeatureCollection"}')
+
+
+def _wkb_polygon(rings, byte_order='<'):
+    flag = '\x01' if byte_order == '<' else '\x00'
+    data = flag + struct.pack(byte_order + 'II', 3, len(rings))
+    for ring in rings:
+        data += struct.pack(byte_order + 'I', len(ring))
+        data += np.array(ring, dtype=byte_order + 'f8').tostring()
+    return data
+
+
+def test_vector_tile_from_wkb():
+    square = [[10, -10], [20.4, -10], [20.4, -19.6], [10, -20], [10, -10]]
+    hole = [[12, -12], [14, -12], [14, -14], [12, -12]]
+    multipolygon = (
+        '\x01' + struct.pack('<II', 6, 2) + _wkb_polygon([hole]) +
+        _wkb_polygon([square], '>')
+    )
+    point = '\x00' + struct.pack('>I', 1) + struct.pack('>dd', 3.6, -7.2)
+    outlines = [
+        (1, buffer(_wkb_polygon([square, hole], '>'))),
+        (2, multipolygon),
+        (3, point),
+    ]
+    features = decode_vector_tile(encode_vector_tile(outlines))
+
+    assert [f[0] for f in features] == [1, 2, 3]
+    np.testing.assert_array_equal(features[0][1][0], np.round(square))
+    np.testing.assert_array_equal(features[0][1][1], hole)
+    np.testing.assert_array_equal(features[1][1][0], hole)
+    np.testing.assert_array_equal(features[1][1][1], np.round(square))
+    np.testing.assert_array_equal(features[2][1][0], [[4, -7]])
+
+
+def test_vector_tile_omits_empty_rings():
+    square = [[10, -10], [20, -10], [20, -20], [10, -20], [10, -10]]
+    outlines = [
+        (1, _wkb_polygon([square, []])),
+        (2, _wkb_polygon([[], square])),
+        (3, _wkb_polygon([[]])),
+    ]
+    features = decode_vector_tile(encode_vector_tile(outlines))
+
+    assert [f[0] for f in features] == [1, 2, 3]
+    assert [len(f[1]) for f in features] == [1, 1, 0]
+    np.testing.assert_array_equal(features[0][1][0], square)
+    np.testing.assert_array_equal(features[1][1][0], square)
+
+
+def test_encode_rejects_invalid_wkb():
+    with pytest.raises(ValueError):
+        encode_vector_tile([(1, '\x01' + struct.pack('<II', 3, 1))])
+    with pytest.raises(ValueError):
+        encode_vector_tile([(1, '\x01' + struct.pack('<I', 7))])
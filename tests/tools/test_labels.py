@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from tmserver.labels import (
+    LabelArray, LabelArrayCache, encode_label_array, decode_label_array
+)
+
+
+def test_dense_lookup_marks_missing_mapobjects():
+    labels = LabelArray([10, 11, 13], ['1', '2', '0.5'])
+    assert labels.is_dense
+    codes = labels.lookup([13, 10, 12, 9, 14])
+    np.testing.assert_array_equal(codes, [2, 0, -1, -1, -1])
+    assert labels.format([10, 13, 12]) == ['1', '0.5', None]
+
+
+def test_sparse_ids_are_looked_up_by_search():
+    labels = LabelArray([1000000, 5, 70], ['3', '1', '2'])
+    assert not labels.is_dense
+    assert labels.format([5, 70, 1000000, 6, 2000000]) == \
+        ['1', '2', '3', None, None]
+
+
+def test_labels_are_kept_as_stored():
+    stored = ['1.0', 'true', 'cell cycle: G1', 'inf', '1.0', u'\xb5m']
+    labels = LabelArray(range(1, 7), stored)
+    assert labels.format(range(1, 7)) == stored
+    assert len(labels.categories) == 5
+
+
+def test_empty_labels():
+    labels = LabelArray([], [])
+    assert labels.format([1, 2]) == [None, None]
+
+
+def test_cache_evicts_least_recently_used_labels():
+    cache = LabelArrayCache(2)
+    for key in ('a', 'b'):
+        cache.set(key, LabelArray([1], ['1']))
+    cache.get('a')
+    cache.set('c', LabelArray([1], ['1']))
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert len(cache) == 2
+    assert cache.stats['misses'] == 1
+
+
+def test_cache_discards_labels():
+    cache = LabelArrayCache(2)
+    cache.set((1, 2), LabelArray([1], ['1']))
+    cache.discard((1, 2))
+    cache.discard((1, 3))
+    assert cache.get((1, 2)) is None
+    assert len(cache) == 0
+
+
+@pytest.mark.parametrize('ids', [[3, 4, 6], [7, 1000000, 2]])
+def test_label_array_round_trip(ids):
+    labels = LabelArray(ids, ['1.0', u'\xb5m', '1.0'])
+    data = encode_label_array(labels)
+    assert len(data) % 8 == 0
+    decoded = decode_label_array(data)
+    assert decoded.is_dense == labels.is_dense
+    assert decoded.format(ids + [5]) == ['1.0', u'\xb5m', '1.0', None]
+
+
+def test_decode_rejects_unknown_data():
+    with pytest.raises(ValueError):
+        decode_label_array('TMVT' + '\0' * 20)
@@ -0,0 +1,77 @@
+import uuid
+
+import pytest
+import tmlib.models as tm
+
+from tmserver.model import encode_pk
+
+
+@pytest.fixture(scope='function')
+def tool_result_id(testexp):
+    """ID of a new tool result without labels of the test experiment."""
+    with tm.utils.ExperimentSession(testexp.id) as session:
+        mapobject_type = session.get_or_create(
+            tm.MapobjectType, name=str(uuid.uuid4()),
+            experiment_id=testexp.id, ref_type=tm.Site.__name__
+        )
+        result = tm.ToolResult(
+            submission_id=0, tool_name='Classification',
+            mapobject_type_id=mapobject_type.id, type='ScalarToolResult',
+            name=str(uuid.uuid4())
+        )
+        session.add(result)
+        session.flush()
+        return result.id
+
+
+def _get_labels(rr, testexp, tool_result_id):
+    return rr.browser.get(
+        '/api/experiments/%s/tools/results/%s/labels' % (
+            testexp.hash, encode_pk(tool_result_id)
+        )
+    )
+
+
+def test_labels_of_deleted_tool_result_are_not_served(rr, testexp,
+        tool_result_id):
+    assert _get_labels(rr, testexp, tool_result_id).status_code == 200
+    response = rr.browser.delete(
+        '/api/experiments/%s/tools/results/%s' % (
+            testexp.hash, encode_pk(tool_result_id)
+        )
+    )
+    assert response.status_code == 200
+    assert _get_labels(rr, testexp, tool_result_id).status_code == 404
+
+
+def test_labels_of_missing_tool_result_are_not_cached(rr, testexp,
+        tool_result_id):
+    missing_id = tool_result_id + 1000
+    assert _get_labels(rr, testexp, missing_id).status_code == 404
+    assert _get_labels(rr, testexp, missing_id).status_code == 404
+
+
+def test_entity_tag_of_deleted_tool_result_is_not_revalidated(rr, testexp,
+        tool_result_id):
+    response = _get_labels(rr, testexp, tool_result_id)
+    etag = response.headers['ETag']
+    assert etag != '"tool-result-labels-%d"' % tool_result_id
+    response = rr.browser.get(
+        '/api/experiments/%s/tools/results/%s/labels' % (
+            testexp.hash, encode_pk(tool_result_id)
+        ),
+        headers=[('If-None-Match', etag)]
+    )
+    assert response.status_code == 304
+    rr.browser.delete(
+        '/api/experiments/%s/tools/results/%s' % (
+            testexp.hash, encode_pk(tool_result_id)
+        )
+    )
+    response = rr.browser.get(
+        '/api/experiments/%s/tools/results/%s/labels' % (
+            testexp.hash, encode_pk(tool_result_id)
+        ),
+        headers=[('If-None-Match', etag)]
+    )
+    assert response.status_code == 404
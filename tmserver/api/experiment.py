@@ -37,7 +37,9 @@ from tmserver.util import (
     assert_query_params, assert_form_params
 )
 from tmserver.model import encode_pk
-from tmserver.extensions import gc3pie
+from tmserver.extensions import (
+    gc3pie, channel_tile_cache, segmentation_tile_cache
+)
 from tmserver.api import api
 from tmserver.error import *
 
@@ -439,6 +441,8 @@ def delete_experiment(experiment_id):
         session.query(tm.ExperimentReference)\
             .filter_by(id=experiment_id)\
             .delete()
+    channel_tile_cache.invalidate(experiment_id)
+    segmentation_tile_cache.invalidate(experiment_id)
 
     # FIXME: should delete schema `Experiment_XXX` as well!
     return jsonify(message=('OK: deleted experiment {}'
@@ -34,6 +34,7 @@ from tmserver.util import (
     decode_query_ids, assert_query_params, assert_form_params,
     is_true, is_false
 )
+from tmserver.compression import compress_response
 from tmserver.error import *
 from tmserver.api.mapobject import (
     _get_matching_sites, _get_matching_plates, _get_matching_wells,
@@ -261,6 +262,7 @@ def add_feature_values(experiment_id, mapobject_type_id):
     '/experiments/<experiment_id>/mapobject_types/<mapobject_type_id>/feature-values',
     methods=['GET']
 )
+@compress_response
 @jwt_required()
 @decode_query_ids('read')
 def get_feature_values(experiment_id, mapobject_type_id):
@@ -446,6 +448,7 @@ def get_feature_values(experiment_id, mapobject_type_id):
     '/experiments/<experiment_id>/mapobject_types/<mapobject_type_id>/metadata',
     methods=['GET']
 )
+@compress_response
 @jwt_required()
 @decode_query_ids('read')
 def get_metadata(experiment_id, mapobject_type_id):
@@ -21,9 +21,11 @@ import logging
 import numpy as np
 import pandas as pd
 import base64
+import functools
 from io import BytesIO
 from flask_jwt import jwt_required
 from flask import jsonify, request, send_file, Response
+from sqlalchemy import text
 from sqlalchemy.orm.exc import NoResultFound
 from werkzeug import secure_filename
 
@@ -31,16 +33,29 @@ import tmlib.models as tm
 from tmlib.image import SegmentationImage
 from tmlib.metadata import SegmentationImageMetadata
 
+from tmserver import cfg
 from tmserver.api import api
+from tmserver.extensions import (
+    segmentation_tile_cache, segmentation_tile_materializer
+)
 from tmserver.util import (
     decode_query_ids, assert_query_params, assert_form_params,
     is_true, is_false
 )
+from tmserver.compression import compress_response
+from tmserver.extraction import ExtractionPool, extract_polygons
+from tmserver.polygonstream import load_polygons
+from tmserver.upload import (
+    get_upload_stream, parse_dtype, read_raw_array, load_array
+)
 from tmserver.error import *
 
 
 logger = logging.getLogger(__name__)
 
+#: worker processes that extract the polygons of uploaded label images
+_extraction_pool = ExtractionPool(cfg.segmentation_extraction_processes)
+
 
 def _get_matching_plates(session, plate_name):
     query = session.query(
@@ -347,6 +362,14 @@ def update_mapobject_type(experiment_id, mapobject_type_id):
         mapobject_type = session.query(tm.MapobjectType).\
             get(mapobject_type_id)
         mapobject_type.name = name
+        segmentation_layers = session.query(tm.SegmentationLayer.id).\
+            filter_by(mapobject_type_id=mapobject_type_id).\
+            all()
+    # The name of the mapobject type is part of segmentation layer tiles.
+    for segmentation_layer in segmentation_layers:
+        segmentation_tile_cache.invalidate(
+            experiment_id, segmentation_layer.id
+        )
     return jsonify(message='ok')
 
 
@@ -382,6 +405,10 @@ def delete_mapobject_type(experiment_id, mapobject_type_id):
         'delete mapobject type %d of experiment %d',
         mapobject_type_id, experiment_id
     )
+    with tm.utils.ExperimentSession(experiment_id) as session:
+        segmentation_layers = session.query(tm.SegmentationLayer.id).\
+            filter_by(mapobject_type_id=mapobject_type_id).\
+            all()
     with tm.utils.ExperimentSession(experiment_id, False) as session:
         session.query(tm.Mapobject).\
             filter_by(mapobject_type_id=mapobject_type_id).\
@@ -389,6 +416,10 @@ def delete_mapobject_type(experiment_id, mapobject_type_id):
         session.query(tm.MapobjectType).\
             filter_by(id=mapobject_type_id).\
             delete()
+    for segmentation_layer in segmentation_layers:
+        segmentation_tile_cache.invalidate(
+            experiment_id, segmentation_layer.id
+        )
     return jsonify(message='ok')
 
 
@@ -447,48 +478,134 @@ def get_features(experiment_id, mapobject_type_id):
         return jsonify(data=features)
 
 
-@api.route(
-    '/experiments/<experiment_id>/mapobject_types/<mapobject_type_id>/segmentations',
-    methods=['POST']
-)
-@jwt_required()
-@assert_form_params(
-    'plate_name', 'well_name', 'well_pos_x', 'well_pos_y', 'zplane', 'tpoint',
-    'npz_file'
-)
-@decode_query_ids('write')
-def add_segmentations(experiment_id, mapobject_type_id):
+def _allocate_mapobject_ids(session, n):
+    """Reserves IDs for new mapobjects from the sequence of the
+    :class:`Mapobject <tmlib.models.mapobject.Mapobject>` table with a single
+    query, such that mapobjects can be inserted together with their
+    segmentations instead of one at a time.
+
+    Parameters
+    ----------
+    session: tmlib.models.utils.ExperimentSession
+        database session
+    n: int
+        number of IDs
+
+    Returns
+    -------
+    List[int]
+        reserved IDs
     """
-    .. http:post:: /api/experiments/(string:experiment_id)/mapobject_types/(string:mapobject_type_id)/segmentations
+    if n == 0:
+        return list()
+    result = session.execute(
+        text(
+            'SELECT nextval(pg_get_serial_sequence(:table, \'id\')) '
+            'FROM generate_series(1, :n)'
+        ),
+        {'table': tm.Mapobject.__table__.name, 'n': n}
+    )
+    return [row[0] for row in result]
 
-        Provide segmentations in form of a labeled 2D pixels array
-        for a given :class:`Site <tmlib.models.site.Site>`.
-        A :class:`Mapobject <tmlib.models.mapobject.Mapobject>` and
-        :class:`MapobjectSegmentation <tmlib.models.mapobject.MapobjectSegmentation>`
-        will be created for each labeled connected pixel component in *image*.
 
-        :reqheader Authorization: JWT token issued by the server
-        :statuscode 200: no error
-        :statuscode 400: malformed request
+def _extract_polygons(array, y_offset, x_offset, metadata):
+    image = SegmentationImage(array, metadata)
+    return list(image.extract_polygons(y_offset, x_offset))
 
-        :query npz_file: npz file containing the segmentation image "segmentation" (required)
-        :query plate_name: name of the plate (required)
-        :query well_name: name of the well (required)
-        :query well_pos_x: x-coordinate of the site within the well (required)
-        :query well_pos_y: y-coordinate of the site within the well (required)
-        :query tpoint: time point (required)
-        :query zplane: z-plane (required)
 
+def _get_label_image_polygons(load_image):
+    """Gets a function for :func:`_add_segmentations`, which extracts the
+    polygons of the labeled connected pixel components of a site's label
+    image.
+
+    Parameters
+    ----------
+    load_image: function
+        function that gets called with the expected height and width of
+        the image and returns the labeled pixels array
+
+    Returns
+    -------
+    function
+
+    Raises
+    ------
+    tmserver.error.MalformedRequestError
+        when the image has wrong dimensions
     """
-    data = request.get_json()
-    plate_name = data.get('plate_name')
-    well_name = data.get('well_name')
-    well_pos_x = int(data.get('well_pos_x'))
-    well_pos_y = int(data.get('well_pos_y'))
-    zplane = int(data.get('zplane'))
-    tpoint = int(data.get('tpoint'))
-    align = is_true(request.args.get('align')) # TODO
+    def get_polygons(image_size, y_offset, x_offset, metadata):
+        # Labels are only copied when they don't have the required type yet.
+        array = load_image(image_size).astype(np.int32, copy=False)
+        if array.shape != image_size:
+            raise MalformedRequestError('Image has wrong dimensions')
+        return extract_polygons(
+            array, functools.partial(_extract_polygons, metadata=metadata),
+            y_offset, x_offset, _extraction_pool
+        )
+    return get_polygons
+
 
+def _get_uploaded_polygons(f):
+    """Gets a function for :func:`_add_segmentations`, which reads labeled
+    polygons in pixel coordinates of a site's image from a stream (see
+    :mod:`tmserver.polygonstream`).
+
+    Parameters
+    ----------
+    f: file-like
+        stream of labeled polygons
+
+    Returns
+    -------
+    function
+
+    Raises
+    ------
+    tmserver.error.MalformedRequestError
+        when the stream is malformed, a polygon is invalid or lies outside
+        of the image or a label isn't unique
+    """
+    def get_polygons(image_size, y_offset, x_offset, metadata):
+        try:
+            return load_polygons(f, image_size, y_offset, x_offset)
+        except ValueError as err:
+            raise MalformedRequestError(str(err))
+    return get_polygons
+
+
+def _add_segmentations(experiment_id, mapobject_type_id, plate_name,
+        well_name, well_pos_y, well_pos_x, zplane, tpoint, align,
+        get_polygons):
+    """Creates a :class:`Mapobject <tmlib.models.mapobject.Mapobject>` and
+    :class:`MapobjectSegmentation <tmlib.models.mapobject.MapobjectSegmentation>`
+    for each labeled polygon of a site.
+
+    Parameters
+    ----------
+    experiment_id: int
+        ID of the experiment
+    mapobject_type_id: int
+        ID of the mapobject type
+    plate_name: str
+        name of the plate
+    well_name: str
+        name of the well
+    well_pos_y: int
+        y-coordinate of the site within the well
+    well_pos_x: int
+        x-coordinate of the site within the well
+    zplane: int
+        z-plane
+    tpoint: int
+        time point
+    align: bool
+        whether the image is aligned between cycles
+    get_polygons: function
+        function that gets called with the height and width of the site's
+        image, its *y* and *x* offset and the
+        :class:`SegmentationImageMetadata <tmlib.metadata.SegmentationImageMetadata>`
+        and returns the label and polygon of each mapobject
+    """
     logger.info(
         'add segmentations for mapobject type %d of experiment %d at '
         'plate "%s", well "%s", well position %d/%d, zplane %d, time point %d',
@@ -496,12 +613,6 @@ def add_segmentations(experiment_id, mapobject_type_id):
         well_pos_x, zplane, tpoint
     )
 
-    npz_file = base64.b64decode(data.get('npz_file'))
-    pixels = np.load(BytesIO(npz_file))["segmentation"]
-    array = np.array(pixels, dtype=np.int32)
-    labels = np.unique(array[array > 0])
-    n_objects = len(labels)
-
     with tm.utils.ExperimentSession(experiment_id) as session:
         segmentation_layer = session.get_or_create(
             tm.SegmentationLayer,
@@ -520,19 +631,19 @@ def add_segmentations(experiment_id, mapobject_type_id):
 
         if align:
             y_offset, x_offset = site.aligned_offset
-            if array.shape != site.aligned_image_size:
-                raise MalformedRequestError('Image has wrong dimensions')
+            image_size = site.aligned_image_size
         else:
             y_offset, x_offset = site.offset
-            if array.shape != site.image_size:
-                raise MalformedRequestError('Image has wrong dimensions')
+            image_size = site.image_size
         site_id = site.id
 
-        metadata = SegmentationImageMetadata(
-            mapobject_type_id, site_id, tpoint, zplane
-        )
-        image = SegmentationImage(array, metadata)
+    metadata = SegmentationImageMetadata(
+        mapobject_type_id, site_id, tpoint, zplane
+    )
+    polygons = get_polygons(tuple(image_size), y_offset, x_offset, metadata)
+    labels = [int(label) for label, _ in polygons]
 
+    with tm.utils.ExperimentSession(experiment_id) as session:
         existing_segmentations_map = dict(
             session.query(
                 tm.MapobjectSegmentation.label,
@@ -540,7 +651,7 @@ def add_segmentations(experiment_id, mapobject_type_id):
             ).\
             join(tm.Mapobject).\
             filter(
-                tm.MapobjectSegmentation.label.in_(labels.tolist()),
+                tm.MapobjectSegmentation.label.in_(labels),
                 tm.Mapobject.mapobject_type_id == mapobject_type_id,
                 tm.MapobjectSegmentation.partition_key == site_id
             ).\
@@ -548,26 +659,277 @@ def add_segmentations(experiment_id, mapobject_type_id):
         )
 
     with tm.utils.ExperimentSession(experiment_id, False) as session:
-        segmentations = list()
-        for label, polygon in image.extract_polygons(y_offset, x_offset):
+        # A parent mapobject with the same label may already exist, because
+        # it got already created for another zplane/tpoint. The segmentation
+        # for the given zplane/tpoint must not yet exist, however. This will
+        # lead to an error upon insertion.
+        new_labels = [
+            label for label, _ in polygons
+            if label not in existing_segmentations_map
+        ]
+        mapobject_ids = dict(existing_segmentations_map)
+        mapobjects = list()
+        for label, mapobject_id in zip(
+                new_labels, _allocate_mapobject_ids(session, len(new_labels))):
             mapobject = tm.Mapobject(site_id, mapobject_type_id)
-            if label in existing_segmentations_map:
-                # A parent mapobject with the same label may already exist,
-                # because it got already created for another zplane/tpoint.
-                # The segmentation for the given zplane/tpoint must not yet
-                # exist, however. This will lead to an error upon insertion.
-                mapobject.id = existing_segmentations_map[label]
-            else:
-                session.add(mapobject)
-                session.flush()
+            mapobject.id = mapobject_id
+            mapobjects.append(mapobject)
+            mapobject_ids[label] = mapobject_id
+        session.bulk_ingest(mapobjects)
+        segmentations = list()
+        for label, polygon in polygons:
             s = tm.MapobjectSegmentation(
-                partition_key=site_id, mapobject_id=mapobject.id,
+                partition_key=site_id, mapobject_id=mapobject_ids[label],
                 geom_polygon=polygon, geom_centroid=polygon.centroid,
                 segmentation_layer_id=segmentation_layer_id, label=label
             )
             segmentations.append(s)
         session.bulk_ingest(segmentations)
 
+    segmentation_tile_cache.invalidate(experiment_id, segmentation_layer_id)
+    segmentation_tile_materializer.schedule(
+        experiment_id, segmentation_layer_id
+    )
+
+
+@api.route(
+    '/experiments/<experiment_id>/mapobject_types/<mapobject_type_id>/segmentations',
+    methods=['POST']
+)
+@jwt_required()
+@assert_form_params(
+    'plate_name', 'well_name', 'well_pos_x', 'well_pos_y', 'zplane', 'tpoint',
+    'npz_file'
+)
+@decode_query_ids('write')
+def add_segmentations(experiment_id, mapobject_type_id):
+    """
+    .. http:post:: /api/experiments/(string:experiment_id)/mapobject_types/(string:mapobject_type_id)/segmentations
+
+        Provide segmentations in form of a labeled 2D pixels array
+        for a given :class:`Site <tmlib.models.site.Site>`.
+        A :class:`Mapobject <tmlib.models.mapobject.Mapobject>` and
+        :class:`MapobjectSegmentation <tmlib.models.mapobject.MapobjectSegmentation>`
+        will be created for each labeled connected pixel component in *image*.
+
+        :reqheader Authorization: JWT token issued by the server
+        :statuscode 200: no error
+        :statuscode 400: malformed request
+
+        :query npz_file: npz file containing the segmentation image "segmentation" (required)
+        :query plate_name: name of the plate (required)
+        :query well_name: name of the well (required)
+        :query well_pos_x: x-coordinate of the site within the well (required)
+        :query well_pos_y: y-coordinate of the site within the well (required)
+        :query tpoint: time point (required)
+        :query zplane: z-plane (required)
+
+    """
+    data = request.get_json()
+    plate_name = data.get('plate_name')
+    well_name = data.get('well_name')
+    well_pos_x = int(data.get('well_pos_x'))
+    well_pos_y = int(data.get('well_pos_y'))
+    zplane = int(data.get('zplane'))
+    tpoint = int(data.get('tpoint'))
+    align = is_true(request.args.get('align')) # TODO
+
+    def load_image(shape):
+        # The decoded JSON object and the body are cached by the request, so
+        # the image is held in memory several times over. Large images
+        # should be sent to the "upload" endpoint instead.
+        npz_file = base64.b64decode(data.get('npz_file'))
+        return np.load(BytesIO(npz_file))["segmentation"]
+
+    _add_segmentations(
+        experiment_id, mapobject_type_id, plate_name, well_name, well_pos_y,
+        well_pos_x, zplane, tpoint, align,
+        _get_label_image_polygons(load_image)
+    )
+
+    return jsonify(message='ok')
+
+
+def _get_upload_site_params():
+    """Gets the parameters of the site, to which segmentations are uploaded,
+    from the query string or the fields of a multipart request.
+
+    Returns
+    -------
+    Tuple[str, str, int, int, int, int, bool]
+        name of the plate, name of the well, y-coordinate and x-coordinate
+        of the site within the well, z-plane, time point and whether the
+        image is aligned between cycles
+
+    Raises
+    ------
+    tmserver.error.MissingPOSTParameterError
+        when a required parameter is missing
+    tmserver.error.MalformedRequestError
+        when a parameter has the wrong type
+    """
+    params = request.values
+    missing = [
+        p for p in (
+            'plate_name', 'well_name', 'well_pos_x', 'well_pos_y', 'zplane',
+            'tpoint'
+        )
+        if p not in params
+    ]
+    if missing:
+        raise MissingPOSTParameterError(*missing)
+    try:
+        well_pos_x = int(params.get('well_pos_x'))
+        well_pos_y = int(params.get('well_pos_y'))
+        zplane = int(params.get('zplane'))
+        tpoint = int(params.get('tpoint'))
+    except ValueError:
+        raise MalformedRequestError(
+            'Site position, z-plane and time point must be integers.'
+        )
+    return (
+        params.get('plate_name'), params.get('well_name'), well_pos_y,
+        well_pos_x, zplane, tpoint, is_true(params.get('align'))
+    )
+
+
+def _get_upload_stream(name):
+    """Gets the uploaded data (see :func:`tmserver.upload.get_upload_stream`).
+    """
+    try:
+        return get_upload_stream(name)
+    except ValueError as err:
+        raise MalformedRequestError(str(err))
+
+
+@api.route(
+    '/experiments/<experiment_id>/mapobject_types/<mapobject_type_id>/segmentations/upload',
+    methods=['POST']
+)
+@jwt_required()
+@decode_query_ids('write')
+def upload_segmentations(experiment_id, mapobject_type_id):
+    """
+    .. http:post:: /api/experiments/(string:experiment_id)/mapobject_types/(string:mapobject_type_id)/segmentations/upload
+
+        Provide segmentations in form of a labeled 2D pixels array for a
+        given :class:`Site <tmlib.models.site.Site>` like
+        :http:post:`/api/experiments/(string:experiment_id)/mapobject_types/(string:mapobject_type_id)/segmentations`,
+        but send the array in binary form rather than base64 encoded within
+        a JSON object, which is read from the request as it arrives.
+
+        The array is either the request body or the "segmentation" part of
+        a ``multipart/form-data`` request. It is either a file in NPY or NPZ
+        format, where an NPZ file must contain the array "segmentation", or
+        a raw typed array in row-major order when the "dtype" parameter is
+        given. The shape of a raw array is the size of the site's image.
+
+        **Example request**:
+
+        .. sourcecode:: http
+
+            POST /api/experiments/dG1hcHM0/mapobject_types/dG1hcHMx/segmentations/upload?plate_name=plate01&well_name=D04&well_pos_x=0&well_pos_y=0&tpoint=0&zplane=0&dtype=%3Ci4 HTTP/1.1
+            Content-Type: application/octet-stream
+
+        :reqheader Authorization: JWT token issued by the server
+        :statuscode 200: no error
+        :statuscode 400: malformed request
+
+        :query plate_name: name of the plate (required)
+        :query well_name: name of the well (required)
+        :query well_pos_x: x-coordinate of the site within the well (required)
+        :query well_pos_y: y-coordinate of the site within the well (required)
+        :query tpoint: time point (required)
+        :query zplane: z-plane (required)
+        :query dtype: integer type of a raw array, e.g. ``<i4`` for
+            little-endian 32-bit integers (optional)
+        :query align: whether the image is aligned between cycles (optional)
+
+    """
+    plate_name, well_name, well_pos_y, well_pos_x, zplane, tpoint, align = \
+        _get_upload_site_params()
+    dtype = request.values.get('dtype')
+    if dtype is not None:
+        try:
+            dtype = parse_dtype(dtype)
+        except ValueError as err:
+            raise MalformedRequestError(str(err))
+
+    f = _get_upload_stream('segmentation')
+
+    def load_image(shape):
+        try:
+            if dtype is not None:
+                return read_raw_array(f, shape, dtype)
+            # Parts of multipart requests are already spooled by Werkzeug.
+            return load_array(f, spool=f is request.stream)
+        except ValueError as err:
+            raise MalformedRequestError(str(err))
+
+    _add_segmentations(
+        experiment_id, mapobject_type_id, plate_name, well_name, well_pos_y,
+        well_pos_x, zplane, tpoint, align,
+        _get_label_image_polygons(load_image)
+    )
+
+    return jsonify(message='ok')
+
+
+@api.route(
+    '/experiments/<experiment_id>/mapobject_types/<mapobject_type_id>/segmentations/polygons',
+    methods=['POST']
+)
+@jwt_required()
+@decode_query_ids('write')
+def upload_segmentation_polygons(experiment_id, mapobject_type_id):
+    """
+    .. http:post:: /api/experiments/(string:experiment_id)/mapobject_types/(string:mapobject_type_id)/segmentations/polygons
+
+        Provide segmentations in form of labeled polygons for a given
+        :class:`Site <tmlib.models.site.Site>`, e.g. outlines of objects that
+        were segmented by external tools, which are stored as they are
+        instead of being extracted from a label image.
+
+        The polygons are sent as stream of records (see
+        :mod:`tmserver.polygonstream`), each of which holds the label and
+        the polygon of a mapobject in Well-Known Binary (WKB) format. The
+        stream is either the request body or the "polygons" part of a
+        ``multipart/form-data`` request and is read as it arrives.
+        Coordinates are pixel coordinates of the site's image, which refer
+        to the centres of pixels like the outlines extracted from label
+        images, where the y-axis points downwards. Polygons must be valid,
+        lie within *[0, width - 1]* and *[0, height - 1]* and have unique
+        labels.
+
+        **Example request**:
+
+        .. sourcecode:: http
+
+            POST /api/experiments/dG1hcHM0/mapobject_types/dG1hcHMx/segmentations/polygons?plate_name=plate01&well_name=D04&well_pos_x=0&well_pos_y=0&tpoint=0&zplane=0 HTTP/1.1
+            Content-Type: application/vnd.tissuemaps.polygons
+
+        :reqheader Authorization: JWT token issued by the server
+        :statuscode 200: no error
+        :statuscode 400: malformed request
+
+        :query plate_name: name of the plate (required)
+        :query well_name: name of the well (required)
+        :query well_pos_x: x-coordinate of the site within the well (required)
+        :query well_pos_y: y-coordinate of the site within the well (required)
+        :query tpoint: time point (required)
+        :query zplane: z-plane (required)
+        :query align: whether the image is aligned between cycles (optional)
+
+    """
+    plate_name, well_name, well_pos_y, well_pos_x, zplane, tpoint, align = \
+        _get_upload_site_params()
+    f = _get_upload_stream('polygons')
+
+    _add_segmentations(
+        experiment_id, mapobject_type_id, plate_name, well_name, well_pos_y,
+        well_pos_x, zplane, tpoint, align, _get_uploaded_polygons(f)
+    )
+
     return jsonify(message='ok')
 
 
@@ -575,6 +937,7 @@ def add_segmentations(experiment_id, mapobject_type_id):
     '/experiments/<experiment_id>/mapobject_types/<mapobject_type_id>/segmentations',
     methods=['GET']
 )
+@compress_response
 @jwt_required()
 @assert_query_params(
     'plate_name', 'well_name', 'well_pos_x', 'well_pos_y', 'zplane', 'tpoint'
@@ -672,6 +1035,16 @@ def get_segmentations(experiment_id, mapobject_type_id):
     img = SegmentationImage.create_from_polygons(
         polygons, y_offset, x_offset, (height, width)
     )
-    return jsonify(data=img.array.tolist())
+
+    def generate_rows(array, n_rows=32):
+        # Rows are sent in chunks, which allows compressing them on the fly.
+        yield '{"data":['
+        for i in range(0, array.shape[0], n_rows):
+            rows = array[i:i + n_rows].tolist()
+            chunk = ','.join(json.dumps(row) for row in rows)
+            yield chunk if i == 0 else ',' + chunk
+        yield ']}'
+
+    return Response(generate_rows(img.array), mimetype='application/json')
 
 
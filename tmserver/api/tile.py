@@ -16,23 +16,366 @@
 """API view functions for querying :mod:`tile <tmlib.models.tile>` resources.
 """
 import json
+import hashlib
 import logging
+import struct
+import cv2
 import numpy as np
-from flask import jsonify, request, send_file
+from flask import (
+    jsonify, request, send_file, Response, stream_with_context
+)
 from flask_jwt import jwt_required
 from cStringIO import StringIO
-from sqlalchemy import case
+from sqlalchemy import case, tuple_, select, and_, bindparam, func
 
 import tmlib.models as tm
 from tmlib.image import PyramidTile
 
 from tmserver.api import api
+from tmserver.tilepack import TilePackStore
+from tmserver.composite import parse_color, blend_channel_tiles
+from tmserver.green import run_cooperatively
+from tmserver.singleflight import SingleFlight
+from tmserver.geojsontile import iter_feature_collection
+from tmserver.labelcache import (
+    get_tool_result_labels as _get_tool_result_labels,
+    get_tool_result_label_stats
+)
+from tmserver.densitygrid import MIMETYPE as DENSITY_GRID_MIMETYPE
+from tmserver.vectortile import (
+    encode_vector_tile, MIMETYPE as VECTOR_TILE_MIMETYPE
+)
+from tmserver.segmentationtile import (
+    get_simplified_segmentations, get_segmentation_layer_density_grid,
+    get_segmentation_layer_outlines, get_empty_segmentation_layer_tile,
+    iter_segmentation_layer_geojson_tile, is_density_zoom_level
+)
+from tmserver.materialize import read_status
+from tmserver.model import decode_pk
+from tmserver.error import MalformedRequestError
+from tmserver.extensions import (
+    channel_tile_cache, segmentation_tile_cache, channel_tile_prefetcher,
+    segmentation_tile_materializer
+)
+from tmserver.extensions.prefetch import get_neighbor_tile_coordinates
 from tmserver.util import (
-    decode_query_ids, decode_form_ids, assert_query_params, assert_form_params
+    decode_query_ids, decode_form_ids, assert_query_params, assert_form_params,
+    get_not_modified_response, set_cache_validators
 )
+from tmserver.compression import compress_response
+from tmserver import cfg
 
 logger = logging.getLogger(__name__)
 
+#: maximal number of tiles that can be requested at once
+MAX_TILE_BATCH_SIZE = 512
+
+#: maximal number of channel layers that can be blended into a composite tile
+MAX_COMPOSITE_CHANNELS = 8
+
+#: JPEG quality of composite tiles
+COMPOSITE_JPEG_QUALITY = 90
+
+#: number of seconds clients may reuse a background tile, which is sent for
+#: positions without a tile, without revalidating it with the server
+BACKGROUND_TILE_MAX_AGE = 60
+
+#: JPEG encoded tile that is sent for positions without a tile
+_background_tile_pixels = None
+
+
+def _get_background_tile_pixels():
+    global _background_tile_pixels
+    if _background_tile_pixels is None:
+        tile = PyramidTile.create_as_background()
+        _background_tile_pixels = tile.jpeg_encode().tostring()
+    return _background_tile_pixels
+
+
+#: re-encoded variants of the background tile
+_background_tile_variants = dict()
+
+
+def _is_background_tile(pixels):
+    return (
+        pixels is _background_tile_pixels or
+        any(pixels is v for v in _background_tile_variants.itervalues())
+    )
+
+
+#: packed channel layer tiles, which take precedence over the database
+if cfg.tile_pack_directory:
+    _channel_layer_tile_packs = TilePackStore(cfg.tile_pack_directory)
+else:
+    _channel_layer_tile_packs = None
+
+#: materialized segmentation layer tiles, which take precedence over the
+#: database
+if cfg.segmentation_tile_pack_directory:
+    _segmentation_layer_tile_packs = TilePackStore(
+        cfg.segmentation_tile_pack_directory
+    )
+else:
+    _segmentation_layer_tile_packs = None
+
+#: coalesces concurrent identical tile requests of a worker process
+_tile_flights = SingleFlight()
+
+#: maximal zoom level index of segmentation layers and the layer version it
+#: belongs to
+_segmentation_layer_maxzoom = dict()
+
+#: metadata of channel layers and the layer version it belongs to
+_channel_layer_metadata = dict()
+
+#: Core query for the pixels of a single tile, which bypasses the ORM
+_select_channel_layer_tile_pixels = select([tm.ChannelLayerTile._pixels]).\
+    where(and_(
+        tm.ChannelLayerTile.channel_layer_id == bindparam('channel_layer_id'),
+        tm.ChannelLayerTile.z == bindparam('z'),
+        tm.ChannelLayerTile.y == bindparam('y'),
+        tm.ChannelLayerTile.x == bindparam('x')
+    ))
+
+
+def _get_channel_layer_metadata(experiment_id, channel_layer_id):
+    """Gets attributes of a channel layer, which are cached until the layer
+    gets invalidated.
+
+    Parameters
+    ----------
+    experiment_id: int
+        ID of the experiment
+    channel_layer_id: int
+        ID of the channel layer
+
+    Returns
+    -------
+    dict
+        "zplane", "tpoint", "min_intensity" and "max_intensity"
+    """
+    version, _ = channel_tile_cache.get_version(
+        experiment_id, channel_layer_id
+    )
+    key = (experiment_id, channel_layer_id)
+    entry = _channel_layer_metadata.get(key)
+    if entry is None or entry[0] != version:
+        with tm.utils.ExperimentSession(experiment_id) as session:
+            channel_layer = session.query(
+                    tm.ChannelLayer.zplane, tm.ChannelLayer.tpoint,
+                    tm.ChannelLayer.min_intensity,
+                    tm.ChannelLayer.max_intensity
+                ).\
+                filter_by(id=channel_layer_id).\
+                one()
+        entry = (version, dict(zip(channel_layer.keys(), channel_layer)))
+        _channel_layer_metadata[key] = entry
+    return entry[1]
+
+
+def _get_channel_layer_tile_pixels(experiment_id, channel_layer_id, z, y, x):
+    """Selects the pixels of a single tile from the database without
+    instantiating any model objects.
+
+    Parameters
+    ----------
+    experiment_id: int
+        ID of the experiment
+    channel_layer_id: int
+        ID of the channel layer
+    z: int
+        zero-based zoom level index
+    y: int
+        zero-based row index
+    x: int
+        zero-based column index
+
+    Returns
+    -------
+    str
+        JPEG encoded pixels or ``None`` if the tile doesn't exist
+    """
+    with tm.utils.ExperimentSession(experiment_id) as session:
+        pixels = session.execute(
+            _select_channel_layer_tile_pixels,
+            {'channel_layer_id': channel_layer_id, 'z': z, 'y': y, 'x': x}
+        ).scalar()
+    if pixels is None:
+        return None
+    return bytes(pixels)
+
+
+def _get_channel_layer_tile_pixels_from_pack(experiment_id, channel_layer_id,
+        version, z, y, x):
+    """Gets the pixels of a tile from the pack of the channel layer.
+
+    Returns
+    -------
+    str
+        JPEG encoded pixels, which are those of the background tile for
+        positions without a tile, or ``None`` if there is no pack for the
+        current version of the channel layer
+    """
+    if _channel_layer_tile_packs is None:
+        return None
+    pack = _channel_layer_tile_packs.open(experiment_id, channel_layer_id)
+    if pack is None:
+        return None
+    if pack.layer_version != version:
+        logger.debug(
+            'ignore outdated tile pack of channel layer %d', channel_layer_id
+        )
+        return None
+    try:
+        pixels = pack.get(z, y, x)
+    except ValueError:
+        # The pack got closed concurrently.
+        return None
+    if pixels is None:
+        return _get_background_tile_pixels()
+    return pixels
+
+
+def _get_channel_layer_tile_coordinates(experiment_id, channel_layer_id):
+    with tm.utils.ExperimentSession(experiment_id) as session:
+        return session.query(
+                tm.ChannelLayerTile.z, tm.ChannelLayerTile.y,
+                tm.ChannelLayerTile.x
+            ).\
+            filter_by(channel_layer_id=channel_layer_id).\
+            all()
+
+
+def _get_channel_layer_tile(experiment_id, channel_layer_id, version, z, y,
+        x):
+    """Gets a single channel layer tile from the pack, the cache or the
+    database, in this order.
+
+    Parameters
+    ----------
+    experiment_id: int
+        ID of the experiment
+    channel_layer_id: int
+        ID of the channel layer
+    version: int
+        version of the channel layer, which was read before the tile
+    z: int
+        zero-based zoom level index
+    y: int
+        zero-based row index
+    x: int
+        zero-based column index
+
+    Returns
+    -------
+    str
+        JPEG encoded pixels, which are those of the background tile for
+        positions without a tile
+    """
+    pixels = _get_channel_layer_tile_pixels_from_pack(
+        experiment_id, channel_layer_id, version, z, y, x
+    )
+    if pixels is not None:
+        return pixels
+    pixels = channel_tile_cache.get(
+        experiment_id, channel_layer_id, version, z, y, x
+    )
+    if pixels is not None:
+        return pixels
+    occupancy = channel_tile_cache.get_occupancy(
+        experiment_id, channel_layer_id, _get_channel_layer_tile_coordinates
+    )
+    if (z, y, x) not in occupancy:
+        logger.debug('tile does not exist - send empty')
+        return _get_background_tile_pixels()
+    if logger.isEnabledFor(logging.DEBUG):
+        metadata = _get_channel_layer_metadata(experiment_id, channel_layer_id)
+        logger.debug(
+            'get channel layer tile: x=%d, y=%d, z=%d, zplane=%d, tpoint=%d',
+            x, y, z, metadata['zplane'], metadata['tpoint']
+        )
+    pixels = _get_channel_layer_tile_pixels(
+        experiment_id, channel_layer_id, z, y, x
+    )
+    if pixels is None:
+        logger.warn('tile does not exist - send empty')
+        return _get_background_tile_pixels()
+    channel_tile_cache.set(
+        experiment_id, channel_layer_id, version, z, y, x, pixels
+    )
+    return pixels
+
+
+def _accepts_webp():
+    """Checks whether the client explicitly accepts WebP images. Wildcards
+    are ignored, since browsers also send them for formats they can't decode.
+    """
+    if cfg.tile_webp_quality == 0:
+        return False
+    return any(
+        mimetype == 'image/webp' and quality > 0
+        for mimetype, quality in request.accept_mimetypes
+    )
+
+
+def _reencode_tile(pixels, fmt):
+    """Re-encodes a JPEG encoded tile.
+
+    Parameters
+    ----------
+    pixels: str
+        JPEG encoded pixels
+    fmt: str
+        format of the variant, i.e. ``"webp"``, which is encoded with the
+        configured quality
+
+    Returns
+    -------
+    str
+        re-encoded pixels
+    """
+    array = cv2.imdecode(
+        np.frombuffer(pixels, dtype=np.uint8), cv2.IMREAD_UNCHANGED
+    )
+    params = [cv2.IMWRITE_WEBP_QUALITY, cfg.tile_webp_quality]
+    success, encoded = cv2.imencode('.%s' % fmt, array, params)
+    if not success:
+        raise ValueError('Tile could not be encoded as %s.' % fmt.upper())
+    return encoded.tostring()
+
+
+def _get_channel_layer_tile_variant(experiment_id, channel_layer_id, version,
+        z, y, x, fmt):
+    """Gets a channel layer tile re-encoded in another format. The variant is
+    generated once from the JPEG encoded tile and cached alongside of it.
+
+    Returns
+    -------
+    str
+        pixels encoded in format `fmt`
+
+    See also
+    --------
+    :func:`tmserver.api.tile._reencode_tile`
+    """
+    pixels = channel_tile_cache.get(
+        experiment_id, channel_layer_id, version, z, y, x, fmt=fmt
+    )
+    if pixels is not None:
+        return pixels
+    jpeg_pixels = _get_channel_layer_tile(
+        experiment_id, channel_layer_id, version, z, y, x
+    )
+    if jpeg_pixels is _get_background_tile_pixels():
+        if fmt not in _background_tile_variants:
+            _background_tile_variants[fmt] = _reencode_tile(jpeg_pixels, fmt)
+        return _background_tile_variants[fmt]
+    pixels = run_cooperatively(_reencode_tile, jpeg_pixels, fmt)
+    channel_tile_cache.set(
+        experiment_id, channel_layer_id, version, z, y, x, pixels, fmt=fmt
+    )
+    return pixels
+
 
 @api.route(
     '/experiments/<experiment_id>/channel_layers/<channel_layer_id>/tiles',
@@ -45,11 +388,26 @@ def get_channel_layer_tile(experiment_id, channel_layer_id):
     .. http:get:: /api/experiments/(string:experiment_id)/channel_layer/(string:channel_layer_id)/tiles
 
         Sends a :class:`ChannelLayerTile <tmlib.models.tile.ChannelLayerTile`.
+        The tile is sent as JPEG, unless the client explicitly accepts WebP,
+        in which case a smaller re-encoded variant is sent. Neighboring tiles
+        and the children of an existing tile get prefetched into the tile
+        cache in the background. Positions without a tile are answered with
+        a background tile, which clients must revalidate after
+        :data:`BACKGROUND_TILE_MAX_AGE <tmserver.api.tile.BACKGROUND_TILE_MAX_AGE>`
+        seconds, since the pyramid may still be built.
 
         :query x: zero-based `x` coordinate
         :query y: zero-based `y` coordinate
         :query z: zero-based zoom level index
 
+        :reqheader Accept: ``image/webp`` to receive a WebP encoded tile
+            (optional)
+        :reqheader If-None-Match: entity tag of a cached tile (optional)
+        :reqheader If-Modified-Since: date of a cached tile (optional)
+        :resheader Vary: ``Accept``
+        :statuscode 200: no error
+        :statuscode 304: cached tile is still valid
+
     """
     x = request.args.get('x', type=int)
     y = request.args.get('y', type=int)
@@ -60,35 +418,585 @@ def get_channel_layer_tile(experiment_id, channel_layer_id):
         channel_layer_id, experiment_id, x, y, z
     )
 
-    with tm.utils.ExperimentSession(experiment_id) as session:
-        channel_layer = session.query(tm.ChannelLayer).get(channel_layer_id)
-        logger.debug(
-            'get channel layer tile: x=%d, y=%d, z=%d, zplane=%d, tpoint=%d',
-            x, y, z, channel_layer.zplane, channel_layer.tpoint
+    fmt = 'webp' if _accepts_webp() else 'jpeg'
+    version, last_modified = channel_tile_cache.get_version(
+        experiment_id, channel_layer_id
+    )
+    etag = 'channel-layer-%d-%d-%s' % (channel_layer_id, version, fmt)
+    response = get_not_modified_response(etag, last_modified, cfg.tile_max_age)
+    if response is not None:
+        response.vary.add('Accept')
+        return response
+
+    # Concurrent requests for the same tile share a single lookup.
+    key = (
+        'channel_layer_tile', experiment_id, channel_layer_id, version, fmt,
+        z, y, x
+    )
+    if fmt == 'webp':
+        pixels = _tile_flights.do(
+            key, _get_channel_layer_tile_variant,
+            experiment_id, channel_layer_id, version, z, y, x, fmt
         )
-        tile = session.query(tm.ChannelLayerTile).\
-            filter_by(channel_layer_id=channel_layer.id, z=z, y=y, x=x).\
-            one_or_none()
-        if tile is not None:
-            # TODO: We shouldn't access the "privat" attribute, but it's more
-            # performant in this case, since it provides direct access to the
-            # column without accessing the property.
-            pixels = tile._pixels
-            # pixels = tile.pixels.jpeg_encode()
+    else:
+        pixels = _tile_flights.do(
+            key, _get_channel_layer_tile,
+            experiment_id, channel_layer_id, version, z, y, x
+        )
+    if _is_background_tile(pixels):
+        # The tile may be missing only because the pyramid is still being
+        # built, so clients must not keep the background tile for long.
+        etag = '%s-empty' % etag
+        max_age = BACKGROUND_TILE_MAX_AGE
+        response = get_not_modified_response(etag, last_modified, max_age)
+        if response is not None:
+            response.vary.add('Accept')
+            return response
+    else:
+        max_age = cfg.tile_max_age
+        # Tiles around a missing tile likely don't exist yet either.
+        channel_tile_prefetcher.schedule(
+            experiment_id,
+            [
+                (channel_layer_id, ) + c
+                for c in get_neighbor_tile_coordinates(z, y, x)
+            ],
+            _get_channel_layer_tiles
+        )
+    f = StringIO()
+    f.write(pixels)
+    f.seek(0)
+    response = send_file(f, mimetype='image/%s' % fmt, cache_timeout=max_age)
+    response.vary.add('Accept')
+    return set_cache_validators(response, etag, last_modified, max_age)
+
+
+def _get_channel_layer_tiles(experiment_id, coordinates):
+    """Gets several channel layer tiles using the cache and at most one
+    database query.
+
+    Parameters
+    ----------
+    experiment_id: int
+        ID of the experiment
+    coordinates: List[Tuple[int]]
+        channel layer ID and *z*, *y*, *x* coordinates of each tile
+
+    Returns
+    -------
+    Dict[Tuple[int], str]
+        JPEG encoded pixels of each tile
+    """
+    # Versions are read before any tile, such that tiles of layers that get
+    # invalidated in the meantime are cached under the outdated version.
+    versions = {
+        c[0]: channel_tile_cache.get_version(experiment_id, c[0])[0]
+        for c in coordinates
+    }
+    tiles = dict()
+    missing = list()
+    for c in set(coordinates):
+        version = versions[c[0]]
+        pixels = _get_channel_layer_tile_pixels_from_pack(
+            experiment_id, c[0], version, *c[1:]
+        )
+        if pixels is None:
+            pixels = channel_tile_cache.get(
+                experiment_id, c[0], version, *c[1:]
+            )
+        if pixels is not None:
+            tiles[c] = pixels
+            continue
+        occupancy = channel_tile_cache.get_occupancy(
+            experiment_id, c[0], _get_channel_layer_tile_coordinates
+        )
+        if c[1:] in occupancy:
+            missing.append(c)
         else:
-            logger.warn('tile does not exist - create empty')
-            tile = PyramidTile.create_as_background()
-            pixels = tile.jpeg_encode()
-        f = StringIO()
-        f.write(pixels)
-        f.seek(0)
-        return send_file(f, mimetype='image/jpeg')
+            tiles[c] = _get_background_tile_pixels()
+    if missing:
+        logger.debug('get %d channel layer tiles from database', len(missing))
+        query = select([
+                tm.ChannelLayerTile.channel_layer_id,
+                tm.ChannelLayerTile.z, tm.ChannelLayerTile.y,
+                tm.ChannelLayerTile.x, tm.ChannelLayerTile._pixels
+            ]).\
+            where(
+                tuple_(
+                    tm.ChannelLayerTile.channel_layer_id,
+                    tm.ChannelLayerTile.z, tm.ChannelLayerTile.y,
+                    tm.ChannelLayerTile.x
+                ).in_(missing)
+            )
+        with tm.utils.ExperimentSession(experiment_id) as session:
+            results = session.execute(query).fetchall()
+        for channel_layer_id, z, y, x, pixels in results:
+            pixels = bytes(pixels)
+            channel_tile_cache.set(
+                experiment_id, channel_layer_id, versions[channel_layer_id],
+                z, y, x, pixels
+            )
+            tiles[(channel_layer_id, z, y, x)] = pixels
+        for c in missing:
+            if c not in tiles:
+                logger.warn('tile does not exist - send empty')
+                tiles[c] = _get_background_tile_pixels()
+    return tiles
+
+
+def _pack_tiles(tiles):
+    """Packs tiles into a binary stream that starts with the number of tiles
+    followed by the size of each tile in bytes as unsigned 32-bit big-endian
+    integers and then the concatenated tiles.
+    """
+    sizes = [len(t) for t in tiles]
+    header = struct.pack('>%dI' % (len(tiles) + 1), len(tiles), *sizes)
+    return ''.join([header] + tiles)
+
+
+@api.route(
+    '/experiments/<experiment_id>/channel_layers/tiles',
+    methods=['POST']
+)
+@assert_form_params('tiles')
+@decode_query_ids(None)
+def get_channel_layer_tiles(experiment_id):
+    """
+    .. http:post:: /api/experiments/(string:experiment_id)/channel_layers/tiles
+
+        Sends several
+        :class:`ChannelLayerTiles <tmlib.models.tile.ChannelLayerTile>`,
+        possibly of different channel layers, at once.
+
+        **Example request**:
+
+        .. sourcecode:: http
+
+            Content-Type: application/json
+
+            {
+                "tiles": [
+                    {"channel_layer_id": "1", "z": 5, "y": 2, "x": 3},
+                    {"channel_layer_id": "2", "z": 5, "y": 2, "x": 3},
+                    ...
+                ]
+            }
+
+        **Example response**:
+
+        .. sourcecode:: http
+
+            HTTP/1.1 200 OK
+            Content-Type: application/octet-stream
+
+        The response body starts with the number of tiles *n* followed by
+        the size of each tile in bytes, each encoded as unsigned 32-bit
+        big-endian integer. The *n* JPEG encoded tiles follow in the order
+        in which they were requested.
+
+        :statuscode 200: no error
+        :statuscode 400: malformed request
+
+    """
+    data = request.get_json()
+    requested_tiles = data.get('tiles')
+    if not isinstance(requested_tiles, list):
+        raise MalformedRequestError('Parameter "tiles" must be an array.')
+    if len(requested_tiles) > MAX_TILE_BATCH_SIZE:
+        raise MalformedRequestError(
+            'At most %d tiles can be requested at once.' % MAX_TILE_BATCH_SIZE
+        )
+    try:
+        coordinates = [
+            (
+                decode_pk(t['channel_layer_id']),
+                int(t['z']), int(t['y']), int(t['x'])
+            )
+            for t in requested_tiles
+        ]
+    except (KeyError, TypeError, ValueError):
+        raise MalformedRequestError(
+            'Each tile must be described by "channel_layer_id", "z", "y" '
+            'and "x".'
+        )
+    logger.debug(
+        'get %d tiles of channel layers of experiment %d',
+        len(coordinates), experiment_id
+    )
+    tiles = _get_channel_layer_tiles(experiment_id, coordinates)
+    return Response(
+        _pack_tiles([tiles[c] for c in coordinates]),
+        mimetype='application/octet-stream'
+    )
+
+
+def _parse_composite_channels(values):
+    """Parses the description of the channels of a composite tile.
+
+    Parameters
+    ----------
+    values: List[str]
+        descriptions of the form
+        ``"<channel_layer_id>:<rrggbb>:<lower>:<upper>"``
+
+    Returns
+    -------
+    List[Tuple[int, Tuple[int, int, int], Tuple[int, int]]]
+        ID, color and intensity window of each channel layer
+
+    Raises
+    ------
+    MalformedRequestError
+        when a description is malformed or too many channels are given
+    """
+    if len(values) > MAX_COMPOSITE_CHANNELS:
+        raise MalformedRequestError(
+            'At most %d channels can be blended into a composite tile.' %
+            MAX_COMPOSITE_CHANNELS
+        )
+    channels = list()
+    for value in values:
+        try:
+            channel_layer_id, color, lower, upper = value.split(':')
+            channels.append((
+                decode_pk(channel_layer_id), parse_color(color),
+                (int(lower), int(upper))
+            ))
+        except ValueError:
+            raise MalformedRequestError(
+                'Parameter "channel" must have the form '
+                '"<channel_layer_id>:<rrggbb>:<lower>:<upper>".'
+            )
+    return channels
+
+
+def _encode_rgb_tile(rgb, fmt):
+    """Encodes a RGB tile as JPEG or WebP."""
+    if fmt == 'webp':
+        ext = '.webp'
+        params = [cv2.IMWRITE_WEBP_QUALITY, cfg.tile_webp_quality]
+    else:
+        ext = '.jpg'
+        params = [cv2.IMWRITE_JPEG_QUALITY, COMPOSITE_JPEG_QUALITY]
+    # OpenCV expects the color components in BGR order.
+    success, encoded = cv2.imencode(ext, rgb[:, :, ::-1], params)
+    if not success:
+        raise ValueError('Composite tile could not be encoded.')
+    return encoded.tostring()
+
+
+def _compose_tile(tiles, channels, fmt):
+    """Decodes JPEG encoded tiles, blends them and encodes the composite.
+
+    Parameters
+    ----------
+    tiles: List[str]
+        JPEG encoded pixels of each channel layer tile
+    channels: List[Tuple[int, Tuple[int, int, int], Tuple[int, int]]]
+        ID, color and intensity window of each channel layer
+    fmt: str
+        format of the composite tile, i.e. ``"jpeg"`` or ``"webp"``
+
+    Returns
+    -------
+    str
+        encoded composite tile
+    """
+    arrays = [
+        cv2.imdecode(np.frombuffer(t, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        for t in tiles
+    ]
+    rgb = blend_channel_tiles(
+        arrays, [color for _, color, _ in channels],
+        [window for _, _, window in channels]
+    )
+    return _encode_rgb_tile(rgb, fmt)
+
+
+@api.route(
+    '/experiments/<experiment_id>/channel_layers/composite_tiles',
+    methods=['GET']
+)
+@assert_query_params('x', 'y', 'z', 'channel')
+@decode_query_ids(None)
+def get_channel_layer_composite_tile(experiment_id):
+    """
+    .. http:get:: /api/experiments/(string:experiment_id)/channel_layers/composite_tiles
+
+        Sends a colored composite of the
+        :class:`ChannelLayerTiles <tmlib.models.tile.ChannelLayerTile>` of
+        several channel layers at the same position. The intensities of each
+        tile are rescaled to the given window, colored and then added up.
+        The composite is sent as JPEG, unless the client explicitly accepts
+        WebP.
+
+        **Example request**:
+
+        .. sourcecode:: http
+
+            GET /api/experiments/1/channel_layers/composite_tiles?x=3&y=2&z=5&channel=1:ff0000:0:255&channel=2:00ff00:10:200 HTTP/1.1
+            Accept: image/webp,image/*
+
+        :query x: zero-based `x` coordinate
+        :query y: zero-based `y` coordinate
+        :query z: zero-based zoom level index
+        :query channel: ID, hexadecimal RGB color and lower and upper bound
+            of the intensity window of a channel layer in the form
+            ``<channel_layer_id>:<rrggbb>:<lower>:<upper>``; repeated for
+            each channel layer
+
+        :reqheader Accept: ``image/webp`` to receive a WebP encoded tile
+            (optional)
+        :reqheader If-None-Match: entity tag of a cached tile (optional)
+        :reqheader If-Modified-Since: date of a cached tile (optional)
+        :resheader Vary: ``Accept``
+        :statuscode 200: no error
+        :statuscode 304: cached tile is still valid
+        :statuscode 400: malformed request
+
+    """
+    x = request.args.get('x', type=int)
+    y = request.args.get('y', type=int)
+    z = request.args.get('z', type=int)
+    channels = _parse_composite_channels(request.args.getlist('channel'))
+
+    logger.debug(
+        'get composite tile of %d channel layers of experiment %d: '
+        'x=%d, y=%d, z=%d', len(channels), experiment_id, x, y, z
+    )
+
+    fmt = 'webp' if _accepts_webp() else 'jpeg'
+    versions = [
+        channel_tile_cache.get_version(experiment_id, channel_layer_id)
+        for channel_layer_id, _, _ in channels
+    ]
+    last_modified = max(timestamp for _, timestamp in versions)
+    # The composite changes with its parameters and with any of its layers.
+    digest = hashlib.sha1(repr((
+        fmt, [c + (v, ) for c, (v, _) in zip(channels, versions)]
+    ))).hexdigest()
+    etag = 'channel-layer-composite-%s' % digest
+    response = get_not_modified_response(etag, last_modified, cfg.tile_max_age)
+    if response is not None:
+        response.vary.add('Accept')
+        return response
+
+    # Composites are stored alongside the tiles of the first channel layer.
+    cache_fmt = 'composite-%s' % digest
+    first_channel_layer_id = channels[0][0]
+    first_version = versions[0][0]
+    pixels = channel_tile_cache.get(
+        experiment_id, first_channel_layer_id, first_version, z, y, x,
+        fmt=cache_fmt
+    )
+    # Only composites of existing tiles get cached.
+    is_empty = False
+    if pixels is None:
+        coordinates = [
+            (channel_layer_id, z, y, x) for channel_layer_id, _, _ in channels
+        ]
+        tiles = _get_channel_layer_tiles(experiment_id, coordinates)
+        tiles = [tiles[c] for c in coordinates]
+        is_empty = any(_is_background_tile(t) for t in tiles)
+        pixels = run_cooperatively(_compose_tile, tiles, channels, fmt)
+        if not is_empty:
+            channel_tile_cache.set(
+                experiment_id, first_channel_layer_id, first_version,
+                z, y, x, pixels, fmt=cache_fmt
+            )
+    if is_empty:
+        # see get_channel_layer_tile()
+        etag = '%s-empty' % etag
+        max_age = BACKGROUND_TILE_MAX_AGE
+        response = get_not_modified_response(etag, last_modified, max_age)
+        if response is not None:
+            response.vary.add('Accept')
+            return response
+    else:
+        max_age = cfg.tile_max_age
+    f = StringIO()
+    f.write(pixels)
+    f.seek(0)
+    response = send_file(f, mimetype='image/%s' % fmt, cache_timeout=max_age)
+    response.vary.add('Accept')
+    return set_cache_validators(response, etag, last_modified, max_age)
+
+
+def _get_segmentation_tile_format():
+    """Determines the requested format of a segmentation layer tile from
+    the "format" query parameter or else the "Accept" header.
+
+    Returns
+    -------
+    str
+        ``"geojson"`` or ``"binary"``
+
+    Raises
+    ------
+    MalformedRequestError
+        when an unknown format was requested
+    """
+    fmt = request.args.get('format')
+    if fmt is None:
+        accepts_binary = any(
+            mimetype == VECTOR_TILE_MIMETYPE and quality > 0
+            for mimetype, quality in request.accept_mimetypes
+        )
+        fmt = 'binary' if accepts_binary else 'geojson'
+    elif fmt not in {'geojson', 'binary'}:
+        raise MalformedRequestError(
+            'Parameter "format" must be either "geojson" or "binary".'
+        )
+    return fmt
+
+
+def _get_segmentation_layer_maxzoom(experiment_id, segmentation_layer_id):
+    """Gets the maximal zoom level index of the pyramid a segmentation layer
+    is displayed on, which is cached until the layer gets invalidated.
+    """
+    version, _ = segmentation_tile_cache.get_version(
+        experiment_id, segmentation_layer_id
+    )
+    key = (experiment_id, segmentation_layer_id)
+    entry = _segmentation_layer_maxzoom.get(key)
+    if entry is None or entry[0] != version:
+        with tm.utils.ExperimentSession(experiment_id) as session:
+            # TODO: "maxzoom" should be stored in Experiment
+            layer = session.query(tm.ChannelLayer).first()
+            entry = (version, layer.maxzoom_level_index)
+        _segmentation_layer_maxzoom[key] = entry
+    return entry[1]
+
+
+def _cache_while_streaming(chunks, cache, experiment_id, layer_id, version,
+        z, y, x, fmt):
+    """Passes the chunks of a tile through and caches the tile once all
+    chunks have been generated. Since the cache stores tiles as a whole, the
+    chunks are deliberately kept until then, whereas the rows they were
+    generated from are not. Tiles whose generation got aborted, e.g. because
+    the client disconnected, are not cached.
+
+    Parameters
+    ----------
+    chunks: Iterable[str]
+        chunks of the encoded tile
+    cache: tmserver.extensions.tilecache.TileCache
+        cache of the layer
+    experiment_id: int
+        ID of the experiment
+    layer_id: int
+        ID of the layer
+    version: int
+        version of the layer the tile was generated for
+    z: int
+        zero-based zoom level index
+    y: int
+        zero-based row index
+    x: int
+        zero-based column index
+    fmt: str
+        format of the tile
+
+    Returns
+    -------
+    Generator[str]
+        chunks of the encoded tile
+    """
+    tile = list()
+    for chunk in chunks:
+        tile.append(chunk)
+        yield chunk
+    cache.set(
+        experiment_id, layer_id, version, z, y, x, ''.join(tile), fmt=fmt
+    )
+
+
+def _get_segmentation_layer_tile_from_pack(experiment_id,
+        segmentation_layer_id, version, z, y, x, maxzoom,
+        density_zoom_levels):
+    """Gets a binary tile from the pack of the materialized segmentation
+    layer.
+
+    Returns
+    -------
+    str
+        encoded tile, which is empty for positions without a tile, or
+        ``None`` if there is no pack for the current version of the
+        segmentation layer
+    """
+    if _segmentation_layer_tile_packs is None:
+        return None
+    pack = _segmentation_layer_tile_packs.open(
+        experiment_id, segmentation_layer_id
+    )
+    if pack is None:
+        return None
+    if pack.layer_version != version:
+        logger.debug(
+            'ignore outdated tile pack of segmentation layer %d',
+            segmentation_layer_id
+        )
+        return None
+    try:
+        data = pack.get(z, y, x)
+    except ValueError:
+        # The pack got closed concurrently.
+        return None
+    if data is None:
+        return get_empty_segmentation_layer_tile(
+            z, y, x, maxzoom, density_zoom_levels
+        )
+    return data
+
+
+def _get_segmentation_layer_mapobject_ids(session, segmentation_layer_id,
+        z, y, x, maxzoom):
+    """Gets the IDs of the mapobjects of a segmentation layer that intersect
+    with a tile below the maximal zoom level, i.e. the mapobjects of
+    :func:`get_simplified_segmentations <tmserver.segmentationtile.get_simplified_segmentations>`,
+    without loading their geometries.
+
+    Parameters
+    ----------
+    session: tmlib.models.utils.ExperimentSession
+        database session
+    segmentation_layer_id: int
+        ID of the segmentation layer
+    z: int
+        zero-based zoom level index
+    y: int
+        zero-based row index
+    x: int
+        zero-based column index
+    maxzoom: int
+        maximal zoom level index
+
+    Returns
+    -------
+    List[int]
+        IDs of mapobjects
+    """
+    minx, miny, maxx, maxy = tm.SegmentationLayer.get_tile_bounding_box(
+        x, y, z, maxzoom
+    )
+    tile = func.ST_MakeEnvelope(
+        min(minx, maxx), min(miny, maxy), max(minx, maxx), max(miny, maxy)
+    )
+    mapobjects = session.query(tm.MapobjectSegmentation.mapobject_id).\
+        filter(
+            tm.MapobjectSegmentation.segmentation_layer_id ==
+                segmentation_layer_id,
+            tm.MapobjectSegmentation.geom_polygon.ST_Intersects(tile)
+        ).\
+        all()
+    return [m.mapobject_id for m in mapobjects]
 
 
 @api.route(
     '/experiments/<experiment_id>/segmentation_layers/<segmentation_layer_id>/tiles',
     methods=['GET']
 )
+@compress_response
 @assert_query_params('x', 'y', 'z')
 @decode_query_ids(None)
 def get_segmentation_layer_tile(experiment_id, segmentation_layer_id):
@@ -98,7 +1006,19 @@ def get_segmentation_layer_tile(experiment_id, segmentation_layer_id):
         Sends each the geometric representation of each
         :class:`MapobjectSegmentation <tmlib.models.mapobject.MapobjectSegmentation>`
         as a GeoJSON feature collection that intersect with the given Pyramid
-        tile at position x, y, z.
+        tile at position x, y, z. Clients may alternatively request a
+        compact binary vector tile (see :mod:`tmserver.vectortile`) via
+        the "format" query parameter or the "Accept" header.
+
+        At zoom levels far below the maximal zoom level (see
+        :attr:`segmentation_density_zoom_levels <tmserver.config.ServerConfig.segmentation_density_zoom_levels>`)
+        mapobjects are aggregated into a density grid instead, which is sent
+        as JSON object of type "DensityGrid" or in binary form with content
+        type ``application/vnd.tissuemaps.density-grid``
+        (see :mod:`tmserver.densitygrid`).
+
+        Binary tiles of materialized segmentation layers (see
+        :mod:`tmserver.materialize`) are served without database access.
 
         **Example response**:
 
@@ -128,8 +1048,15 @@ def get_segmentation_layer_tile(experiment_id, segmentation_layer_id):
         :query x: zero-based `x` coordinate
         :query y: zero-based `y` coordinate
         :query z: zero-based zoom level index
+        :query format: ``geojson`` or ``binary`` (optional)
 
+        :reqheader Accept: ``application/vnd.tissuemaps.vector-tile`` to
+            receive a binary vector tile (optional)
+        :reqheader If-None-Match: entity tag of a cached tile (optional)
+        :reqheader If-Modified-Since: date of a cached tile (optional)
+        :resheader Vary: ``Accept``
         :statuscode 200: no error
+        :statuscode 304: cached tile is still valid
         :statuscode 400: malformed request
 
     """
@@ -145,6 +1072,18 @@ def get_segmentation_layer_tile(experiment_id, segmentation_layer_id):
         segmentation_layer_id, x, y, z
     )
 
+    fmt = _get_segmentation_tile_format()
+    version, last_modified = segmentation_tile_cache.get_version(
+        experiment_id, segmentation_layer_id
+    )
+    etag = 'segmentation-layer-%d-%d-%s' % (
+        segmentation_layer_id, version, fmt
+    )
+    response = get_not_modified_response(etag, last_modified)
+    if response is not None:
+        response.vary.add('Accept')
+        return response
+
     # if mapobject_type_name == 'DEBUG_TILE':
     #     with tm.utils.ExperimentSession(experiment_id) as session:
     #         layer = session.query(tm.ChannelLayer).first()
@@ -168,42 +1107,138 @@ def get_segmentation_layer_tile(experiment_id, segmentation_layer_id):
     #         }
     #     })
 
-    with tm.utils.ExperimentSession(experiment_id) as session:
-        segmentation_layer = session.query(tm.SegmentationLayer).get(
-            segmentation_layer_id
+    maxzoom = _get_segmentation_layer_maxzoom(
+        experiment_id, segmentation_layer_id
+    )
+    density_zoom_levels = cfg.segmentation_density_zoom_levels
+    is_density = is_density_zoom_level(z, maxzoom, density_zoom_levels)
+    if fmt != 'binary':
+        mimetype = 'application/json'
+    elif is_density:
+        mimetype = DENSITY_GRID_MIMETYPE
+    else:
+        mimetype = VECTOR_TILE_MIMETYPE
+    if fmt == 'binary':
+        data = _get_segmentation_layer_tile_from_pack(
+            experiment_id, segmentation_layer_id, version, z, y, x, maxzoom,
+            density_zoom_levels
+        )
+        if data is not None:
+            response = Response(data, mimetype=mimetype)
+            response.vary.add('Accept')
+            return set_cache_validators(response, etag, last_modified)
+    # Rendered tiles are cached until a write to the layer invalidates them.
+    data = segmentation_tile_cache.get(
+        experiment_id, segmentation_layer_id, version, z, y, x, fmt=fmt
+    )
+    if data is None and is_density:
+        key = (
+            'segmentation_layer_density_grid', experiment_id,
+            segmentation_layer_id, version, fmt, z, y, x
+        )
+        data = _tile_flights.do(
+            key, get_segmentation_layer_density_grid,
+            experiment_id, segmentation_layer_id, z, y, x, maxzoom, fmt
+        )
+        segmentation_tile_cache.set(
+            experiment_id, segmentation_layer_id, version, z, y, x, data,
+            fmt=fmt
+        )
+    elif data is None and fmt == 'binary':
+        # Concurrent requests for the same tile share a single query.
+        key = (
+            'segmentation_layer_tile', experiment_id, segmentation_layer_id,
+            version, 'wkb', z, y, x
+        )
+        _, outlines = _tile_flights.do(
+            key, get_segmentation_layer_outlines,
+            experiment_id, segmentation_layer_id, z, y, x, maxzoom, 'wkb'
+        )
+        data = encode_vector_tile(outlines)
+        segmentation_tile_cache.set(
+            experiment_id, segmentation_layer_id, version, z, y, x, data,
+            fmt=fmt
+        )
+    elif data is None:
+        # The geometries are already encoded as GeoJSON by the database and
+        # are spliced into the output as the rows arrive, so the rows can't
+        # be shared with concurrent requests for the same tile.
+        data = iter_segmentation_layer_geojson_tile(
+            experiment_id, segmentation_layer_id, z, y, x, maxzoom
         )
-        outlines = segmentation_layer.get_segmentations(x, y, z)
-        mapobject_type_name = segmentation_layer.mapobject_type.name
-
-    # Try to estimate how many points there are in total within
-    # the polygons of this tile.
-    # TODO: Make this more light weight by sending binary coordinates
-    # without GEOJSON overhead. Requires a hack on the client side.
-    if len(outlines) > 0:
-        features = [
+        if segmentation_tile_cache.enabled:
+            data = _cache_while_streaming(
+                data, segmentation_tile_cache, experiment_id,
+                segmentation_layer_id, version, z, y, x, fmt
+            )
+        data = stream_with_context(data)
+    response = Response(data, mimetype=mimetype)
+    response.vary.add('Accept')
+    return set_cache_validators(response, etag, last_modified)
+
+
+@api.route(
+    '/experiments/<experiment_id>/segmentation_layers/<segmentation_layer_id>/materialization',
+    methods=['GET']
+)
+@jwt_required()
+@decode_query_ids('read')
+def get_segmentation_layer_materialization(experiment_id,
+        segmentation_layer_id):
+    """
+    .. http:get:: /api/experiments/(string:experiment_id)/segmentation_layers/(string:segmentation_layer_id)/materialization
+
+        Get the progress of the materialization of the tiles of a
+        segmentation layer (see :mod:`tmserver.materialize`).
+
+        **Example response**:
+
+        .. sourcecode:: http
+
+            HTTP/1.1 200 OK
+            Content-Type: application/json
+
             {
-                'type': 'Feature',
-                'id': mapobject_id,
-                'geometry': json.loads(geom_geojson_str),
-                'properties': {
-                    'type': mapobject_type_name
+                "data": {
+                    "state": "running",
+                    "layer_version": 3,
+                    "n_tiles": 5120,
+                    "n_done": 2048,
+                    "updated_at": 1514764800.0,
+                    "is_current": true
                 }
             }
-            for mapobject_id, geom_geojson_str in outlines
-        ]
-    else:
-        features = []
 
-    return jsonify({
-        'type': 'FeatureCollection',
-        'features': features
-    })
+        The status is ``null`` when the layer was never materialized.
+        Tiles are only served from the materialization when it is "done" and
+        current, i.e. the layer didn't change since.
+
+        :reqheader Authorization: JWT token issued by the server
+        :statuscode 200: no error
+
+    """
+    logger.info(
+        'get materialization status of segmentation layer %d',
+        segmentation_layer_id
+    )
+    if _segmentation_layer_tile_packs is None:
+        return jsonify(data=None)
+    status = read_status(
+        _segmentation_layer_tile_packs, experiment_id, segmentation_layer_id
+    )
+    if status is not None:
+        version, _ = segmentation_tile_cache.get_version(
+            experiment_id, segmentation_layer_id
+        )
+        status['is_current'] = status['layer_version'] == version
+    return jsonify(data=status)
 
 
 @api.route(
     '/experiments/<experiment_id>/segmentation_layers/<segmentation_layer_id>/labeled_tiles',
     methods=['GET']
 )
+@compress_response
 @decode_query_ids(None)
 @assert_query_params('x', 'y', 'z', 'result_name')
 def get_segmentation_layer_label_tile(experiment_id, segmentation_layer_id):
@@ -246,8 +1281,11 @@ def get_segmentation_layer_label_tile(experiment_id, segmentation_layer_id):
         :query y: zero-based `y` coordinate
         :query z: zero-based zoom level index
 
+        :reqheader If-None-Match: entity tag of a cached tile (optional)
+        :reqheader If-Modified-Since: date of a cached tile (optional)
         :statuscode 400: malformed request
         :statuscode 200: no error
+        :statuscode 304: cached tile is still valid
 
     """
     # The coordinates of the requested tile
@@ -260,10 +1298,12 @@ def get_segmentation_layer_label_tile(experiment_id, segmentation_layer_id):
         'get labeled tile for segmentation layer of tool result "%s": '
         'x=%d, y=%d, z=%d', result_name, x, y, z
     )
+    version, last_modified = segmentation_tile_cache.get_version(
+        experiment_id, segmentation_layer_id
+    )
     with tm.utils.ExperimentSession(experiment_id) as session:
         segmentation_layer = session.query(tm.SegmentationLayer).\
             get(segmentation_layer_id)
-        outlines = segmentation_layer.get_segmentations(x, y, z)
         mapobject_type = segmentation_layer.mapobject_type
         mapobject_type_name = mapobject_type.name
 
@@ -271,25 +1311,189 @@ def get_segmentation_layer_label_tile(experiment_id, segmentation_layer_id):
             filter_by(name=result_name, mapobject_type_id=mapobject_type.id).\
             one()
 
-        if len(outlines) > 0:
-            mapobject_ids = [c.mapobject_id for c in outlines]
-            mapobject_id_to_label = result.get_labels(mapobject_ids)
-            features = [
-                {
-                    'type': 'Feature',
-                    'id': mapobject_id,
-                    'geometry': json.loads(geom_geojson_str),
-                    'properties': {
-                        'label': str(mapobject_id_to_label[mapobject_id])
-                     }
-                }
-                for mapobject_id, geom_geojson_str in outlines
-            ]
+        # Labels of a result don't change, but a result with the same name
+        # may be created again.
+        etag = 'segmentation-layer-%d-%d-result-%d' % (
+            segmentation_layer_id, version, result.id
+        )
+        response = get_not_modified_response(etag, last_modified)
+        if response is not None:
+            return response
+
+        maxzoom = _get_segmentation_layer_maxzoom(
+            experiment_id, segmentation_layer_id
+        )
+        if z < maxzoom:
+            outlines = get_simplified_segmentations(
+                session, segmentation_layer_id, z, y, x, maxzoom
+            )
         else:
-            features = []
+            outlines = segmentation_layer.get_segmentations(x, y, z)
+        result_id = result.id
 
-    return jsonify({
-        'type': 'FeatureCollection',
-        'features': features
-    })
+    labels = _get_tool_result_labels(experiment_id, result_id)
+    mapobject_ids = [c.mapobject_id for c in outlines]
+    properties = dict(zip(mapobject_ids, [
+        '{"label":%s}' % json.dumps(label)
+        for label in labels.format(mapobject_ids)
+    ]))
+
+    response = Response(
+        iter_feature_collection(outlines, properties.get),
+        mimetype='application/json'
+    )
+    return set_cache_validators(response, etag, last_modified)
+
+
+@api.route(
+    '/experiments/<experiment_id>/segmentation_layers/<segmentation_layer_id>/tile_labels',
+    methods=['GET']
+)
+@compress_response
+@decode_query_ids(None)
+@assert_query_params('x', 'y', 'z', 'result_name')
+def get_segmentation_layer_tile_labels(experiment_id, segmentation_layer_id):
+    """
+    .. http:get:: /api/experiments/(string:experiment_id)/segmentation_layers/(string:segmentation_layer_id)/tile_labels
+
+        Sends the :class:`LabelValues <tmlib.models.result.LabelValues>` of
+        the specified tool :class:`Result <tmlib.models.result.Result>` for
+        the mapobjects of the labeled tile at position x, y, z without their
+        geometries. This allows clients to recolor tiles they already loaded
+        for another result of the same segmentation layer.
+
+        **Example response**:
+
+        .. sourcecode:: http
+
+            HTTP/1.1 200 OK
+            Content-Type: application/json
+
+            {
+                "mapobject_ids": [1, 2, 5, ...],
+                "labels": ["0", "1", null, ...]
+            }
+
+        :query x: zero-based `x` coordinate
+        :query y: zero-based `y` coordinate
+        :query z: zero-based zoom level index
+        :query result_name: name of the tool result
+
+        :reqheader If-None-Match: entity tag of a cached response (optional)
+        :reqheader If-Modified-Since: date of a cached response (optional)
+        :statuscode 400: malformed request
+        :statuscode 200: no error
+        :statuscode 304: cached response is still valid
+
+    """
+    x = request.args.get('x', type=int)
+    y = request.args.get('y', type=int)
+    z = request.args.get('z', type=int)
+    result_name = request.args.get('result_name')
+
+    logger.debug(
+        'get labels of tile for segmentation layer of tool result "%s": '
+        'x=%d, y=%d, z=%d', result_name, x, y, z
+    )
+    version, last_modified = segmentation_tile_cache.get_version(
+        experiment_id, segmentation_layer_id
+    )
+    with tm.utils.ExperimentSession(experiment_id) as session:
+        segmentation_layer = session.query(tm.SegmentationLayer).\
+            get(segmentation_layer_id)
+        result = session.query(tm.ToolResult.id).\
+            filter_by(
+                name=result_name,
+                mapobject_type_id=segmentation_layer.mapobject_type.id
+            ).\
+            one()
+        etag = 'segmentation-layer-%d-%d-result-%d-labels' % (
+            segmentation_layer_id, version, result.id
+        )
+        response = get_not_modified_response(etag, last_modified)
+        if response is not None:
+            return response
+        maxzoom = _get_segmentation_layer_maxzoom(
+            experiment_id, segmentation_layer_id
+        )
+        if z < maxzoom:
+            mapobject_ids = _get_segmentation_layer_mapobject_ids(
+                session, segmentation_layer_id, z, y, x, maxzoom
+            )
+        else:
+            mapobject_ids = [
+                c.mapobject_id
+                for c in segmentation_layer.get_segmentations(x, y, z)
+            ]
+        result_id = result.id
+
+    labels = _get_tool_result_labels(experiment_id, result_id)
+    data = '{"mapobject_ids":[%s],"labels":[%s]}' % (
+        ','.join(str(i) for i in mapobject_ids),
+        ','.join(json.dumps(label) for label in labels.format(mapobject_ids))
+    )
+    response = Response(data, mimetype='application/json')
+    return set_cache_validators(response, etag, last_modified)
+
+
+@api.route('/tile_caches', methods=['GET'])
+@jwt_required()
+def get_tile_cache_stats():
+    """
+    .. http:get:: /api/tile_caches
 
+        Get usage statistics of the tile caches of the worker process that
+        handles the request, which help to size the caches.
+
+        **Example response**:
+
+        .. sourcecode:: http
+
+            HTTP/1.1 200 OK
+            Content-Type: application/json
+
+            {
+                "data": {
+                    "channel_layers": {
+                        "memory_hits": 5210,
+                        "disk_hits": 312,
+                        "misses": 980,
+                        "hit_rate": 0.85,
+                        "memory_tiles": 4023,
+                        "memory_size": 201326592,
+                        "disk_size": 1073741824
+                    },
+                    "segmentation_layers": {
+                        ...
+                    },
+                    "channel_layer_prefetching": {
+                        "pending": 0,
+                        "scheduled": 1200,
+                        "dropped": 36
+                    },
+                    "tool_result_labels": {
+                        "hits": 860,
+                        "misses": 3,
+                        "items": 3,
+                        "size": 2400000
+                    },
+                    "segmentation_layer_materialization": {
+                        "pending": 1,
+                        "running": 0
+                    }
+                }
+            }
+
+        :reqheader Authorization: JWT token issued by the server
+        :statuscode 200: no error
+
+    """
+    logger.info('get tile cache statistics')
+    return jsonify(data={
+        'channel_layers': channel_tile_cache.stats,
+        'segmentation_layers': segmentation_tile_cache.stats,
+        'channel_layer_prefetching': channel_tile_prefetcher.stats,
+        'tool_result_labels': get_tool_result_label_stats(),
+        'segmentation_layer_materialization':
+            segmentation_tile_materializer.stats,
+    })
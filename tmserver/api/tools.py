@@ -20,7 +20,7 @@ as well as related :mod:`result <tmlib.models.result>` and
 import os
 import json
 import logging
-from flask import jsonify, request, current_app
+from flask import jsonify, request, current_app, Response
 from flask_jwt import jwt_required, current_identity
 from sqlalchemy import distinct
 
@@ -40,8 +40,16 @@ from tmserver.error import (
 )
 from tmserver.util import decode_query_ids, decode_form_ids
 from tmserver.util import assert_query_params, assert_form_params
+from tmserver.util import get_not_modified_response, set_cache_validators
 from tmserver.model import encode_pk
 from tmserver.extensions import gc3pie
+from tmserver.labels import (
+    encode_label_array, MIMETYPE as LABEL_ARRAY_MIMETYPE
+)
+from tmserver.labelcache import (
+    get_tool_result_labels as _get_tool_result_labels,
+    discard_tool_result_labels
+)
 from tmserver import cfg as server_cfg
 
 
@@ -398,9 +406,63 @@ def delete_tool_result(experiment_id, tool_result_id):
         session.query(tm.ToolResult).\
             filter_by(id=tool_result_id).\
             delete()
+    discard_tool_result_labels(experiment_id, tool_result_id)
     return jsonify(message='ok')
 
 
+@api.route(
+    '/experiments/<experiment_id>/tools/results/<tool_result_id>/labels',
+    methods=['GET']
+)
+@jwt_required()
+@decode_query_ids('read')
+def get_tool_result_labels(experiment_id, tool_result_id):
+    """
+    .. http:get:: /api/experiments/(string:experiment_id)/tools/results/(string:tool_result_id)/labels
+
+        Sends the :class:`LabelValues <tmlib.models.result.LabelValues>` of
+        all mapobjects of a tool :class:`Result <tmlib.models.result.Result>`
+        as binary label array (see :mod:`tmserver.labels`), which allows
+        clients to recolor all tiles they already loaded at once.
+
+        **Example response**:
+
+        .. sourcecode:: http
+
+            HTTP/1.1 200 OK
+            Content-Type: application/vnd.tissuemaps.label-array
+
+        :reqheader Authorization: JWT token issued by the server
+        :reqheader If-None-Match: entity tag of a cached response (optional)
+        :reqheader If-Modified-Since: date of a cached response (optional)
+        :statuscode 200: no error
+        :statuscode 304: cached response is still valid
+        :statuscode 404: tool result doesn't exist
+
+    """
+    logger.info('get labels of tool result %d', tool_result_id)
+    with tm.utils.ExperimentSession(experiment_id) as session:
+        result = session.query(tm.ToolResult.updated_at).\
+            filter_by(id=tool_result_id).\
+            one_or_none()
+    if result is None:
+        raise ResourceNotFoundError(tm.ToolResult, id=tool_result_id)
+    # Labels of a stored result don't change, but the entity tag must not
+    # match a result that gets created again under the same ID.
+    etag = 'tool-result-labels-%d-%s' % (
+        tool_result_id, result.updated_at.strftime('%Y%m%d%H%M%S%f')
+    )
+    last_modified = result.updated_at
+    response = get_not_modified_response(etag, last_modified, private=True)
+    if response is None:
+        labels = _get_tool_result_labels(experiment_id, tool_result_id)
+        response = Response(
+            encode_label_array(labels), mimetype=LABEL_ARRAY_MIMETYPE
+        )
+        set_cache_validators(response, etag, last_modified, private=True)
+    return response
+
+
 @api.route(
     '/experiments/<experiment_id>/tools/jobs', methods=['GET']
 )
@@ -27,12 +27,14 @@ import gc3libs
 import tmlib.models as tm
 from tmlib.log import map_logging_verbosity
 from tmlib.models.utils import (
-    create_db_engine, create_db_tables, create_db_session_factory
+    create_db_engine, create_db_tables, create_db_session_factory,
+    set_pool_size
 )
 
 from tmserver.extensions import jwt
 from tmserver.serialize import TmJSONEncoder
 from tmserver.error import register_http_error_classes
+from tmserver.green import is_gevent_patched, make_psycopg2_green
 from tmserver import cfg
 
 
@@ -160,6 +162,25 @@ def create_app(verbosity=None):
     ## Initialize Plugins
     jwt.init_app(app)
 
+    # Workers that were monkey patched by gevent serve many requests
+    # concurrently, which requires cooperative database access and one
+    # connection per greenlet. The connections of all workers together must
+    # fit into "max_connections" of the database server.
+    if is_gevent_patched():
+        logger.info(
+            'configure gevent mode with %d greenlets and as many database '
+            'connections', cfg.gevent_pool_size
+        )
+        make_psycopg2_green()
+        set_pool_size(cfg.gevent_pool_size)
+        # Processes forked by multiprocessing would inherit the monkey
+        # patched standard library, and waiting for them blocks the hub.
+        if cfg.segmentation_extraction_processes > 1:
+            raise ValueError(
+                'Configuration parameter "segmentation_extraction_processes" '
+                'must be 1 for gevent workers.'
+            )
+
     # Create a session scope for interacting with the main database
     engine = create_db_engine(cfg.db_master_uri)
     create_db_tables(engine)
@@ -170,6 +191,58 @@ def create_app(verbosity=None):
     from tmserver.extensions import gc3pie
     gc3pie.init_app(app)
 
+    from tmserver.extensions import channel_tile_cache
+    from tmserver.extensions import segmentation_tile_cache
+    if cfg.tile_cache_directory:
+        channel_tile_cache_directory = os.path.join(
+            cfg.tile_cache_directory, 'channel_layers'
+        )
+        segmentation_tile_cache_directory = os.path.join(
+            cfg.tile_cache_directory, 'segmentation_layers'
+        )
+    else:
+        channel_tile_cache_directory = None
+        segmentation_tile_cache_directory = None
+    # Workflows rebuild pyramids and segmentations in other processes, which
+    # is detected via the tasks that terminated.
+    channel_tile_cache.init_app(
+        app,
+        memory_size=cfg.tile_cache_memory_size * 1024**2,
+        disk_size=cfg.tile_cache_disk_size * 1024**2,
+        directory=channel_tile_cache_directory,
+        marker_loader=gc3pie.get_completion_marker
+    )
+    segmentation_tile_cache.init_app(
+        app,
+        memory_size=cfg.segmentation_tile_cache_memory_size * 1024**2,
+        disk_size=cfg.segmentation_tile_cache_disk_size * 1024**2,
+        directory=segmentation_tile_cache_directory,
+        marker_loader=gc3pie.get_completion_marker
+    )
+
+    from tmserver.extensions import channel_tile_prefetcher
+    # Prefetched tiles would be lost without a cache to put them in.
+    if cfg.tile_cache_memory_size or cfg.tile_cache_disk_size:
+        tile_prefetch_budget = cfg.tile_prefetch_budget
+    else:
+        tile_prefetch_budget = 0
+    channel_tile_prefetcher.init_app(
+        app, budget=tile_prefetch_budget,
+        max_load=cfg.tile_prefetch_max_load
+    )
+
+    from tmserver.extensions import segmentation_tile_materializer
+    # Materialization relies on layer versions that are shared with the
+    # materializing processes.
+    if cfg.segmentation_tile_pack_directory and cfg.tile_cache_directory:
+        materialization_delay = cfg.segmentation_tile_materialization_delay
+    else:
+        materialization_delay = 0
+    segmentation_tile_materializer.init_app(
+        app, segmentation_tile_cache, delay=materialization_delay,
+        n_processes=cfg.segmentation_tile_materialization_processes
+    )
+
     ## Import and register blueprints
     from tmserver.api import api
     app.register_blueprint(api, url_prefix='/api')
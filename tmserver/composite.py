@@ -0,0 +1,89 @@
+# TmServer - TissueMAPS server application.
+# Copyright (C) 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Blending of grayscale channel tiles into colored composite tiles."""
+import numpy as np
+
+
+def parse_color(value):
+    """Parses a hexadecimal RGB color.
+
+    Parameters
+    ----------
+    value: str
+        color in the form ``"rrggbb"``, optionally preceded by ``"#"``
+
+    Returns
+    -------
+    Tuple[int, int, int]
+        red, green and blue component
+
+    Raises
+    ------
+    ValueError
+        when `value` is not a hexadecimal RGB color
+    """
+    value = value.lstrip('#')
+    if len(value) != 6:
+        raise ValueError('Color "%s" is not of the form "rrggbb".' % value)
+    return tuple(int(value[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def blend_channel_tiles(tiles, colors, windows):
+    """Blends grayscale tiles additively into a single RGB tile.
+
+    The intensities of each tile are rescaled such that the lower bound of
+    its window maps to zero and the upper bound to one, and are then
+    multiplied with the color of the tile. Tiles of different sizes are
+    aligned at their upper left corner.
+
+    Parameters
+    ----------
+    tiles: List[numpy.ndarray[numpy.uint8]]
+        grayscale tiles
+    colors: List[Tuple[int, int, int]]
+        red, green and blue component of the color of each tile
+    windows: List[Tuple[int, int]]
+        lower and upper bound of the intensity window of each tile
+
+    Returns
+    -------
+    numpy.ndarray[numpy.uint8]
+        RGB tile with shape ``(height, width, 3)``
+
+    Raises
+    ------
+    ValueError
+        when the number of tiles, colors and windows differ
+    """
+    if not len(tiles) == len(colors) == len(windows):
+        raise ValueError(
+            'Number of tiles, colors and windows must be identical.'
+        )
+    height = max(t.shape[0] for t in tiles)
+    width = max(t.shape[1] for t in tiles)
+    stack = np.zeros((len(tiles), height, width), dtype=np.float32)
+    for i, t in enumerate(tiles):
+        stack[i, :t.shape[0], :t.shape[1]] = t
+    windows = np.asarray(windows, dtype=np.float32)
+    lower = windows[:, 0].reshape(-1, 1, 1)
+    scale = 1 / np.maximum(windows[:, 1] - windows[:, 0], 1).reshape(-1, 1, 1)
+    stack -= lower
+    stack *= scale
+    np.clip(stack, 0, 1, out=stack)
+    colors = np.asarray(colors, dtype=np.float32)
+    rgb = np.tensordot(stack, colors, axes=([0], [0]))
+    np.clip(rgb, 0, 255, out=rgb)
+    return rgb.round().astype(np.uint8)
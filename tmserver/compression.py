@@ -0,0 +1,185 @@
+# TmServer - TissueMAPS server application.
+# Copyright (C) 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Incremental compression of response bodies with the HTTP content codings
+"gzip" and "deflate".
+
+Bodies that are generated in chunks are compressed chunk by chunk. The
+compressed output is flushed whenever enough data has been compressed since
+the last flush, such that clients can decode the body as it arrives without
+small chunks degrading the compression ratio.
+
+View functions opt into compression with the :func:`compress_response`
+decorator.
+"""
+import zlib
+import functools
+import itertools
+from flask import request, current_app
+
+from tmserver import cfg
+from tmserver.densitygrid import MIMETYPE as DENSITY_GRID_MIMETYPE
+from tmserver.vectortile import MIMETYPE as VECTOR_TILE_MIMETYPE
+
+#: content codings in order of preference
+ENCODINGS = ('gzip', 'deflate')
+
+#: media types of responses that get compressed by :func:`compress_response`
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'text/csv', VECTOR_TILE_MIMETYPE,
+    DENSITY_GRID_MIMETYPE
+}
+
+_WBITS = {
+    # gzip header and trailer
+    'gzip': 16 + zlib.MAX_WBITS,
+    # zlib header and trailer, which is what HTTP calls "deflate"
+    'deflate': zlib.MAX_WBITS,
+}
+
+
+def _get_compressor(encoding, level):
+    try:
+        wbits = _WBITS[encoding]
+    except KeyError:
+        raise ValueError('Content coding "%s" is not supported.' % encoding)
+    return zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+
+def compress(data, encoding, level=6):
+    """Compresses data at once.
+
+    Parameters
+    ----------
+    data: str
+        data
+    encoding: str
+        content coding (options: ``{"gzip", "deflate"}``)
+    level: int, optional
+        compression level between ``1`` (fastest) and ``9`` (smallest)
+        (default: ``6``)
+
+    Returns
+    -------
+    str
+        compressed data
+    """
+    compressor = _get_compressor(encoding, level)
+    return compressor.compress(data) + compressor.flush()
+
+
+def iter_compressed(chunks, encoding, level=6, flush_size=16384):
+    """Compresses data chunk by chunk.
+
+    Parameters
+    ----------
+    chunks: Iterable[Union[str, unicode]]
+        data; unicode chunks are encoded as UTF-8
+    encoding: str
+        content coding (options: ``{"gzip", "deflate"}``)
+    level: int, optional
+        compression level between ``1`` (fastest) and ``9`` (smallest)
+        (default: ``6``)
+    flush_size: int, optional
+        number of bytes of data after which compressed output gets flushed
+        (default: ``16384``)
+
+    Returns
+    -------
+    Generator[str]
+        compressed data
+    """
+    compressor = _get_compressor(encoding, level)
+    pending = 0
+    for chunk in chunks:
+        if isinstance(chunk, unicode):
+            chunk = chunk.encode('utf-8')
+        output = compressor.compress(chunk)
+        pending += len(chunk)
+        if pending >= flush_size:
+            output += compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+        if output:
+            yield output
+    yield compressor.flush()
+
+
+def _weaken_etag(response):
+    etag, is_weak = response.get_etag()
+    if etag is not None and not is_weak:
+        response.set_etag(etag, weak=True)
+
+
+def compress_response(f):
+    """A decorator for view functions that compresses JSON, CSV and binary
+    segmentation tile responses with a content coding the client accepts
+    according to the "Accept-Encoding" header of the request. Streamed
+    responses are compressed chunk by chunk as they are sent.
+
+    Responses below
+    :attr:`response_compression_min_size <tmserver.config.ServerConfig.response_compression_min_size>`
+    are sent uncompressed. Entity tags of all responses that may be
+    compressed, including "304 Not Modified" responses, are weak, since a
+    strong entity tag must not match both the compressed and the
+    uncompressed representation.
+    """
+    @functools.wraps(f)
+    def wrapped(*args, **kwargs):
+        response = current_app.make_response(f(*args, **kwargs))
+        level = cfg.response_compression_level
+        if level <= 0:
+            return response
+        if response.status_code == 304:
+            # The validators must be those of the representation the client
+            # has cached, which may have been compressed.
+            response.vary.add('Accept-Encoding')
+            _weaken_etag(response)
+            return response
+        if (response.status_code != 200 or
+                response.mimetype not in COMPRESSIBLE_MIMETYPES or
+                response.direct_passthrough or
+                'Content-Encoding' in response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+        _weaken_etag(response)
+        encoding = request.accept_encodings.best_match(ENCODINGS)
+        if encoding is None:
+            return response
+        min_size = cfg.response_compression_min_size
+        if response.is_streamed:
+            # Look ahead until the body is large enough to be worth it.
+            chunks = iter(response.response)
+            head = list()
+            size = 0
+            for chunk in chunks:
+                head.append(chunk)
+                size += len(chunk)
+                if size >= min_size:
+                    break
+            else:
+                response.set_data(''.join(head))
+                return response
+            response.response = iter_compressed(
+                itertools.chain(head, chunks), encoding, level
+            )
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < min_size:
+                return response
+            response.set_data(compress(data, encoding, level))
+        response.headers['Content-Encoding'] = encoding
+        return response
+    return wrapped
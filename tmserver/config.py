@@ -18,6 +18,7 @@ import ConfigParser
 import os
 import logging
 import datetime
+import tempfile
 
 from gc3libs.quantity import Duration
 
@@ -36,6 +37,27 @@ class ServerConfig(TmapsConfig):
         self.logging_verbosity = 2
         self.secret_key = 'default_secret_key'
         self.jwt_expiration_delta = datetime.timedelta(hours=72)
+        self.tile_cache_memory_size = 256
+        self.tile_cache_disk_size = 4096
+        self.tile_cache_directory = os.path.join(
+            tempfile.gettempdir(), 'tmserver', 'tile_cache'
+        )
+        self.tile_max_age = 86400
+        self.tile_pack_directory = ''
+        self.tile_webp_quality = 80
+        self.tile_prefetch_budget = 256
+        self.tile_prefetch_max_load = 1.0
+        self.gevent_pool_size = 100
+        self.segmentation_tile_cache_memory_size = 128
+        self.segmentation_tile_cache_disk_size = 1024
+        self.segmentation_density_zoom_levels = 0
+        self.tool_result_label_cache_size = 16
+        self.segmentation_tile_pack_directory = ''
+        self.segmentation_tile_materialization_delay = 120
+        self.segmentation_tile_materialization_processes = 4
+        self.segmentation_extraction_processes = 1
+        self.response_compression_level = 6
+        self.response_compression_min_size = 1024
         self.read()
 
     @property
@@ -139,3 +161,404 @@ class ServerConfig(TmapsConfig):
                 'datetime.timedelta'
             )
         self._config.set(self._section, 'jwt_expiration_delta', str(value))
+
+    @property
+    def tile_cache_memory_size(self):
+        '''int: size budget of the in-memory tile cache of each server process
+        in megabytes; ``0`` disables the in-memory tier (default: ``256``)
+        '''
+        return self._config.getint(self._section, 'tile_cache_memory_size')
+
+    @tile_cache_memory_size.setter
+    def tile_cache_memory_size(self, value):
+        if not isinstance(value, int):
+            raise TypeError(
+                'Configuration parameter "tile_cache_memory_size" must have '
+                'type int.'
+            )
+        self._config.set(self._section, 'tile_cache_memory_size', str(value))
+
+    @property
+    def tile_cache_disk_size(self):
+        '''int: size budget of the on-disk tile cache in megabytes;
+        ``0`` disables the disk tier (default: ``4096``)
+        '''
+        return self._config.getint(self._section, 'tile_cache_disk_size')
+
+    @tile_cache_disk_size.setter
+    def tile_cache_disk_size(self, value):
+        if not isinstance(value, int):
+            raise TypeError(
+                'Configuration parameter "tile_cache_disk_size" must have '
+                'type int.'
+            )
+        self._config.set(self._section, 'tile_cache_disk_size', str(value))
+
+    @property
+    def tile_cache_directory(self):
+        '''str: absolute path to the directory of the on-disk tile cache,
+        which is shared by all server processes of a host
+        (default: ``"$TMPDIR/tmserver/tile_cache"``)
+        '''
+        return self._config.get(self._section, 'tile_cache_directory')
+
+    @tile_cache_directory.setter
+    def tile_cache_directory(self, value):
+        if not isinstance(value, basestring):
+            raise TypeError(
+                'Configuration parameter "tile_cache_directory" must have '
+                'type str.'
+            )
+        self._config.set(self._section, 'tile_cache_directory', str(value))
+
+    @property
+    def tile_max_age(self):
+        '''int: number of seconds clients and caching proxies may reuse a
+        channel layer tile without revalidating it with the server
+        (default: ``86400``)
+        '''
+        return self._config.getint(self._section, 'tile_max_age')
+
+    @tile_max_age.setter
+    def tile_max_age(self, value):
+        if not isinstance(value, int):
+            raise TypeError(
+                'Configuration parameter "tile_max_age" must have type int.'
+            )
+        self._config.set(self._section, 'tile_max_age', str(value))
+
+    @property
+    def tile_pack_directory(self):
+        '''str: absolute path to the directory of packed channel layer tiles,
+        which are built with ``tm_tilepack``; tiles are only served from
+        the database when empty (default: ``""``)
+        '''
+        return self._config.get(self._section, 'tile_pack_directory')
+
+    @tile_pack_directory.setter
+    def tile_pack_directory(self, value):
+        if not isinstance(value, basestring):
+            raise TypeError(
+                'Configuration parameter "tile_pack_directory" must have '
+                'type str.'
+            )
+        self._config.set(self._section, 'tile_pack_directory', str(value))
+
+    @property
+    def tile_webp_quality(self):
+        '''int: quality between ``1`` and ``100`` of WebP encoded channel
+        layer tiles, which are sent to clients that accept WebP; ``0``
+        disables WebP encoding (default: ``80``)
+        '''
+        return self._config.getint(self._section, 'tile_webp_quality')
+
+    @tile_webp_quality.setter
+    def tile_webp_quality(self, value):
+        if not isinstance(value, int):
+            raise TypeError(
+                'Configuration parameter "tile_webp_quality" must have '
+                'type int.'
+            )
+        if not 0 <= value <= 100:
+            raise ValueError(
+                'Configuration parameter "tile_webp_quality" must be '
+                'between 0 and 100.'
+            )
+        self._config.set(self._section, 'tile_webp_quality', str(value))
+
+    @property
+    def tile_prefetch_budget(self):
+        '''int: maximal number of channel layer tiles each worker process
+        loads into the tile cache in the background in anticipation of
+        requests for neighboring tiles; ``0`` disables prefetching
+        (default: ``256``)
+        '''
+        return self._config.getint(self._section, 'tile_prefetch_budget')
+
+    @tile_prefetch_budget.setter
+    def tile_prefetch_budget(self, value):
+        if not isinstance(value, int):
+            raise TypeError(
+                'Configuration parameter "tile_prefetch_budget" must have '
+                'type int.'
+            )
+        self._config.set(self._section, 'tile_prefetch_budget', str(value))
+
+    @property
+    def tile_prefetch_max_load(self):
+        '''float: one minute load average per CPU above which channel layer
+        tiles are no longer prefetched (default: ``1.0``)
+        '''
+        return self._config.getfloat(self._section, 'tile_prefetch_max_load')
+
+    @tile_prefetch_max_load.setter
+    def tile_prefetch_max_load(self, value):
+        if not isinstance(value, (int, float)):
+            raise TypeError(
+                'Configuration parameter "tile_prefetch_max_load" must have '
+                'type float.'
+            )
+        self._config.set(self._section, 'tile_prefetch_max_load', str(value))
+
+    @property
+    def gevent_pool_size(self):
+        '''int: number of greenlets per worker process when the server runs
+        with *gevent* workers, which also determines the size of the database
+        connection pool of each process (default: ``100``)
+
+        Note
+        ----
+        Each worker process may open as many database connections as it has
+        greenlets, so the number of worker processes times this value must
+        not exceed ``max_connections`` of the PostgreSQL server (``100`` by
+        default) minus the connections of other clients.
+        '''
+        return self._config.getint(self._section, 'gevent_pool_size')
+
+    @gevent_pool_size.setter
+    def gevent_pool_size(self, value):
+        if not isinstance(value, int):
+            raise TypeError(
+                'Configuration parameter "gevent_pool_size" must have '
+                'type int.'
+            )
+        self._config.set(self._section, 'gevent_pool_size', str(value))
+
+    @property
+    def segmentation_tile_cache_memory_size(self):
+        '''int: maximal size of segmentation layer tiles kept in memory by
+        each worker process in megabytes; ``0`` disables the cache
+        (default: ``128``)
+        '''
+        return self._config.getint(
+            self._section, 'segmentation_tile_cache_memory_size'
+        )
+
+    @segmentation_tile_cache_memory_size.setter
+    def segmentation_tile_cache_memory_size(self, value):
+        if not isinstance(value, int):
+            raise TypeError(
+                'Configuration parameter '
+                '"segmentation_tile_cache_memory_size" must have type int.'
+            )
+        self._config.set(
+            self._section, 'segmentation_tile_cache_memory_size', str(value)
+        )
+
+    @property
+    def segmentation_tile_cache_disk_size(self):
+        '''int: maximal size of segmentation layer tiles kept in
+        :attr:`tile_cache_directory <tmserver.config.ServerConfig.tile_cache_directory>`
+        in megabytes; ``0`` disables the disk tier (default: ``1024``)
+        '''
+        return self._config.getint(
+            self._section, 'segmentation_tile_cache_disk_size'
+        )
+
+    @segmentation_tile_cache_disk_size.setter
+    def segmentation_tile_cache_disk_size(self, value):
+        if not isinstance(value, int):
+            raise TypeError(
+                'Configuration parameter '
+                '"segmentation_tile_cache_disk_size" must have type int.'
+            )
+        self._config.set(
+            self._section, 'segmentation_tile_cache_disk_size', str(value)
+        )
+
+    @property
+    def segmentation_density_zoom_levels(self):
+        '''int: number of zoom levels below the maximal zoom level from
+        which on segmentation layer tiles represent mapobjects by a grid of
+        object counts rather than by their outlines; ``0`` disables density
+        grids (default: ``0``)
+
+        Note
+        ----
+        Density grids are not supported by the viewer yet, so they should
+        only be enabled for clients that can render them.
+        '''
+        return self._config.getint(
+            self._section, 'segmentation_density_zoom_levels'
+        )
+
+    @segmentation_density_zoom_levels.setter
+    def segmentation_density_zoom_levels(self, value):
+        if not isinstance(value, int):
+            raise TypeError(
+                'Configuration parameter "segmentation_density_zoom_levels" '
+                'must have type int.'
+            )
+        self._config.set(
+            self._section, 'segmentation_density_zoom_levels', str(value)
+        )
+
+    @property
+    def tool_result_label_cache_size(self):
+        '''int: maximal number of tool results per worker process whose
+        labels are kept in memory for labeling segmentation layer tiles;
+        ``0`` disables the cache (default: ``16``)
+        '''
+        return self._config.getint(
+            self._section, 'tool_result_label_cache_size'
+        )
+
+    @tool_result_label_cache_size.setter
+    def tool_result_label_cache_size(self, value):
+        if not isinstance(value, int):
+            raise TypeError(
+                'Configuration parameter "tool_result_label_cache_size" '
+                'must have type int.'
+            )
+        self._config.set(
+            self._section, 'tool_result_label_cache_size', str(value)
+        )
+
+    @property
+    def segmentation_tile_pack_directory(self):
+        '''str: absolute path to the directory of materialized segmentation
+        layer tiles, which are built with ``tm_segmentation_tiles``; binary
+        tiles are only served from the database when empty (default: ``""``)
+
+        Note
+        ----
+        Layers must be materialized again when
+        :attr:`segmentation_density_zoom_levels <tmserver.config.ServerConfig.segmentation_density_zoom_levels>`
+        changes.
+        '''
+        return self._config.get(
+            self._section, 'segmentation_tile_pack_directory'
+        )
+
+    @segmentation_tile_pack_directory.setter
+    def segmentation_tile_pack_directory(self, value):
+        if not isinstance(value, basestring):
+            raise TypeError(
+                'Configuration parameter "segmentation_tile_pack_directory" '
+                'must have type str.'
+            )
+        self._config.set(
+            self._section, 'segmentation_tile_pack_directory', str(value)
+        )
+
+    @property
+    def segmentation_tile_materialization_delay(self):
+        '''int: number of seconds without further segmentations being added
+        to a segmentation layer after which its tiles get materialized in
+        the background; ``0`` disables automatic materialization
+        (default: ``120``)
+        '''
+        return self._config.getint(
+            self._section, 'segmentation_tile_materialization_delay'
+        )
+
+    @segmentation_tile_materialization_delay.setter
+    def segmentation_tile_materialization_delay(self, value):
+        if not isinstance(value, int):
+            raise TypeError(
+                'Configuration parameter '
+                '"segmentation_tile_materialization_delay" must have type int.'
+            )
+        self._config.set(
+            self._section, 'segmentation_tile_materialization_delay',
+            str(value)
+        )
+
+    @property
+    def segmentation_tile_materialization_processes(self):
+        '''int: number of processes that render the tiles of a segmentation
+        layer during its materialization (default: ``4``)
+        '''
+        return self._config.getint(
+            self._section, 'segmentation_tile_materialization_processes'
+        )
+
+    @segmentation_tile_materialization_processes.setter
+    def segmentation_tile_materialization_processes(self, value):
+        if not isinstance(value, int):
+            raise TypeError(
+                'Configuration parameter '
+                '"segmentation_tile_materialization_processes" must have '
+                'type int.'
+            )
+        self._config.set(
+            self._section, 'segmentation_tile_materialization_processes',
+            str(value)
+        )
+
+    @property
+    def segmentation_extraction_processes(self):
+        '''int: number of processes that extract the polygons of the
+        mapobjects of a label image upon ingest of segmentations; ``1``
+        extracts polygons in the server process (default: ``1``)
+
+        Note
+        ----
+        Each worker process of the server starts its own processes upon the
+        first ingest. Cooperative *gevent* workers only support ``1``.
+        '''
+        return self._config.getint(
+            self._section, 'segmentation_extraction_processes'
+        )
+
+    @segmentation_extraction_processes.setter
+    def segmentation_extraction_processes(self, value):
+        if not isinstance(value, int):
+            raise TypeError(
+                'Configuration parameter '
+                '"segmentation_extraction_processes" must have type int.'
+            )
+        if value < 1:
+            raise ValueError(
+                'Configuration parameter '
+                '"segmentation_extraction_processes" must be positive.'
+            )
+        self._config.set(
+            self._section, 'segmentation_extraction_processes', str(value)
+        )
+
+    @property
+    def response_compression_level(self):
+        '''int: level between ``1`` (fastest) and ``9`` (smallest) at which
+        JSON and CSV responses are compressed for clients that accept
+        compressed responses; ``0`` disables compression (default: ``6``)
+        '''
+        return self._config.getint(
+            self._section, 'response_compression_level'
+        )
+
+    @response_compression_level.setter
+    def response_compression_level(self, value):
+        if not isinstance(value, int):
+            raise TypeError(
+                'Configuration parameter "response_compression_level" must '
+                'have type int.'
+            )
+        if not 0 <= value <= 9:
+            raise ValueError(
+                'Configuration parameter "response_compression_level" must '
+                'be between 0 and 9.'
+            )
+        self._config.set(
+            self._section, 'response_compression_level', str(value)
+        )
+
+    @property
+    def response_compression_min_size(self):
+        '''int: minimal size in bytes of JSON and CSV responses that get
+        compressed (default: ``1024``)
+        '''
+        return self._config.getint(
+            self._section, 'response_compression_min_size'
+        )
+
+    @response_compression_min_size.setter
+    def response_compression_min_size(self, value):
+        if not isinstance(value, int):
+            raise TypeError(
+                'Configuration parameter "response_compression_min_size" '
+                'must have type int.'
+            )
+        self._config.set(
+            self._section, 'response_compression_min_size', str(value)
+        )
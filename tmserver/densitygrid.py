@@ -0,0 +1,151 @@
+# TmServer - TissueMAPS server application.
+# Copyright (C) 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Aggregation of mapobjects into grids of object counts, which represent
+segmentation layers at zoom levels where individual objects can't be
+distinguished.
+
+A grid is encoded either as JSON object::
+
+    {
+        "type": "DensityGrid",
+        "bbox": [minx, miny, maxx, maxy],
+        "shape": [rows, columns],
+        "counts": [...]
+    }
+
+or in binary form, which starts with a header of 44 bytes::
+
+    magic "TMDG" | format version (uint16) | padding (uint16) |
+    rows (uint32) | columns (uint32) | minx, miny, maxx, maxy (float64)
+
+followed by the counts (uint32). Counts are in row-major order, where the
+first row is at the top of the tile, i.e. at *maxy*. All numbers of the
+binary form are little-endian.
+"""
+import json
+import struct
+import numpy as np
+
+#: media type of binary density grids
+MIMETYPE = 'application/vnd.tissuemaps.density-grid'
+
+_MAGIC = 'TMDG'
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct('<4sHxxII4d')
+
+
+def compute_density_grid(x, y, bbox, shape):
+    """Counts points per cell of a regular grid.
+
+    Parameters
+    ----------
+    x: numpy.ndarray[float]
+        *x* coordinates of the points
+    y: numpy.ndarray[float]
+        *y* coordinates of the points
+    bbox: Tuple[float, float, float, float]
+        *minx*, *miny*, *maxx* and *maxy* of the area covered by the grid
+    shape: Tuple[int, int]
+        number of rows and columns of the grid
+
+    Returns
+    -------
+    numpy.ndarray[numpy.uint32]
+        number of points per cell, where the first row is at *maxy*
+    """
+    minx, miny, maxx, maxy = bbox
+    rows = (maxy - np.asarray(y, dtype=np.float64)) * (
+        shape[0] / float(maxy - miny)
+    )
+    columns = (np.asarray(x, dtype=np.float64) - minx) * (
+        shape[1] / float(maxx - minx)
+    )
+    counts, _, _ = np.histogram2d(
+        rows, columns, bins=shape, range=[[0, shape[0]], [0, shape[1]]]
+    )
+    return counts.astype(np.uint32)
+
+
+def encode_density_grid(counts, bbox):
+    """Encodes a grid in binary form.
+
+    Parameters
+    ----------
+    counts: numpy.ndarray[numpy.uint32]
+        number of points per cell
+    bbox: Tuple[float, float, float, float]
+        *minx*, *miny*, *maxx* and *maxy* of the area covered by the grid
+
+    Returns
+    -------
+    str
+        encoded grid
+    """
+    header = _HEADER.pack(
+        _MAGIC, _FORMAT_VERSION, counts.shape[0], counts.shape[1], *bbox
+    )
+    return header + counts.astype('<u4').tostring()
+
+
+def decode_density_grid(data):
+    """Decodes a grid in binary form.
+
+    Parameters
+    ----------
+    data: str
+        encoded grid
+
+    Returns
+    -------
+    Tuple[numpy.ndarray[numpy.uint32], Tuple[float, float, float, float]]
+        number of points per cell and bounding box of the grid
+
+    Raises
+    ------
+    ValueError
+        when `data` is not a density grid of a supported format version
+    """
+    if len(data) < _HEADER.size:
+        raise ValueError('Data is not a supported density grid.')
+    magic, format_version, rows, columns, minx, miny, maxx, maxy = \
+        _HEADER.unpack_from(data, 0)
+    if magic != _MAGIC or format_version != _FORMAT_VERSION:
+        raise ValueError('Data is not a supported density grid.')
+    counts = np.frombuffer(data, '<u4', rows * columns, _HEADER.size)
+    return (counts.reshape(rows, columns), (minx, miny, maxx, maxy))
+
+
+def encode_density_grid_as_json(counts, bbox):
+    """Encodes a grid as JSON object.
+
+    Parameters
+    ----------
+    counts: numpy.ndarray[numpy.uint32]
+        number of points per cell
+    bbox: Tuple[float, float, float, float]
+        *minx*, *miny*, *maxx* and *maxy* of the area covered by the grid
+
+    Returns
+    -------
+    str
+        encoded grid
+    """
+    return json.dumps({
+        'type': 'DensityGrid',
+        'bbox': list(bbox),
+        'shape': list(counts.shape),
+        'counts': counts.ravel().tolist()
+    })
@@ -18,5 +18,17 @@ from tmserver.extensions.auth import jwt
 from tmserver.extensions.gc3pie import GC3Pie
 gc3pie = GC3Pie()
 
+from tmserver.extensions.tilecache import TileCache
+channel_tile_cache = TileCache('channel_tile_cache')
+segmentation_tile_cache = TileCache('segmentation_tile_cache')
+
+from tmserver.extensions.prefetch import TilePrefetcher
+channel_tile_prefetcher = TilePrefetcher('channel_tile_prefetcher')
+
+from tmserver.extensions.materializer import TileMaterializer
+segmentation_tile_materializer = TileMaterializer(
+    'segmentation_tile_materializer'
+)
+
 # from flask_uwsgi_websocket import GeventWebSocket
 # websocket = GeventWebSocket()
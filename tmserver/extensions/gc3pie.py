@@ -272,6 +272,39 @@ class GC3Pie(object):
             task_id = None
         return task_id
 
+    def get_completion_marker(self, experiment_id):
+        """Gets a marker of the tasks that terminated for the given
+        `experiment`, which changes whenever another task terminates or a
+        terminated task gets resubmitted. Tasks of tools are ignored, since
+        they don't modify layers.
+
+        Parameters
+        ----------
+        experiment_id: int
+            ID of the processed
+            :class:`Experiment <tmlib.models.experiment.Experiment>`
+
+        Returns
+        -------
+        str
+            number of terminated tasks and the time the most recent of them
+            was updated
+        """
+        with tm.utils.MainSession() as session:
+            n_terminated, updated_at = session.query(
+                    func.count(tm.Task.id), func.max(tm.Task.updated_at)
+                ).\
+                join(tm.Submission, tm.Task.submission_id == tm.Submission.id).\
+                filter(
+                    tm.Submission.experiment_id == experiment_id,
+                    tm.Submission.program != 'tool',
+                    tm.Task.state == 'TERMINATED'
+                ).\
+                one()
+        if updated_at is None:
+            return '0'
+        return '%d-%s' % (n_terminated, updated_at.isoformat())
+
     def retrieve_most_recent_task(self, experiment_id, program):
         """Retrieves the top level task for the given `experiment`
         from the store that was most recently submitted by `program`.
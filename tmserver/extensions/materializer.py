@@ -0,0 +1,194 @@
+# TmServer - TissueMAPS server application.
+# Copyright (C) 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Background materialization of segmentation layer tiles after ingest."""
+import os
+import time
+import logging
+import threading
+import subprocess
+
+from flask import current_app
+
+from tmserver.util import which
+
+logger = logging.getLogger(__name__)
+
+
+class TileMaterializer(object):
+
+    """A Flask extension that materializes the tiles of segmentation layers
+    once segmentations stopped being added to them.
+
+    Segmentations are added site by site, so a layer is only materialized
+    when it hasn't been invalidated for a while. Layers are materialized by
+    ``tm_segmentation_tiles`` processes, which are started by a background
+    thread of each worker process. Materializations of the same layer that
+    are started by several worker processes are serialized and all but the
+    first one find the layer up to date.
+    """
+
+    def __init__(self, name):
+        """
+        Parameters
+        ----------
+        name: str
+            name of the extension, which must be unique for an application
+        """
+        self.name = name
+        self._lock = threading.Lock()
+
+    def init_app(self, app, cache, delay=0, n_processes=1,
+            check_interval=10):
+        """Configures materialization. The background thread is only started
+        once layers get scheduled, such that each forked worker process gets
+        its own thread.
+
+        Parameters
+        ----------
+        app: flask.Flask
+            flask application
+        cache: tmserver.extensions.tilecache.TileCache
+            cache of segmentation layer tiles, whose layer versions tell
+            when layers were last invalidated
+        delay: int, optional
+            number of seconds a layer must not have been invalidated before
+            it gets materialized; materialization is disabled when ``0``
+            (default: ``0``)
+        n_processes: int, optional
+            number of processes that render the tiles of a layer
+            (default: ``1``)
+        check_interval: int, optional
+            number of seconds between checks of scheduled layers
+            (default: ``10``)
+        """
+        logger.info('initializing tile materializer "%s" ...', self.name)
+        executable = which('tm_segmentation_tiles')
+        if delay > 0 and executable is None:
+            logger.warn(
+                'cannot find "tm_segmentation_tiles" on the shell search '
+                'PATH, segmentation tiles won\'t be materialized'
+            )
+            delay = 0
+        app.extensions[self.name] = {
+            'app': app,
+            'cache': cache,
+            'delay': delay,
+            'n_processes': n_processes,
+            'check_interval': min(check_interval, delay),
+            'executable': executable,
+            'pending': set(),
+            'processes': list(),
+            'pid': None,
+        }
+
+    @property
+    def _state(self):
+        return current_app.extensions[self.name]
+
+    @property
+    def enabled(self):
+        """bool: whether layers get materialized"""
+        return self._state['delay'] > 0
+
+    def _start(self, state):
+        # Threads don't survive forking, therefore each process starts its
+        # own thread.
+        pid = os.getpid()
+        if state['pid'] == pid:
+            return
+        with self._lock:
+            if state['pid'] == pid:
+                return
+            logger.debug('start tile materializer "%s"', self.name)
+            state['pending'] = set()
+            state['processes'] = list()
+            thread = threading.Thread(
+                target=self._run, args=(state, ), name=self.name
+            )
+            thread.daemon = True
+            thread.start()
+            state['pid'] = pid
+
+    def _run(self, state):
+        while True:
+            time.sleep(state['check_interval'])
+            # Reap finished materializations.
+            state['processes'] = [
+                p for p in state['processes'] if p.poll() is None
+            ]
+            now = time.time()
+            with state['app'].app_context():
+                for key in list(state['pending']):
+                    experiment_id, segmentation_layer_id = key
+                    _, last_modified = state['cache'].get_version(
+                        experiment_id, segmentation_layer_id
+                    )
+                    if now - last_modified < state['delay']:
+                        continue
+                    state['pending'].discard(key)
+                    try:
+                        self._materialize(
+                            state, experiment_id, segmentation_layer_id
+                        )
+                    except OSError:
+                        logger.exception(
+                            'starting materialization of segmentation layer '
+                            '%d failed', segmentation_layer_id
+                        )
+
+    def _materialize(self, state, experiment_id, segmentation_layer_id):
+        logger.info(
+            'materialize tiles of segmentation layer %d of experiment %d',
+            segmentation_layer_id, experiment_id
+        )
+        with open(os.devnull, 'w') as devnull:
+            process = subprocess.Popen(
+                [
+                    state['executable'], 'materialize', str(experiment_id),
+                    '--segmentation-layer-id', str(segmentation_layer_id),
+                    '--processes', str(state['n_processes'])
+                ],
+                stdout=devnull, stderr=devnull, close_fds=True
+            )
+        state['processes'].append(process)
+
+    def schedule(self, experiment_id, segmentation_layer_id):
+        """Schedules a layer for materialization once it hasn't been
+        invalidated for the configured delay.
+
+        Parameters
+        ----------
+        experiment_id: int
+            ID of the experiment
+        segmentation_layer_id: int
+            ID of the segmentation layer
+        """
+        state = self._state
+        if state['delay'] <= 0:
+            return
+        self._start(state)
+        state['pending'].add((experiment_id, segmentation_layer_id))
+
+    @property
+    def stats(self):
+        """dict: number of scheduled layers and running materializations"""
+        state = self._state
+        return {
+            'pending': len(state['pending']),
+            'running': len([
+                p for p in state['processes'] if p.poll() is None
+            ]),
+        }
@@ -0,0 +1,227 @@
+# TmServer - TissueMAPS server application.
+# Copyright (C) 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Background prefetching of pyramid tiles into a tile cache."""
+import os
+import time
+import logging
+import threading
+import collections
+import multiprocessing
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+
+def get_neighbor_tile_coordinates(z, y, x):
+    """Gets the coordinates of the tiles that are likely requested after a
+    given tile, i.e. the ring of tiles surrounding it at the same zoom level
+    and its children at the next zoom level.
+
+    Parameters
+    ----------
+    z: int
+        zero-based zoom level index
+    y: int
+        zero-based row index
+    x: int
+        zero-based column index
+
+    Returns
+    -------
+    List[Tuple[int, int, int]]
+        *z*, *y*, *x* coordinates of the neighboring tiles
+    """
+    coordinates = [
+        (z, y + i, x + j)
+        for i in (-1, 0, 1) for j in (-1, 0, 1)
+        if (i != 0 or j != 0) and y + i >= 0 and x + j >= 0
+    ]
+    coordinates.extend([
+        (z + 1, 2 * y + i, 2 * x + j) for i in (0, 1) for j in (0, 1)
+    ])
+    return coordinates
+
+
+class TilePrefetcher(object):
+
+    """A Flask extension that loads tiles into a cache in a background
+    thread of each worker process.
+
+    The number of pending tiles is bounded by a budget per process. Requests
+    for prefetching are dropped when the budget is exhausted or the load of
+    the machine is high, such that prefetching never competes with requests
+    of clients.
+    """
+
+    def __init__(self, name):
+        """
+        Parameters
+        ----------
+        name: str
+            name of the extension, which must be unique for an application
+        """
+        self.name = name
+        self._lock = threading.Lock()
+
+    def init_app(self, app, budget=0, max_load=1.0, max_batch_size=64):
+        """Configures prefetching. The background thread is only started
+        once tiles get scheduled, such that each forked worker process gets
+        its own thread.
+
+        Parameters
+        ----------
+        app: flask.Flask
+            flask application
+        budget: int, optional
+            maximal number of pending tiles per process; prefetching is
+            disabled when ``0`` (default: ``0``)
+        max_load: float, optional
+            maximal one minute load average per CPU up to which tiles get
+            prefetched (default: ``1.0``)
+        max_batch_size: int, optional
+            maximal number of tiles that get loaded at once (default: ``64``)
+        """
+        logger.info('initializing tile prefetcher "%s" ...', self.name)
+        app.extensions[self.name] = {
+            'app': app,
+            'budget': budget,
+            'max_load': max_load * multiprocessing.cpu_count(),
+            'max_batch_size': max_batch_size,
+            'pending': collections.OrderedDict(),
+            'condition': threading.Condition(),
+            'pid': None,
+            'load_checked_at': 0,
+            'overloaded': False,
+            'scheduled': 0,
+            'dropped': 0,
+        }
+
+    @property
+    def _state(self):
+        return current_app.extensions[self.name]
+
+    @property
+    def enabled(self):
+        """bool: whether tiles get prefetched"""
+        return self._state['budget'] > 0
+
+    def _is_overloaded(self, state):
+        now = time.time()
+        if now - state['load_checked_at'] >= 1:
+            state['load_checked_at'] = now
+            try:
+                load = os.getloadavg()[0]
+            except OSError:
+                load = 0
+            state['overloaded'] = load > state['max_load']
+        return state['overloaded']
+
+    def _start(self, state):
+        # Threads don't survive forking, therefore each process starts its
+        # own thread.
+        pid = os.getpid()
+        if state['pid'] == pid:
+            return
+        with self._lock:
+            if state['pid'] == pid:
+                return
+            logger.debug('start tile prefetcher "%s"', self.name)
+            state['pending'].clear()
+            state['condition'] = threading.Condition()
+            thread = threading.Thread(
+                target=self._run, args=(state, ), name=self.name
+            )
+            thread.daemon = True
+            thread.start()
+            state['pid'] = pid
+
+    def _run(self, state):
+        condition = state['condition']
+        while True:
+            with condition:
+                while not state['pending']:
+                    condition.wait()
+                batch = collections.defaultdict(list)
+                for _ in range(min(len(state['pending']),
+                                   state['max_batch_size'])):
+                    key, _ = state['pending'].popitem(last=False)
+                    loader, experiment_id, coordinate = key
+                    batch[(loader, experiment_id)].append(coordinate)
+            for (loader, experiment_id), coordinates in batch.iteritems():
+                logger.debug(
+                    'prefetch %d tiles of experiment %d',
+                    len(coordinates), experiment_id
+                )
+                try:
+                    with state['app'].app_context():
+                        loader(experiment_id, coordinates)
+                except Exception:
+                    logger.exception('prefetching tiles failed')
+
+    def schedule(self, experiment_id, coordinates, loader):
+        """Schedules tiles for prefetching unless the budget is exhausted or
+        the machine is under load.
+
+        Parameters
+        ----------
+        experiment_id: int
+            ID of the experiment
+        coordinates: List[Tuple[int]]
+            layer ID and *z*, *y*, *x* coordinates of each tile
+        loader: function
+            function that gets called in the background with the experiment
+            ID and a list of the scheduled coordinates and loads the
+            respective tiles into the cache
+
+        Returns
+        -------
+        int
+            number of scheduled tiles
+        """
+        state = self._state
+        if state['budget'] <= 0:
+            return 0
+        if self._is_overloaded(state):
+            state['dropped'] += len(coordinates)
+            return 0
+        self._start(state)
+        n = 0
+        with state['condition']:
+            pending = state['pending']
+            for i, c in enumerate(coordinates):
+                key = (loader, experiment_id, tuple(c))
+                if key in pending:
+                    continue
+                if len(pending) >= state['budget']:
+                    state['dropped'] += len(coordinates) - i
+                    break
+                pending[key] = None
+                n += 1
+            if n > 0:
+                state['condition'].notify()
+        state['scheduled'] += n
+        return n
+
+    @property
+    def stats(self):
+        """dict: number of pending, scheduled and dropped tiles"""
+        state = self._state
+        return {
+            'pending': len(state['pending']),
+            'scheduled': state['scheduled'],
+            'dropped': state['dropped'],
+        }
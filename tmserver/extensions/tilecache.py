@@ -0,0 +1,880 @@
+# TmServer - TissueMAPS server application.
+# Copyright (C) 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tiered caching of pyramid tiles.
+
+Tiles are immutable once a pyramid has been built, so they can be kept close
+to the server process: a bounded in-process LRU tier is backed by a tier on
+local disk, which is shared between all worker processes of a host.
+
+Each layer carries a *version* that is incremented whenever the layer is
+invalidated, e.g. because its pyramid gets rebuilt. Since pyramids are built
+by workflows that run outside of the server, the cache compares a marker of
+the state of the workflow tasks in the database against the marker recorded
+at the last invalidation and invalidates all layers of an experiment once it
+changed. Callers read the version
+once before they read the data of a tile and store the tile under that
+version, such that stale entries are never served again, not even by other
+worker processes that still hold them in memory, and tiles that were read
+while the layer got invalidated end up under the outdated version.
+"""
+import os
+import errno
+import shutil
+import logging
+import tempfile
+import threading
+import time
+import collections
+import numpy as np
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryTileStore(object):
+
+    """Bounded in-process store for tiles with least-recently-used eviction.
+
+    Keys are indexed by their first two elements, i.e. experiment and layer,
+    such that the tiles of a layer can be discarded without scanning the
+    whole store.
+    """
+
+    def __init__(self, max_size):
+        """
+        Parameters
+        ----------
+        max_size: int
+            maximal total size of stored tiles in bytes
+        """
+        self.max_size = max_size
+        self.size = 0
+        self._items = collections.OrderedDict()
+        self._layers = collections.defaultdict(set)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        """Gets a tile and marks it as most recently used.
+
+        Parameters
+        ----------
+        key: tuple
+            tile key
+
+        Returns
+        -------
+        str
+            tile data or ``None`` if `key` is not stored
+        """
+        with self._lock:
+            try:
+                data = self._items.pop(key)
+            except KeyError:
+                return None
+            self._items[key] = data
+            return data
+
+    def set(self, key, data):
+        """Stores a tile and evicts least recently used tiles until the store
+        fits its size budget again.
+
+        Parameters
+        ----------
+        key: tuple
+            tile key
+        data: str
+            tile data
+        """
+        n = len(data)
+        if n > self.max_size:
+            return
+        with self._lock:
+            previous = self._items.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._items[key] = data
+            self._layers[key[:2]].add(key)
+            self.size += n
+            while self.size > self.max_size:
+                evicted_key, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+                self._unindex(evicted_key)
+
+    def _unindex(self, key):
+        keys = self._layers.get(key[:2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._layers[key[:2]]
+
+    def discard(self, prefix):
+        """Removes all tiles whose key starts with `prefix`.
+
+        Parameters
+        ----------
+        prefix: tuple
+            leading elements of tile keys
+        """
+        n = len(prefix)
+        with self._lock:
+            if n >= 2:
+                candidates = self._layers.get(prefix[:2], ())
+            else:
+                candidates = self._items
+            for key in [k for k in candidates if k[:n] == prefix]:
+                self.size -= len(self._items.pop(key))
+                self._unindex(key)
+
+    def clear(self):
+        """Removes all tiles."""
+        with self._lock:
+            self._items.clear()
+            self._layers.clear()
+            self.size = 0
+
+
+class DiskTileStore(object):
+
+    """Store for tiles on the local file system with a size budget.
+
+    Every key element becomes a path component. Files are written atomically
+    such that concurrent readers in other processes never see partial tiles.
+    When the store exceeds its budget, the least recently accessed tiles are
+    removed until it uses 90% of the budget.
+    """
+
+    def __init__(self, directory, max_size):
+        """
+        Parameters
+        ----------
+        directory: str
+            absolute path to the root directory of the store
+        max_size: int
+            maximal total size of stored tiles in bytes
+        """
+        self.directory = directory
+        self.max_size = max_size
+        if not os.path.exists(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+        # Remove tiles whose discard got interrupted.
+        for name in os.listdir(self.directory):
+            if name.startswith('.discard-'):
+                shutil.rmtree(
+                    os.path.join(self.directory, name), ignore_errors=True
+                )
+        self.size = self._compute_size()
+        self._lock = threading.Lock()
+
+    def _compute_size(self, directory=None):
+        size = 0
+        for root, dirs, files in os.walk(directory or self.directory):
+            for f in files:
+                try:
+                    size += os.path.getsize(os.path.join(root, f))
+                except OSError:
+                    # Removed concurrently by another process.
+                    continue
+        return size
+
+    def _get_path(self, key):
+        return os.path.join(self.directory, *[str(k) for k in key])
+
+    def get(self, key):
+        """Gets a tile.
+
+        Parameters
+        ----------
+        key: tuple
+            tile key
+
+        Returns
+        -------
+        str
+            tile data or ``None`` if `key` is not stored
+        """
+        path = self._get_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # Modification time serves as access time for eviction, because
+            # file systems are frequently mounted with "noatime".
+            os.utime(path, None)
+        except (IOError, OSError):
+            return None
+        return data
+
+    def set(self, key, data):
+        """Stores a tile.
+
+        Parameters
+        ----------
+        key: tuple
+            tile key
+        data: str
+            tile data
+        """
+        path = self._get_path(key)
+        dirname = os.path.dirname(path)
+        try:
+            if not os.path.exists(dirname):
+                try:
+                    os.makedirs(dirname)
+                except OSError as err:
+                    if err.errno != errno.EEXIST:
+                        raise
+            fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.rename(tmp_path, path)
+        except (IOError, OSError) as err:
+            logger.warn('could not write tile to disk cache: %s', err)
+            return
+        with self._lock:
+            self.size += len(data)
+            if self.size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        entries = list()
+        for root, dirs, files in os.walk(self.directory):
+            for f in files:
+                path = os.path.join(root, f)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        self.size = sum(e[1] for e in entries)
+        target = int(0.9 * self.max_size)
+        logger.debug(
+            'evict tiles from disk cache: %d of %d bytes used',
+            self.size, self.max_size
+        )
+        for mtime, size, path in sorted(entries):
+            if self.size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self.size -= size
+
+    def discard(self, prefix):
+        """Removes all tiles whose key starts with `prefix`.
+
+        Parameters
+        ----------
+        prefix: tuple
+            leading elements of tile keys
+        """
+        path = self._get_path(prefix)
+        # The directory is moved out of the way first, such that its size
+        # can be determined without tiles being added concurrently.
+        try:
+            removed_path = tempfile.mkdtemp(
+                dir=self.directory, prefix='.discard-'
+            )
+        except (IOError, OSError) as err:
+            logger.warn('could not discard tiles from disk cache: %s', err)
+            return
+        try:
+            os.rename(path, os.path.join(removed_path, 'tiles'))
+        except OSError:
+            # Nothing is stored for the prefix.
+            os.rmdir(removed_path)
+            return
+        size = self._compute_size(removed_path)
+        shutil.rmtree(removed_path, ignore_errors=True)
+        with self._lock:
+            self.size = max(self.size - size, 0)
+
+
+class LayerVersions(object):
+
+    """Versions of layers that are incremented upon invalidation.
+
+    When a `directory` is provided, versions are kept as files, whose content
+    is the version number and whose modification time is the time the version
+    was created. This way, all worker processes of a host share the same
+    versions, which also survive restarts of the server. Version files are
+    re-read at most every `refresh_interval` seconds.
+
+    Versions don't start at ``0`` but at the time they were created in
+    milliseconds since the epoch and are incremented to at least the time of
+    the invalidation. Versions that get lost, because the directory got
+    cleared or because they were only kept in memory of a previous process,
+    are thus never reused, such that entity tags of previously served tiles
+    can't match tiles of another version.
+
+    In addition, a *marker* of the data of each experiment can be recorded,
+    which is compared against the database to detect changes of the data
+    that happened outside of the server (see :class:`TileCache`).
+    """
+
+    def __init__(self, directory=None, refresh_interval=2):
+        """
+        Parameters
+        ----------
+        directory: str, optional
+            absolute path to the directory where versions should be stored;
+            versions are only kept in memory when not provided
+        refresh_interval: int, optional
+            number of seconds a version is used before it is read again
+            from disk
+        """
+        self.directory = directory
+        self.refresh_interval = refresh_interval
+        self._versions = dict()
+        self._markers = dict()
+        self._lock = threading.Lock()
+
+    def _get_path(self, experiment_id, layer_id):
+        return os.path.join(
+            self.directory, str(experiment_id), str(layer_id)
+        )
+
+    @staticmethod
+    def _get_next_version(current, now):
+        number = int(now * 1000)
+        if current is not None:
+            number = max(number, current + 1)
+        return number
+
+    def _read(self, experiment_id, layer_id):
+        path = self._get_path(experiment_id, layer_id)
+        try:
+            with open(path, 'r') as f:
+                version = int(f.read().strip() or 0)
+            return (version, os.path.getmtime(path))
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _write(self, experiment_id, layer_id, version):
+        path = self._get_path(experiment_id, layer_id)
+        dirname = os.path.dirname(path)
+        if not os.path.exists(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(version))
+        os.rename(tmp_path, path)
+        return (version, os.path.getmtime(path))
+
+    def get(self, experiment_id, layer_id):
+        """Gets the current version of a layer.
+
+        Parameters
+        ----------
+        experiment_id: int
+            ID of the experiment
+        layer_id: int
+            ID of the layer
+
+        Returns
+        -------
+        Tuple[int, float]
+            version and the time it was created in seconds since the epoch
+        """
+        key = (experiment_id, layer_id)
+        now = time.time()
+        entry = self._versions.get(key)
+        if entry is not None and now - entry[2] < self.refresh_interval:
+            return entry[:2]
+        with self._lock:
+            if self.directory is None:
+                if entry is None:
+                    entry = (self._get_next_version(None, now), now, now)
+                    self._versions[key] = entry
+                return entry[:2]
+            version = self._read(experiment_id, layer_id)
+            if version is None:
+                version = self._write(
+                    experiment_id, layer_id,
+                    self._get_next_version(None, now)
+                )
+            self._versions[key] = version + (now, )
+            return version
+
+    def bump(self, experiment_id, layer_id):
+        """Increments the version of a layer.
+
+        Parameters
+        ----------
+        experiment_id: int
+            ID of the experiment
+        layer_id: int
+            ID of the layer
+
+        Returns
+        -------
+        Tuple[int, float]
+            new version and the time it was created in seconds since the epoch
+        """
+        key = (experiment_id, layer_id)
+        with self._lock:
+            now = time.time()
+            if self.directory is None:
+                entry = self._versions.get(key)
+                current = entry[0] if entry is not None else None
+                version = (self._get_next_version(current, now), now)
+            else:
+                current = self._read(experiment_id, layer_id)
+                if current is not None:
+                    current = current[0]
+                version = self._write(
+                    experiment_id, layer_id,
+                    self._get_next_version(current, now)
+                )
+            self._versions[key] = version + (now, )
+            return version
+
+    def _get_marker_path(self, experiment_id):
+        return os.path.join(self.directory, str(experiment_id), 'marker')
+
+    def get_marker(self, experiment_id):
+        """Gets the marker of the data an experiment had when its layers were
+        last invalidated.
+
+        Parameters
+        ----------
+        experiment_id: int
+            ID of the experiment
+
+        Returns
+        -------
+        str
+            marker or ``None`` if none was recorded
+        """
+        if self.directory is None:
+            return self._markers.get(experiment_id)
+        try:
+            with open(self._get_marker_path(experiment_id), 'r') as f:
+                return f.read()
+        except (IOError, OSError):
+            return None
+
+    def set_marker(self, experiment_id, marker):
+        """Records the marker of the data of an experiment.
+
+        Parameters
+        ----------
+        experiment_id: int
+            ID of the experiment
+        marker: str
+            marker
+        """
+        if self.directory is None:
+            self._markers[experiment_id] = marker
+            return
+        path = self._get_marker_path(experiment_id)
+        dirname = os.path.dirname(path)
+        if not os.path.exists(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(marker)
+        os.rename(tmp_path, path)
+
+    def get_layer_ids(self, experiment_id):
+        """Gets the IDs of all layers of an experiment that have a version.
+
+        Parameters
+        ----------
+        experiment_id: int
+            ID of the experiment
+
+        Returns
+        -------
+        List[int]
+        """
+        layer_ids = {
+            k[1] for k in self._versions.keys() if k[0] == experiment_id
+        }
+        if self.directory is not None:
+            path = os.path.join(self.directory, str(experiment_id))
+            if os.path.isdir(path):
+                layer_ids.update(
+                    int(f) for f in os.listdir(path) if f.isdigit()
+                )
+        return sorted(layer_ids)
+
+
+class TileOccupancy(object):
+
+    """Compact index of the tiles that exist in the pyramid of a layer.
+
+    Each zoom level is represented by a bitmap with one bit per tile position,
+    such that the index of a pyramid with a million tiles uses about 128 kB.
+    """
+
+    def __init__(self, coordinates):
+        """
+        Parameters
+        ----------
+        coordinates: Iterable[Tuple[int]]
+            *z*, *y* and *x* coordinates of all existing tiles
+        """
+        coordinates = np.array(list(coordinates), dtype=np.int64)
+        coordinates = coordinates.reshape(-1, 3)
+        self._levels = dict()
+        for z in np.unique(coordinates[:, 0]):
+            level = coordinates[coordinates[:, 0] == z]
+            height = level[:, 1].max() + 1
+            width = level[:, 2].max() + 1
+            bitmap = np.zeros((height, width), dtype=bool)
+            bitmap[level[:, 1], level[:, 2]] = True
+            self._levels[int(z)] = np.packbits(bitmap, axis=1)
+
+    def __contains__(self, coordinate):
+        z, y, x = coordinate
+        level = self._levels.get(z)
+        if level is None or y < 0 or x < 0:
+            return False
+        if y >= level.shape[0] or (x >> 3) >= level.shape[1]:
+            return False
+        return bool(level[y, x >> 3] & (0x80 >> (x & 7)))
+
+    @property
+    def nbytes(self):
+        """int: size of the index in bytes"""
+        return sum(level.nbytes for level in self._levels.itervalues())
+
+
+class TileCache(object):
+
+    """A Flask extension that caches tiles of layers in memory and on disk.
+
+    Tiles are identified by experiment, layer, their encoding and their
+    pyramid coordinates *z*, *y* and *x*.
+    """
+
+    def __init__(self, name, app=None):
+        """
+        Parameters
+        ----------
+        name: str
+            name of the cache under which its state is registered in
+            :attr:`flask.Flask.extensions`
+        app: flask.Flask, optional
+            flask application (default: ``None``)
+
+        Note
+        ----
+        The preferred way of initializing the extension is via the
+        `init_app()` method.
+
+        Examples
+        --------
+        cache = TileCache('channel_tile_cache')
+        cache.init_app(app, memory_size=2**28)
+        """
+        self.name = name
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, memory_size=0, disk_size=0, directory=None,
+            max_occupancies=512, marker_loader=None, marker_check_interval=30):
+        """Creates the cache tiers.
+
+        Parameters
+        ----------
+        app: flask.Flask
+            flask application
+        memory_size: int, optional
+            size budget of the in-memory tier in bytes; the tier is disabled
+            when ``0`` (default: ``0``)
+        disk_size: int, optional
+            size budget of the disk tier in bytes; the tier is disabled
+            when ``0`` (default: ``0``)
+        directory: str, optional
+            directory of the disk tier, which also holds the layer versions
+            (default: ``None``)
+        max_occupancies: int, optional
+            maximal number of layers whose occupancy indexes are kept in
+            memory (default: ``512``)
+        marker_loader: function, optional
+            function that is called with the ID of an experiment and returns
+            a marker of the data of the experiment as string, which changes
+            whenever the data of its layers may have changed, e.g. because a
+            workflow step terminated; all layers of the experiment get
+            invalidated when the marker differs from the one recorded at the
+            last invalidation (default: ``None``)
+        marker_check_interval: int, optional
+            number of seconds a marker is trusted before it is loaded again
+            (default: ``30``)
+        """
+        logger.info('initializing tile cache "%s" ...', self.name)
+        if directory:
+            versions = LayerVersions(os.path.join(directory, 'versions'))
+        else:
+            versions = LayerVersions()
+        if directory and disk_size:
+            disk = DiskTileStore(os.path.join(directory, 'tiles'), disk_size)
+        else:
+            disk = None
+        memory = MemoryTileStore(memory_size) if memory_size else None
+        app.extensions[self.name] = {
+            'memory': memory,
+            'disk': disk,
+            'versions': versions,
+            'occupancies': collections.OrderedDict(),
+            'max_occupancies': max_occupancies,
+            'marker_loader': marker_loader,
+            'marker_check_interval': marker_check_interval,
+            'marker_checks': dict(),
+            'stats': collections.Counter()
+        }
+
+    @property
+    def _state(self):
+        return current_app.extensions[self.name]
+
+    def get_version(self, experiment_id, layer_id):
+        """Gets the current version of a layer.
+
+        Parameters
+        ----------
+        experiment_id: int
+            ID of the experiment
+        layer_id: int
+            ID of the layer
+
+        Returns
+        -------
+        Tuple[int, float]
+            version and the time it was created in seconds since the epoch
+
+        Note
+        ----
+        All layers of the experiment get invalidated first in case the marker
+        of its data changed.
+        """
+        state = self._state
+        self._check_marker(state, experiment_id)
+        return state['versions'].get(experiment_id, layer_id)
+
+    def _check_marker(self, state, experiment_id):
+        loader = state['marker_loader']
+        if loader is None:
+            return
+        now = time.time()
+        checks = state['marker_checks']
+        last_check = checks.get(experiment_id)
+        if last_check is not None and \
+                now - last_check < state['marker_check_interval']:
+            return
+        # Concurrent requests keep using the current versions in the meantime.
+        checks[experiment_id] = now
+        try:
+            marker = loader(experiment_id)
+        except Exception:
+            logger.exception(
+                'could not load marker of experiment %d', experiment_id
+            )
+            return
+        versions = state['versions']
+        if versions.get_marker(experiment_id) != marker:
+            logger.info(
+                'data of experiment %d changed: marker "%s"',
+                experiment_id, marker
+            )
+            self.invalidate(experiment_id)
+            versions.set_marker(experiment_id, marker)
+
+    def get(self, experiment_id, layer_id, version, z, y, x, fmt='jpeg'):
+        """Gets a tile from the fastest tier that holds it.
+
+        Parameters
+        ----------
+        experiment_id: int
+            ID of the experiment
+        layer_id: int
+            ID of the layer
+        version: int
+            version of the layer (see :meth:`get_version`)
+        z: int
+            zero-based zoom level index
+        y: int
+            zero-based row index
+        x: int
+            zero-based column index
+        fmt: str, optional
+            encoding of the tile (default: ``"jpeg"``)
+
+        Returns
+        -------
+        str
+            tile data or ``None`` in case of a cache miss
+        """
+        state = self._state
+        key = (experiment_id, layer_id, version, fmt, z, y, x)
+        if state['memory'] is not None:
+            data = state['memory'].get(key)
+            if data is not None:
+                state['stats']['memory_hits'] += 1
+                return data
+        if state['disk'] is not None:
+            data = state['disk'].get(key)
+            if data is not None:
+                state['stats']['disk_hits'] += 1
+                if state['memory'] is not None:
+                    state['memory'].set(key, data)
+                return data
+        state['stats']['misses'] += 1
+        return None
+
+    def set(self, experiment_id, layer_id, version, z, y, x, data,
+            fmt='jpeg'):
+        """Stores a tile in all tiers.
+
+        Parameters
+        ----------
+        experiment_id: int
+            ID of the experiment
+        layer_id: int
+            ID of the layer
+        version: int
+            version of the layer at the time the tile data was read, which
+            must have been obtained via :meth:`get_version` *before* reading
+            the data; a tile that was read while the layer got invalidated
+            is thereby stored under the outdated version and never served
+        z: int
+            zero-based zoom level index
+        y: int
+            zero-based row index
+        x: int
+            zero-based column index
+        data: str
+            tile data
+        fmt: str, optional
+            encoding of the tile (default: ``"jpeg"``)
+        """
+        state = self._state
+        key = (experiment_id, layer_id, version, fmt, z, y, x)
+        if state['memory'] is not None:
+            state['memory'].set(key, data)
+        if state['disk'] is not None:
+            state['disk'].set(key, data)
+
+    def get_occupancy(self, experiment_id, layer_id, loader):
+        """Gets the index of the tiles that exist for a layer. The index is
+        loaded once per version of the layer, i.e. it is only rebuilt after
+        the layer got invalidated.
+
+        Parameters
+        ----------
+        experiment_id: int
+            ID of the experiment
+        layer_id: int
+            ID of the layer
+        loader: function
+            function that is called with `experiment_id` and `layer_id` when
+            the index needs to be (re)built and returns the *z*, *y* and *x*
+            coordinates of all tiles of the layer
+
+        Returns
+        -------
+        tmserver.extensions.tilecache.TileOccupancy
+        """
+        state = self._state
+        version, _ = state['versions'].get(experiment_id, layer_id)
+        key = (experiment_id, layer_id, version)
+        occupancies = state['occupancies']
+        occupancy = occupancies.pop(key, None)
+        if occupancy is None:
+            logger.debug(
+                'load tile occupancy of layer %d of experiment %d',
+                layer_id, experiment_id
+            )
+            occupancy = TileOccupancy(loader(experiment_id, layer_id))
+        occupancies[key] = occupancy
+        while len(occupancies) > state['max_occupancies']:
+            occupancies.popitem(last=False)
+        return occupancy
+
+    def invalidate(self, experiment_id, layer_id=None):
+        """Invalidates all cached tiles of a layer, e.g. because its pyramid
+        got rebuilt.
+
+        Parameters
+        ----------
+        experiment_id: int
+            ID of the experiment
+        layer_id: int, optional
+            ID of the layer; all layers of the experiment get invalidated when
+            not provided
+        """
+        state = self._state
+        if layer_id is None:
+            layer_ids = state['versions'].get_layer_ids(experiment_id)
+        else:
+            layer_ids = [layer_id]
+        for lid in layer_ids:
+            logger.info(
+                'invalidate tile cache "%s" for layer %d of experiment %d',
+                self.name, lid, experiment_id
+            )
+            state['versions'].bump(experiment_id, lid)
+            for key in state['occupancies'].keys():
+                if key[:2] == (experiment_id, lid):
+                    state['occupancies'].pop(key, None)
+            if state['memory'] is not None:
+                state['memory'].discard((experiment_id, lid))
+            if state['disk'] is not None:
+                state['disk'].discard((experiment_id, lid))
+
+    @property
+    def enabled(self):
+        """bool: whether the cache has at least one tier to store tiles in"""
+        state = self._state
+        return state['memory'] is not None or state['disk'] is not None
+
+    @property
+    def stats(self):
+        """Dict[str, Union[int, float]]: number of hits per tier and misses,
+        the fraction of lookups that were hits as well as the number and
+        total size of tiles held in memory and the size of tiles on disk
+        """
+        state = self._state
+        stats = {
+            'memory_hits': state['stats']['memory_hits'],
+            'disk_hits': state['stats']['disk_hits'],
+            'misses': state['stats']['misses'],
+        }
+        hits = stats['memory_hits'] + stats['disk_hits']
+        lookups = hits + stats['misses']
+        stats['hit_rate'] = hits / float(lookups) if lookups > 0 else 0.0
+        if state['memory'] is not None:
+            stats['memory_tiles'] = len(state['memory'])
+            stats['memory_size'] = state['memory'].size
+        if state['disk'] is not None:
+            stats['disk_size'] = state['disk'].size
+        return stats
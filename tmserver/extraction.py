@@ -0,0 +1,217 @@
+# TmServer - TissueMAPS server application.
+# Copyright (C) 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Parallel extraction of the polygons of mapobjects from label images.
+
+The label image is split into one crop per mapobject, which covers the
+bounding box of the mapobject plus a margin of one pixel and contains no
+other mapobjects. The outline of a mapobject only depends on its own
+pixels and their direct neighbours, so polygons extracted from the crops
+are the same as those extracted from the whole image, once they are
+translated by the position of the crop. Crops are distributed in batches
+across a long-lived pool of worker processes.
+"""
+import os
+import logging
+import threading
+import multiprocessing
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+#: number of mapobjects whose polygons are extracted per task of a worker
+#: process
+OBJECTS_PER_TASK = 256
+
+
+def get_object_bounding_boxes(array):
+    """Gets the bounding boxes of the mapobjects of a label image.
+
+    Parameters
+    ----------
+    array: numpy.ndarray[numpy.integer]
+        label image, where ``0`` is background
+
+    Returns
+    -------
+    Tuple[numpy.ndarray[numpy.integer], numpy.ndarray[numpy.int64]]
+        sorted labels and *y* and *x* of the first and *y* and *x* past the
+        last pixel of each mapobject with shape ``(n, 4)``
+    """
+    width = array.shape[1]
+    index = np.flatnonzero(array)
+    if len(index) == 0:
+        return (
+            np.empty((0, ), dtype=array.dtype),
+            np.empty((0, 4), dtype=np.int64)
+        )
+    values = array.ravel()[index]
+    order = np.argsort(values, kind='mergesort')
+    values = values[order]
+    index = index[order]
+    starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+    y = index // width
+    x = index % width
+    boxes = np.column_stack([
+        np.minimum.reduceat(y, starts), np.minimum.reduceat(x, starts),
+        np.maximum.reduceat(y, starts) + 1, np.maximum.reduceat(x, starts) + 1
+    ])
+    return values[starts], boxes.astype(np.int64)
+
+
+def iter_object_crops(array, labels, boxes):
+    """Crops each mapobject with a margin of one pixel out of a label image.
+
+    Parameters
+    ----------
+    array: numpy.ndarray[numpy.integer]
+        label image, where ``0`` is background
+    labels: numpy.ndarray[numpy.integer]
+        labels of mapobjects
+    boxes: numpy.ndarray[numpy.int64]
+        bounding box of each mapobject
+        (see :func:`get_object_bounding_boxes <tmserver.extraction.get_object_bounding_boxes>`)
+
+    Returns
+    -------
+    Generator[Tuple[int, int, numpy.ndarray[numpy.integer]]]
+        *y* and *x* of the first pixel of the crop within the image and the
+        crop, in which pixels of other mapobjects are background
+    """
+    height, width = array.shape
+    for label, (y0, x0, y1, x1) in zip(labels.tolist(), boxes.tolist()):
+        y0 = max(y0 - 1, 0)
+        x0 = max(x0 - 1, 0)
+        y1 = min(y1 + 1, height)
+        x1 = min(x1 + 1, width)
+        crop = array[y0:y1, x0:x1]
+        yield (y0, x0, np.where(crop == label, crop, 0))
+
+
+def _extract_polygons(args):
+    extract, crops, y_offset, x_offset = args
+    polygons = list()
+    for y, x, crop in crops:
+        polygons.extend(extract(crop, y_offset + y, x_offset + x))
+    return polygons
+
+
+class ExtractionPool(object):
+
+    """Pool of worker processes that extract polygons, which is kept for the
+    lifetime of the server process.
+
+    The worker processes are forked once by each server process upon first
+    use rather than for each request, since pools don't survive forking.
+    Pools don't work with the cooperative workers of *gevent*, whose
+    monkey patched standard library is inherited by the worker processes.
+    """
+
+    def __init__(self, n_processes):
+        """
+        Parameters
+        ----------
+        n_processes: int
+            number of worker processes
+        """
+        self.n_processes = n_processes
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        pid = os.getpid()
+        with self._lock:
+            if self._pid != pid:
+                logger.info(
+                    'start %d processes for the extraction of polygons',
+                    self.n_processes
+                )
+                self._pool = multiprocessing.Pool(self.n_processes)
+                self._pid = pid
+            return self._pool
+
+    def imap(self, func, tasks):
+        """Calls a function for each task in the worker processes.
+
+        Parameters
+        ----------
+        func: function
+            function defined at the top level of a module
+        tasks: Iterable
+            argument of each call
+
+        Returns
+        -------
+        Iterator
+            return value of each call in order of `tasks`
+        """
+        return self._get_pool().imap(func, tasks)
+
+    def close(self):
+        """Terminates the worker processes of the current process."""
+        with self._lock:
+            if self._pid == os.getpid():
+                self._pool.terminate()
+                self._pool.join()
+            self._pool = None
+            self._pid = None
+
+
+def extract_polygons(array, extract, y_offset, x_offset, pool=None):
+    """Extracts the polygons of the mapobjects of a label image in parallel.
+
+    Parameters
+    ----------
+    array: numpy.ndarray[numpy.integer]
+        label image, where ``0`` is background
+    extract: function
+        function that gets called with a label image and the *y* and *x*
+        offset of the image and returns the label and polygon of each
+        mapobject of the image; must be defined at the top level of a module,
+        such that it can be sent to worker processes
+    y_offset: int
+        *y* offset of the label image
+    x_offset: int
+        *x* offset of the label image
+    pool: tmserver.extraction.ExtractionPool, optional
+        worker processes; polygons are extracted in the calling process from
+        the whole image without a pool with more than one process or when
+        there are too few mapobjects to be worth it
+
+    Returns
+    -------
+    List[Tuple[int, shapely.geometry.Polygon]]
+        label and polygon of each mapobject
+    """
+    if pool is None or pool.n_processes <= 1:
+        return list(extract(array, y_offset, x_offset))
+    labels, boxes = get_object_bounding_boxes(array)
+    n_objects = len(labels)
+    if n_objects <= OBJECTS_PER_TASK:
+        return list(extract(array, y_offset, x_offset))
+    crops = list(iter_object_crops(array, labels, boxes))
+    tasks = [
+        (extract, crops[i:i + OBJECTS_PER_TASK], y_offset, x_offset)
+        for i in range(0, n_objects, OBJECTS_PER_TASK)
+    ]
+    logger.debug(
+        'extract polygons of %d mapobjects in %d tasks', n_objects, len(tasks)
+    )
+    polygons = list()
+    # Tasks are ordered by label and results are returned in order.
+    for result in pool.imap(_extract_polygons, tasks):
+        polygons.extend(result)
+    return polygons
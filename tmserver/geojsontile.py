@@ -0,0 +1,57 @@
+# TmServer - TissueMAPS server application.
+# Copyright (C) 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Assembly of GeoJSON feature collections from geometries that were already
+rendered as GeoJSON by the database.
+
+The geometries are spliced into the output as they are, i.e. without
+decoding and encoding them again.
+"""
+
+
+def iter_feature_collection(outlines, get_properties, chunk_size=500):
+    """Generates a GeoJSON feature collection in chunks.
+
+    Parameters
+    ----------
+    outlines: Iterable[Tuple[int, str]]
+        ID and GeoJSON geometry of each feature
+    get_properties: function
+        function that returns the properties of a feature encoded as JSON
+        object given its ID
+    chunk_size: int, optional
+        number of features per chunk (default: ``500``)
+
+    Returns
+    -------
+    Generator[str]
+        chunks of the encoded feature collection
+    """
+    yield '{"type":"FeatureCollection","features":['
+    chunk = list()
+    separator = ''
+    for feature_id, geometry in outlines:
+        chunk.append(
+            '%s{"type":"Feature","id":%d,"geometry":%s,"properties":%s}' % (
+                separator, feature_id, geometry, get_properties(feature_id)
+            )
+        )
+        separator = ','
+        if len(chunk) == chunk_size:
+            yield ''.join(chunk)
+            chunk = list()
+    if chunk:
+        yield ''.join(chunk)
+    yield ']}'
@@ -0,0 +1,101 @@
+# TmServer - TissueMAPS server application.
+# Copyright (C) 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Support for serving the application with cooperative *gevent* workers,
+e.g. ``uwsgi --gevent 100 --gevent-monkey-patch --enable-threads`` or
+``gunicorn -k gevent``.
+
+The server monkey patches the standard library, which makes sockets and
+thereby the XML-RPC client of the job daemon cooperative. Database access
+via *psycopg2* additionally requires a wait callback, which is installed by
+:func:`make_psycopg2_green`.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def is_gevent_patched():
+    """Checks whether the standard library was monkey patched by *gevent*.
+
+    Returns
+    -------
+    bool
+    """
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+
+def gevent_wait_callback(conn, timeout=None):
+    """Waits for a *psycopg2* connection in a cooperative manner, such that
+    other greenlets can run while a query is pending.
+
+    Parameters
+    ----------
+    conn: psycopg2.extensions.connection
+        database connection
+    timeout: float, optional
+        number of seconds after which waiting is aborted (default: ``None``)
+    """
+    import psycopg2
+    from psycopg2 import extensions
+    from gevent.socket import wait_read, wait_write
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise psycopg2.OperationalError(
+                'Bad result from poll: %r' % state
+            )
+
+
+def make_psycopg2_green():
+    """Makes *psycopg2* cooperative with *gevent*."""
+    from psycopg2 import extensions
+    logger.info('make database connections cooperative')
+    extensions.set_wait_callback(gevent_wait_callback)
+
+
+def run_cooperatively(func, *args, **kwargs):
+    """Calls a function that blocks without doing I/O, e.g. image encoding,
+    in the thread pool of the *gevent* hub, such that other greenlets can
+    proceed in the meantime. The function is called directly when the
+    standard library is not patched.
+
+    Parameters
+    ----------
+    func: function
+        function that releases the GIL while blocking
+    *args:
+        positional arguments of `func`
+    **kwargs:
+        keyword arguments of `func`
+
+    Returns
+    -------
+    return value of `func`
+    """
+    if not is_gevent_patched():
+        return func(*args, **kwargs)
+    import gevent
+    return gevent.get_hub().threadpool.apply(func, args, kwargs)
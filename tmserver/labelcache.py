@@ -0,0 +1,120 @@
+# TmServer - TissueMAPS server application.
+# Copyright (C) 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Process-wide cache of the labels of tool results (see
+:mod:`tmserver.labels`), which is shared by the tile and the tool endpoints.
+
+The labels of a tool result are loaded once and kept in memory, since a
+stored result never changes. They must be discarded when the result gets
+deleted.
+"""
+import logging
+
+import tmlib.models as tm
+
+from tmserver import cfg
+from tmserver.labels import LabelArray, LabelArrayCache
+from tmserver.singleflight import SingleFlight
+from tmserver.error import ResourceNotFoundError
+
+logger = logging.getLogger(__name__)
+
+#: labels of recently requested tool results
+_tool_result_labels = LabelArrayCache(cfg.tool_result_label_cache_size)
+
+#: coalesces concurrent loads of the labels of the same tool result
+_label_flights = SingleFlight()
+
+
+def _load_tool_result_labels(experiment_id, tool_result_id):
+    logger.debug('load labels of tool result %d', tool_result_id)
+    key = str(tool_result_id)
+    with tm.utils.ExperimentSession(experiment_id) as session:
+        # Labels of a result that doesn't exist (yet) must not be cached.
+        result = session.query(tm.ToolResult.id).\
+            filter_by(id=tool_result_id).\
+            one_or_none()
+        if result is None:
+            raise ResourceNotFoundError(tm.ToolResult, id=tool_result_id)
+        label_values = session.query(
+                tm.LabelValues.mapobject_id, tm.LabelValues.values[key]
+            ).\
+            filter(tm.LabelValues.values.has_key(key)).\
+            all()
+    if label_values:
+        mapobject_ids, labels = zip(*label_values)
+    else:
+        mapobject_ids, labels = (), ()
+    # Labels are sent as they are stored, like "str(label)" would for the
+    # values of HSTORE columns.
+    return LabelArray(mapobject_ids, [
+        v if isinstance(v, basestring) else str(v) for v in labels
+    ])
+
+
+def get_tool_result_labels(experiment_id, tool_result_id):
+    """Gets the labels of all mapobjects of a tool result.
+
+    Parameters
+    ----------
+    experiment_id: int
+        ID of the experiment
+    tool_result_id: int
+        ID of the tool result
+
+    Returns
+    -------
+    tmserver.labels.LabelArray
+        labels of the mapobjects
+
+    Raises
+    ------
+    tmserver.error.ResourceNotFoundError
+        when the tool result doesn't exist
+    """
+    key = (experiment_id, tool_result_id)
+    labels = _tool_result_labels.get(key)
+    if labels is None:
+        labels = _label_flights.do(
+            key, _load_tool_result_labels, experiment_id, tool_result_id
+        )
+        _tool_result_labels.set(key, labels)
+    return labels
+
+
+def discard_tool_result_labels(experiment_id, tool_result_id):
+    """Discards the cached labels of a tool result, which must be called
+    when the result gets deleted.
+
+    Parameters
+    ----------
+    experiment_id: int
+        ID of the experiment
+    tool_result_id: int
+        ID of the tool result
+    """
+    logger.debug('discard labels of tool result %d', tool_result_id)
+    _tool_result_labels.discard((experiment_id, tool_result_id))
+
+
+def get_tool_result_label_stats():
+    """Gets usage statistics of the cache.
+
+    Returns
+    -------
+    Dict[str, int]
+        see :attr:`LabelArrayCache.stats <tmserver.labels.LabelArrayCache.stats>`
+    """
+    return _tool_result_labels.stats
@@ -0,0 +1,344 @@
+# TmServer - TissueMAPS server application.
+# Copyright (C) 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""In-memory lookup tables for the labels that tool results assign to
+mapobjects.
+
+The labels of a tool result don't change once the result has been stored, so
+they can be loaded once and joined with the mapobjects of each requested tile
+by vectorized array indexing instead of querying them per tile.
+
+Labels are stored as HSTORE values, i.e. as strings, which are sent to
+clients exactly as they are stored. They are kept as categorical codes into
+a table of the distinct labels of the tool result, since tool results
+usually assign few distinct labels to many mapobjects.
+
+The labels of a tool result can be sent to clients as a label array, which
+starts with a header of 24 bytes::
+
+    magic "TMLA" | format version (uint16) | layout (uint8) | padding (uint8) |
+    offset (int64) | number of entries *n* (uint32) |
+    number of categories *m* (uint32)
+
+For the dense layout (``1``), the header is followed by the *n* codes
+(int32) of the labels of the mapobjects with IDs *offset* to
+*offset + n - 1*, where ``-1`` marks mapobjects without label. For the
+sparse layout (``0``), the header is followed by the *n* mapobject IDs
+(int64) and the codes (int32) of their labels. The codes are followed by
+the *m + 1* offsets (uint32) of the categories within the table of
+categories and by the table itself, which holds the UTF-8 encoded labels
+back to back, such that category *i* spans the bytes from offset *i* to
+offset *i + 1*. All numbers are little-endian and arrays are aligned to
+eight bytes, which allows clients to read them as typed arrays.
+"""
+import struct
+import logging
+import threading
+import collections
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+#: maximal ratio of the ID range to the number of labeled mapobjects up to
+#: which labels are stored in an array indexed by mapobject ID
+MAX_DENSE_SPARSITY = 4
+
+#: media type of label arrays
+MIMETYPE = 'application/vnd.tissuemaps.label-array'
+
+_MAGIC = 'TMLA'
+_FORMAT_VERSION = 2
+_HEADER = struct.Struct('<4sHBxqII')
+
+
+def _pad(data):
+    return data + '\0' * (-len(data) % 8)
+
+
+def _encode_label(label):
+    if isinstance(label, unicode):
+        return label.encode('utf-8')
+    return str(label)
+
+
+class LabelArray(object):
+
+    """Labels of mapobjects, which can be looked up for many mapobjects at
+    once.
+
+    Codes of labels are stored in an array indexed by mapobject ID relative
+    to the smallest ID. When the IDs are too sparse for that, e.g. because
+    the mapobjects of a type were created in several batches interleaved
+    with those of other types, codes are stored sorted by ID and looked up
+    by binary search instead.
+    """
+
+    def __init__(self, mapobject_ids, labels):
+        """
+        Parameters
+        ----------
+        mapobject_ids: Sequence[int]
+            IDs of labeled mapobjects
+        labels: Sequence[str]
+            label of each mapobject
+        """
+        mapobject_ids = np.asarray(mapobject_ids, dtype=np.int64)
+        if len(mapobject_ids) != len(labels):
+            raise ValueError('Each mapobject must have exactly one label.')
+        index = dict()
+        codes = np.array(
+            [index.setdefault(label, len(index)) for label in labels],
+            dtype=np.int32
+        )
+        #: List[str]: distinct labels, which are referred to by their codes
+        self.categories = sorted(index, key=index.get)
+        self.n_labels = len(mapobject_ids)
+        if self.n_labels == 0:
+            self.offset = 0
+            self._ids = None
+            self._codes = np.empty((0, ), dtype=np.int32)
+            return
+        self.offset = int(mapobject_ids.min())
+        span = int(mapobject_ids.max()) - self.offset + 1
+        if span <= MAX_DENSE_SPARSITY * self.n_labels:
+            self._ids = None
+            self._codes = np.full((span, ), -1, dtype=np.int32)
+            self._codes[mapobject_ids - self.offset] = codes
+        else:
+            order = np.argsort(mapobject_ids, kind='mergesort')
+            self._ids = mapobject_ids[order]
+            self._codes = codes[order]
+
+    @property
+    def is_dense(self):
+        '''bool: whether labels are indexed by mapobject ID'''
+        return self._ids is None
+
+    @property
+    def nbytes(self):
+        '''int: size of the lookup table in bytes'''
+        nbytes = self._codes.nbytes + sum(len(c) for c in self.categories)
+        if self._ids is None:
+            return nbytes
+        return nbytes + self._ids.nbytes
+
+    def lookup(self, mapobject_ids):
+        """Looks up the codes of the labels of mapobjects.
+
+        Parameters
+        ----------
+        mapobject_ids: Sequence[int]
+            IDs of mapobjects
+
+        Returns
+        -------
+        numpy.ndarray[numpy.int32]
+            index of the label of each mapobject into :attr:`categories`;
+            ``-1`` for mapobjects without label
+        """
+        mapobject_ids = np.asarray(mapobject_ids, dtype=np.int64)
+        codes = np.full(mapobject_ids.shape, -1, dtype=np.int32)
+        if len(self._codes) == 0:
+            return codes
+        if self._ids is None:
+            index = mapobject_ids - self.offset
+            found = (index >= 0) & (index < len(self._codes))
+            codes[found] = self._codes[index[found]]
+        else:
+            index = np.searchsorted(self._ids, mapobject_ids)
+            index[index == len(self._ids)] = 0
+            found = self._ids[index] == mapobject_ids
+            codes[found] = self._codes[index[found]]
+        return codes
+
+    def format(self, mapobject_ids):
+        """Looks up the labels of mapobjects.
+
+        Parameters
+        ----------
+        mapobject_ids: Sequence[int]
+            IDs of mapobjects
+
+        Returns
+        -------
+        List[str]
+            label of each mapobject as it is stored; ``None`` for mapobjects
+            without label
+        """
+        categories = self.categories + [None]
+        return [categories[c] for c in self.lookup(mapobject_ids).tolist()]
+
+
+def encode_label_array(labels):
+    """Encodes labels as label array.
+
+    Parameters
+    ----------
+    labels: tmserver.labels.LabelArray
+        labels
+
+    Returns
+    -------
+    str
+        encoded label array
+    """
+    categories = [_encode_label(c) for c in labels.categories]
+    offsets = np.cumsum([0] + [len(c) for c in categories])
+    parts = [
+        _HEADER.pack(
+            _MAGIC, _FORMAT_VERSION, int(labels.is_dense), labels.offset,
+            len(labels._codes), len(categories)
+        )
+    ]
+    if not labels.is_dense:
+        parts.append(labels._ids.astype('<i8').tostring())
+    parts.extend([
+        _pad(labels._codes.astype('<i4').tostring()),
+        _pad(offsets.astype('<u4').tostring()),
+        _pad(''.join(categories))
+    ])
+    return ''.join(parts)
+
+
+def decode_label_array(data):
+    """Decodes a label array.
+
+    Parameters
+    ----------
+    data: str
+        encoded label array
+
+    Returns
+    -------
+    tmserver.labels.LabelArray
+        labels, which are decoded from UTF-8
+
+    Raises
+    ------
+    ValueError
+        when `data` is not a label array of a supported format version
+    """
+    if len(data) < _HEADER.size:
+        raise ValueError('Data is not a supported label array.')
+    magic, format_version, is_dense, offset, n, m = \
+        _HEADER.unpack_from(data, 0)
+    if magic != _MAGIC or format_version != _FORMAT_VERSION:
+        raise ValueError('Data is not a supported label array.')
+    position = _HEADER.size
+    if is_dense:
+        mapobject_ids = np.arange(offset, offset + n, dtype=np.int64)
+    else:
+        mapobject_ids = np.frombuffer(data, '<i8', n, position)
+        position += 8 * n
+    codes = np.frombuffer(data, '<i4', n, position)
+    position += 4 * n + (-4 * n % 8)
+    offsets = np.frombuffer(data, '<u4', m + 1, position).tolist()
+    position += 4 * (m + 1) + (-4 * (m + 1) % 8)
+    categories = [
+        data[position + start:position + end].decode('utf-8')
+        for start, end in zip(offsets[:-1], offsets[1:])
+    ]
+    found = codes >= 0
+    return LabelArray(
+        mapobject_ids[found], [categories[c] for c in codes[found].tolist()]
+    )
+
+
+class LabelArrayCache(object):
+
+    """Bounded in-process store for label arrays with least-recently-used
+    eviction.
+    """
+
+    def __init__(self, max_items):
+        """
+        Parameters
+        ----------
+        max_items: int
+            maximal number of stored label arrays; ``0`` disables the cache
+        """
+        self.max_items = max_items
+        self.hits = 0
+        self.misses = 0
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        """Gets a label array and marks it as most recently used.
+
+        Parameters
+        ----------
+        key: hashable
+            identity of the tool result
+
+        Returns
+        -------
+        tmserver.labels.LabelArray
+            labels or ``None`` if `key` is not stored
+        """
+        with self._lock:
+            try:
+                labels = self._items.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self._items[key] = labels
+            self.hits += 1
+            return labels
+
+    def set(self, key, labels):
+        """Stores a label array and evicts the least recently used ones
+        beyond the bound.
+
+        Parameters
+        ----------
+        key: hashable
+            identity of the tool result
+        labels: tmserver.labels.LabelArray
+            labels
+        """
+        if self.max_items <= 0:
+            return
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = labels
+            while len(self._items) > self.max_items:
+                evicted_key, _ = self._items.popitem(last=False)
+                logger.debug('evict labels of %r', evicted_key)
+
+    def discard(self, key):
+        """Removes a label array if it is stored.
+
+        Parameters
+        ----------
+        key: hashable
+            identity of the tool result
+        """
+        with self._lock:
+            self._items.pop(key, None)
+
+    @property
+    def stats(self):
+        '''Dict[str, int]: usage statistics of the cache'''
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'items': len(self._items),
+                'size': sum(a.nbytes for a in self._items.values())
+            }
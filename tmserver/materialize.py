@@ -0,0 +1,307 @@
+# TmServer - TissueMAPS server application.
+# Copyright (C) 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Materialization of all tiles of segmentation layers into packs (see
+:mod:`tmserver.tilepack`), from which the server serves binary tiles without
+database access.
+
+Only tiles that contain mapobjects are packed, all other tiles of a
+materialized layer are empty. Tiles are rendered in parallel by a pool of
+worker processes. The progress of a materialization is recorded in a status
+file next to the pack, which is a JSON object::
+
+    {
+        "state": "running",
+        "layer_version": 3,
+        "n_tiles": 5120,
+        "n_done": 2048,
+        "updated_at": 1514764800.0
+    }
+
+where *state* is either ``"running"``, ``"done"`` or ``"failed"``.
+"""
+import os
+import json
+import time
+import fcntl
+import errno
+import logging
+import numpy as np
+from sqlalchemy import func
+
+import tmlib.models as tm
+
+from tmserver.segmentationtile import render_segmentation_layer_tile
+
+logger = logging.getLogger(__name__)
+
+#: number of tiles rendered per task of a worker process
+TILES_PER_TASK = 32
+
+
+def get_covering_tile_coordinates(bounds, z, maxzoom):
+    """Gets the coordinates of the tiles of a zoom level that are covered by
+    the bounding boxes of mapobjects.
+
+    Parameters
+    ----------
+    bounds: numpy.ndarray[numpy.float64]
+        *minx*, *miny*, *maxx* and *maxy* of each mapobject with shape
+        ``(n, 4)``
+    z: int
+        zero-based zoom level index
+    maxzoom: int
+        maximal zoom level index
+
+    Returns
+    -------
+    List[Tuple[int, int, int]]
+        sorted *z*, *y*, *x* coordinates of the covered tiles
+    """
+    if len(bounds) == 0:
+        return list()
+    # The bounding box of the first tile defines origin and signed size of
+    # the tiles of the zoom level.
+    minx, miny, maxx, maxy = tm.SegmentationLayer.get_tile_bounding_box(
+        0, 0, z, maxzoom
+    )
+    columns = np.floor((bounds[:, [0, 2]] - minx) / float(maxx - minx))
+    rows = np.floor((bounds[:, [1, 3]] - miny) / float(maxy - miny))
+    columns = np.clip(np.sort(columns, axis=1), 0, None).astype(np.int64)
+    rows = np.clip(np.sort(rows, axis=1), 0, None).astype(np.int64)
+    keys = list()
+    # Mapobjects are small compared to tiles, so most of them are covered
+    # by a single tile.
+    for i in range(int((rows[:, 1] - rows[:, 0]).max()) + 1):
+        for j in range(int((columns[:, 1] - columns[:, 0]).max()) + 1):
+            y = rows[:, 0] + i
+            x = columns[:, 0] + j
+            index = (y <= rows[:, 1]) & (x <= columns[:, 1])
+            keys.append((y[index] << 32) | x[index])
+    keys = np.unique(np.concatenate(keys))
+    return [(z, int(k >> 32), int(k & 0xffffffff)) for k in keys]
+
+
+def get_segmentation_layer_tile_coordinates(experiment_id,
+        segmentation_layer_id, maxzoom):
+    """Gets the coordinates of all tiles of a segmentation layer that contain
+    mapobjects.
+
+    Parameters
+    ----------
+    experiment_id: int
+        ID of the experiment
+    segmentation_layer_id: int
+        ID of the segmentation layer
+    maxzoom: int
+        maximal zoom level index
+
+    Returns
+    -------
+    List[Tuple[int, int, int]]
+        *z*, *y*, *x* coordinates of tiles
+    """
+    polygon = tm.MapobjectSegmentation.geom_polygon
+    with tm.utils.ExperimentSession(experiment_id) as session:
+        bounds = session.query(
+                func.ST_XMin(polygon), func.ST_YMin(polygon),
+                func.ST_XMax(polygon), func.ST_YMax(polygon)
+            ).\
+            filter_by(segmentation_layer_id=segmentation_layer_id).\
+            all()
+    bounds = np.array(bounds, dtype=np.float64).reshape(-1, 4)
+    coordinates = list()
+    for z in range(maxzoom + 1):
+        coordinates.extend(get_covering_tile_coordinates(bounds, z, maxzoom))
+    return coordinates
+
+
+def _render_tiles(args):
+    experiment_id, segmentation_layer_id, maxzoom, density_zoom_levels, \
+        coordinates = args
+    tiles = list()
+    for z, y, x in coordinates:
+        data = render_segmentation_layer_tile(
+            experiment_id, segmentation_layer_id, z, y, x, maxzoom,
+            density_zoom_levels
+        )
+        tiles.append((z, y, x, data))
+    return tiles
+
+
+def get_status_path(packs, experiment_id, segmentation_layer_id):
+    """Gets the location of the status file of a materialization.
+
+    Parameters
+    ----------
+    packs: tmserver.tilepack.TilePackStore
+        packs of segmentation layers
+    experiment_id: int
+        ID of the experiment
+    segmentation_layer_id: int
+        ID of the segmentation layer
+
+    Returns
+    -------
+    str
+        absolute path to the status file
+    """
+    return '%s.status' % packs.get_path(experiment_id, segmentation_layer_id)
+
+
+def read_status(packs, experiment_id, segmentation_layer_id):
+    """Reads the status of the last materialization of a segmentation layer.
+
+    Parameters
+    ----------
+    packs: tmserver.tilepack.TilePackStore
+        packs of segmentation layers
+    experiment_id: int
+        ID of the experiment
+    segmentation_layer_id: int
+        ID of the segmentation layer
+
+    Returns
+    -------
+    dict
+        status or ``None`` if the layer was never materialized
+    """
+    path = get_status_path(packs, experiment_id, segmentation_layer_id)
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def _write_status(path, **status):
+    status['updated_at'] = time.time()
+    # Unlike a file created by "mkstemp", the file is readable by the server
+    # unless the umask says otherwise. Only the process that holds the lock of
+    # the layer writes its status.
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(status, f)
+    os.rename(tmp_path, path)
+
+
+def materialize_segmentation_layer(packs, experiment_id,
+        segmentation_layer_id, versions, maxzoom, density_zoom_levels, pool):
+    """Renders all tiles of a segmentation layer that contain mapobjects in
+    binary form and packs them. Concurrent materializations of the same
+    layer are serialized and a layer whose pack already holds the current
+    version of the layer isn't materialized again.
+
+    Parameters
+    ----------
+    packs: tmserver.tilepack.TilePackStore
+        packs of segmentation layers
+    experiment_id: int
+        ID of the experiment
+    segmentation_layer_id: int
+        ID of the segmentation layer
+    versions: tmserver.extensions.tilecache.LayerVersions
+        versions of segmentation layers
+    maxzoom: int
+        maximal zoom level index
+    density_zoom_levels: int
+        see :func:`is_density_zoom_level <tmserver.segmentationtile.is_density_zoom_level>`
+    pool: multiprocessing.pool.Pool
+        worker processes that render tiles; workers open their own database
+        connections, so the pool must be created before the calling process
+        accesses the database (forked workers would otherwise share the
+        pooled connections of the calling process)
+
+    Returns
+    -------
+    int
+        number of packed tiles or ``None`` if the pack was already up to date
+    """
+    path = packs.get_path(experiment_id, segmentation_layer_id)
+    dirname = os.path.dirname(path)
+    if not os.path.exists(dirname):
+        try:
+            os.makedirs(dirname)
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+    status_path = get_status_path(packs, experiment_id, segmentation_layer_id)
+    with open('%s.lock' % path, 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        # The layer may have changed while waiting for another
+        # materialization.
+        layer_version, _ = versions.get(experiment_id, segmentation_layer_id)
+        pack = packs.open(experiment_id, segmentation_layer_id)
+        if pack is not None and pack.layer_version == layer_version:
+            logger.info(
+                'pack of segmentation layer %d is up to date',
+                segmentation_layer_id
+            )
+            return None
+        status = {
+            'state': 'running', 'layer_version': layer_version,
+            'n_tiles': None, 'n_done': 0
+        }
+        _write_status(status_path, **status)
+        try:
+            coordinates = get_segmentation_layer_tile_coordinates(
+                experiment_id, segmentation_layer_id, maxzoom
+            )
+            n_tiles = len(coordinates)
+            logger.info(
+                'materialize %d tiles of segmentation layer %d of '
+                'experiment %d', n_tiles, segmentation_layer_id,
+                experiment_id
+            )
+            status['n_tiles'] = n_tiles
+            _write_status(status_path, **status)
+            tasks = [
+                (
+                    experiment_id, segmentation_layer_id, maxzoom,
+                    density_zoom_levels, coordinates[i:i + TILES_PER_TASK]
+                )
+                for i in range(0, n_tiles, TILES_PER_TASK)
+            ]
+
+            def render():
+                reported_at = time.time()
+                for tiles in pool.imap_unordered(_render_tiles, tasks):
+                    for z, y, x, data in tiles:
+                        if data is not None:
+                            yield (z, y, x, data)
+                    status['n_done'] += len(tiles)
+                    if time.time() - reported_at >= 5:
+                        reported_at = time.time()
+                        logger.info(
+                            'rendered %d of %d tiles (%.0f%%)',
+                            status['n_done'], n_tiles,
+                            100.0 * status['n_done'] / n_tiles
+                        )
+                        _write_status(status_path, **status)
+
+            n = packs.build(
+                experiment_id, segmentation_layer_id, render(), layer_version
+            )
+        except:
+            status['state'] = 'failed'
+            _write_status(status_path, **status)
+            raise
+        status['state'] = 'done'
+        _write_status(status_path, **status)
+        logger.info(
+            'packed %d non-empty tiles into "%s"', n,
+            packs.get_path(experiment_id, segmentation_layer_id)
+        )
+        return n
@@ -0,0 +1,180 @@
+# TmServer - TissueMAPS server application.
+# Copyright (C) 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Streams of labeled polygons, with which clients upload the outlines of
+mapobjects.
+
+A stream is a sequence of records, one per mapobject, each of which
+consists of::
+
+    label (int32) | size of the geometry in bytes *n* (uint32) |
+    geometry (n bytes)
+
+where the geometry is a polygon in Well-Known Binary (WKB) format. The
+header of each record is little-endian, the byte order of the geometry is
+given by the WKB itself. Records are read one at a time, such that a stream
+can be processed as it arrives.
+
+Coordinates of polygons refer to the centres of the pixels of a site's
+image, where the y-axis points downwards, i.e. the pixel in row *i* and
+column *j* is at *x = j* and *y = i*. This is the convention of the outlines
+that are extracted from label images, e.g. by
+:meth:`SegmentationImage.extract_polygons <tmlib.image.SegmentationImage.extract_polygons>`,
+such that polygons lie within *[0, width - 1]* and *[0, height - 1]*.
+Outlines that follow the edges of pixels rather than their centres must be
+shifted by *-0.5* in both directions before they are sent.
+"""
+import struct
+
+#: media type of polygon streams
+MIMETYPE = 'application/vnd.tissuemaps.polygons'
+
+#: maximal size of a single geometry in bytes
+MAX_GEOMETRY_SIZE = 16 * 1024 * 1024
+
+_HEADER = struct.Struct('<iI')
+
+
+def pack_record(label, geometry):
+    """Packs a labeled polygon as record of a stream.
+
+    Parameters
+    ----------
+    label: int
+        label of the mapobject
+    geometry: str
+        polygon in WKB format
+
+    Returns
+    -------
+    str
+        record
+    """
+    return _HEADER.pack(label, len(geometry)) + geometry
+
+
+def _read(f, size):
+    # Streams may return fewer bytes than requested before their end.
+    chunks = list()
+    while size > 0:
+        chunk = f.read(size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return ''.join(chunks)
+
+
+def iter_records(f):
+    """Reads the records of a stream.
+
+    Parameters
+    ----------
+    f: file-like
+        stream
+
+    Returns
+    -------
+    Generator[Tuple[int, str]]
+        label and geometry in WKB format of each mapobject
+
+    Raises
+    ------
+    ValueError
+        when a record is truncated, a label isn't positive or a geometry is
+        empty or exceeds :const:`MAX_GEOMETRY_SIZE`
+    """
+    i = 0
+    while True:
+        header = _read(f, _HEADER.size)
+        if not header:
+            return
+        if len(header) < _HEADER.size:
+            raise ValueError('Record %d is truncated.' % i)
+        label, size = _HEADER.unpack(header)
+        if label <= 0:
+            raise ValueError(
+                'Label of record %d must be a positive integer.' % i
+            )
+        if size == 0 or size > MAX_GEOMETRY_SIZE:
+            raise ValueError(
+                'Geometry of record %d must have between 1 and %d bytes.' % (
+                    i, MAX_GEOMETRY_SIZE
+                )
+            )
+        geometry = _read(f, size)
+        if len(geometry) < size:
+            raise ValueError('Record %d is truncated.' % i)
+        yield (label, geometry)
+        i += 1
+
+
+def load_polygons(f, image_size, y_offset, x_offset):
+    """Reads the labeled polygons of the mapobjects of a site from a stream
+    and transforms them into the coordinate system of the map, where the
+    y-axis points upwards.
+
+    Parameters
+    ----------
+    f: file-like
+        stream
+    image_size: Tuple[int]
+        height and width of the site's image
+    y_offset: int
+        *y* offset of the site's image within the map
+    x_offset: int
+        *x* offset of the site's image within the map
+
+    Returns
+    -------
+    List[Tuple[int, shapely.geometry.Polygon]]
+        label and polygon of each mapobject
+
+    Raises
+    ------
+    ValueError
+        when the stream is malformed, a geometry is no valid polygon, a
+        polygon lies outside of the image or a label isn't unique
+    """
+    # Only required to decode geometries.
+    import shapely.wkb
+    import shapely.affinity
+    height, width = image_size
+    matrix = [1, 0, 0, -1, x_offset, -y_offset]
+    polygons = list()
+    labels = set()
+    for label, geometry in iter_records(f):
+        if label in labels:
+            raise ValueError('Label %d is not unique.' % label)
+        labels.add(label)
+        try:
+            polygon = shapely.wkb.loads(geometry)
+        except Exception:
+            # The type of the error depends on the version of GEOS.
+            raise ValueError('Geometry of label %d is not valid WKB.' % label)
+        if polygon.geom_type != 'Polygon' or polygon.is_empty:
+            raise ValueError('Geometry of label %d is not a polygon.' % label)
+        if not polygon.is_valid:
+            raise ValueError('Polygon of label %d is not valid.' % label)
+        minx, miny, maxx, maxy = polygon.bounds
+        if minx < 0 or miny < 0 or maxx > width - 1 or maxy > height - 1:
+            raise ValueError(
+                'Polygon of label %d exceeds the centres of the pixels of '
+                'the image.' % label
+            )
+        polygons.append(
+            (label, shapely.affinity.affine_transform(polygon, matrix))
+        )
+    return polygons
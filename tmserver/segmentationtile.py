@@ -0,0 +1,395 @@
+# TmServer - TissueMAPS server application.
+# Copyright (C) 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Rendering of segmentation layer tiles, which is shared by the tile
+endpoints and the materialization of tiles ahead of requests.
+"""
+import json
+import logging
+import numpy as np
+from sqlalchemy import select, and_, func
+
+import tmlib.models as tm
+
+from tmserver.densitygrid import (
+    compute_density_grid, encode_density_grid, encode_density_grid_as_json,
+    decode_density_grid
+)
+from tmserver.vectortile import encode_vector_tile
+from tmserver.geojsontile import iter_feature_collection
+
+logger = logging.getLogger(__name__)
+
+#: number of rows and columns of the density grids of segmentation layers
+DENSITY_GRID_SHAPE = (64, 64)
+
+#: number of mapobjects that are read from the database and encoded at a time
+#: when a tile gets streamed
+STREAM_BATCH_SIZE = 500
+
+
+def is_density_zoom_level(z, maxzoom, density_zoom_levels):
+    """Determines whether mapobjects are aggregated into density grids at a
+    zoom level.
+
+    Parameters
+    ----------
+    z: int
+        zero-based zoom level index
+    maxzoom: int
+        maximal zoom level index
+    density_zoom_levels: int
+        number of zoom levels below `maxzoom` from which on density grids
+        are used; ``0`` disables density grids
+
+    Returns
+    -------
+    bool
+    """
+    return 0 < density_zoom_levels <= maxzoom - z
+
+
+def get_simplified_segmentations(session, segmentation_layer_id, z, y, x,
+        maxzoom, encoding='geojson'):
+    """Gets the segmentations of a segmentation layer that intersect with a
+    tile below the maximal zoom level. Polygons are simplified with a
+    tolerance of half the size of a pixel at zoom level `z`, which preserves
+    their topology. Coordinates of GeoJSON geometries are rounded to
+    integers.
+
+    Parameters
+    ----------
+    session: tmlib.models.utils.ExperimentSession
+        database session
+    segmentation_layer_id: int
+        ID of the segmentation layer
+    z: int
+        zero-based zoom level index
+    y: int
+        zero-based row index
+    x: int
+        zero-based column index
+    maxzoom: int
+        maximal zoom level index
+    encoding: str, optional
+        encoding of geometries: ``"geojson"`` or ``"wkb"``
+        (default: ``"geojson"``)
+
+    Returns
+    -------
+    List[Tuple[int, Union[str, buffer]]]
+        ID and encoded geometry of each mapobject
+    """
+    geometry = _get_simplified_geometry(z, maxzoom, encoding)
+    return _query_segmentations(
+        session, segmentation_layer_id, geometry, z, y, x, maxzoom
+    ).all()
+
+
+def _get_simplified_geometry(z, maxzoom, encoding):
+    tolerance = 2 ** (maxzoom - z) / 2.0
+    logger.debug('simplify polygons using tolerance %.1f', tolerance)
+    geometry = func.ST_SimplifyPreserveTopology(
+        tm.MapobjectSegmentation.geom_polygon, tolerance
+    )
+    if encoding == 'wkb':
+        return func.ST_AsBinary(geometry)
+    return func.ST_AsGeoJSON(geometry, 0)
+
+
+def get_segmentations_as_wkb(session, segmentation_layer_id, z, y, x,
+        maxzoom):
+    """Gets the unsimplified segmentations of a segmentation layer that
+    intersect with a tile as WKB, e.g. at the maximal zoom level, where
+    :meth:`get_segmentations <tmlib.models.layer.SegmentationLayer.get_segmentations>`
+    would encode them as GeoJSON.
+
+    Parameters
+    ----------
+    session: tmlib.models.utils.ExperimentSession
+        database session
+    segmentation_layer_id: int
+        ID of the segmentation layer
+    z: int
+        zero-based zoom level index
+    y: int
+        zero-based row index
+    x: int
+        zero-based column index
+    maxzoom: int
+        maximal zoom level index
+
+    Returns
+    -------
+    List[Tuple[int, buffer]]
+        ID and WKB encoded geometry of each mapobject
+    """
+    geometry = func.ST_AsBinary(tm.MapobjectSegmentation.geom_polygon)
+    return _query_segmentations(
+        session, segmentation_layer_id, geometry, z, y, x, maxzoom
+    ).all()
+
+
+def _query_segmentations(session, segmentation_layer_id, geometry, z, y, x,
+        maxzoom):
+    minx, miny, maxx, maxy = tm.SegmentationLayer.get_tile_bounding_box(
+        x, y, z, maxzoom
+    )
+    tile = func.ST_MakeEnvelope(
+        min(minx, maxx), min(miny, maxy), max(minx, maxx), max(miny, maxy)
+    )
+    return session.query(
+            tm.MapobjectSegmentation.mapobject_id, geometry
+        ).\
+        filter(
+            tm.MapobjectSegmentation.segmentation_layer_id ==
+                segmentation_layer_id,
+            tm.MapobjectSegmentation.geom_polygon.ST_Intersects(tile)
+        )
+
+
+def get_segmentation_layer_density_grid(experiment_id,
+        segmentation_layer_id, z, y, x, maxzoom, fmt):
+    """Counts the mapobjects of a segmentation layer within the cells of a
+    grid over a tile based on their centroids.
+
+    Parameters
+    ----------
+    experiment_id: int
+        ID of the experiment
+    segmentation_layer_id: int
+        ID of the segmentation layer
+    z: int
+        zero-based zoom level index
+    y: int
+        zero-based row index
+    x: int
+        zero-based column index
+    maxzoom: int
+        maximal zoom level index
+    fmt: str
+        ``"geojson"`` for JSON or ``"binary"``
+
+    Returns
+    -------
+    str
+        encoded density grid
+
+    See also
+    --------
+    :mod:`tmserver.densitygrid`
+    """
+    minx, miny, maxx, maxy = tm.SegmentationLayer.get_tile_bounding_box(
+        x, y, z, maxzoom
+    )
+    bbox = (
+        min(minx, maxx), min(miny, maxy), max(minx, maxx), max(miny, maxy)
+    )
+    centroid = tm.MapobjectSegmentation.geom_centroid
+    query = select([func.ST_X(centroid), func.ST_Y(centroid)]).\
+        where(and_(
+            tm.MapobjectSegmentation.segmentation_layer_id ==
+                segmentation_layer_id,
+            func.ST_Intersects(centroid, func.ST_MakeEnvelope(*bbox))
+        ))
+    with tm.utils.ExperimentSession(experiment_id) as session:
+        centroids = np.array(
+            session.execute(query).fetchall(), dtype=np.float64
+        ).reshape(-1, 2)
+    logger.debug('aggregate %d mapobjects into density grid', len(centroids))
+    counts = compute_density_grid(
+        centroids[:, 0], centroids[:, 1], bbox, DENSITY_GRID_SHAPE
+    )
+    if fmt == 'binary':
+        return encode_density_grid(counts, bbox)
+    return encode_density_grid_as_json(counts, bbox)
+
+
+def get_segmentation_layer_outlines(experiment_id, segmentation_layer_id,
+        z, y, x, maxzoom, encoding='geojson'):
+    """Gets the segmentations of a segmentation layer that intersect with a
+    tile, which are simplified below the maximal zoom level.
+
+    Parameters
+    ----------
+    experiment_id: int
+        ID of the experiment
+    segmentation_layer_id: int
+        ID of the segmentation layer
+    z: int
+        zero-based zoom level index
+    y: int
+        zero-based row index
+    x: int
+        zero-based column index
+    maxzoom: int
+        maximal zoom level index
+    encoding: str, optional
+        encoding of geometries: ``"geojson"`` or ``"wkb"``
+        (default: ``"geojson"``)
+
+    Returns
+    -------
+    Tuple[str, List[Tuple[int, Union[str, buffer]]]]
+        name of the mapobject type and ID and encoded geometry of each
+        mapobject
+    """
+    with tm.utils.ExperimentSession(experiment_id) as session:
+        segmentation_layer = session.query(tm.SegmentationLayer).get(
+            segmentation_layer_id
+        )
+        if z < maxzoom:
+            outlines = get_simplified_segmentations(
+                session, segmentation_layer_id, z, y, x, maxzoom, encoding
+            )
+        elif encoding == 'wkb':
+            outlines = get_segmentations_as_wkb(
+                session, segmentation_layer_id, z, y, x, maxzoom
+            )
+        else:
+            outlines = segmentation_layer.get_segmentations(x, y, z)
+        mapobject_type_name = segmentation_layer.mapobject_type.name
+    return (mapobject_type_name, outlines)
+
+
+def iter_segmentation_layer_geojson_tile(experiment_id,
+        segmentation_layer_id, z, y, x, maxzoom):
+    """Generates a tile of a segmentation layer as GeoJSON feature
+    collection, whose features are encoded as the mapobjects are read from a
+    server-side cursor. Only a batch of rows and a chunk of the output are
+    held in memory at a time. The database session stays open until the
+    generator is exhausted or closed.
+
+    Parameters
+    ----------
+    experiment_id: int
+        ID of the experiment
+    segmentation_layer_id: int
+        ID of the segmentation layer
+    z: int
+        zero-based zoom level index
+    y: int
+        zero-based row index
+    x: int
+        zero-based column index
+    maxzoom: int
+        maximal zoom level index
+
+    Returns
+    -------
+    Generator[str]
+        chunks of the encoded feature collection
+
+    See also
+    --------
+    :func:`tmserver.geojsontile.iter_feature_collection`
+    """
+    with tm.utils.ExperimentSession(experiment_id) as session:
+        segmentation_layer = session.query(tm.SegmentationLayer).get(
+            segmentation_layer_id
+        )
+        properties = json.dumps({
+            'type': segmentation_layer.mapobject_type.name
+        })
+        if z < maxzoom:
+            geometry = _get_simplified_geometry(z, maxzoom, 'geojson')
+        else:
+            geometry = func.ST_AsGeoJSON(
+                tm.MapobjectSegmentation.geom_polygon
+            )
+        outlines = _query_segmentations(
+                session, segmentation_layer_id, geometry, z, y, x, maxzoom
+            ).\
+            yield_per(STREAM_BATCH_SIZE)
+        for chunk in iter_feature_collection(
+                outlines, lambda _: properties, STREAM_BATCH_SIZE):
+            yield chunk
+
+
+def render_segmentation_layer_tile(experiment_id, segmentation_layer_id,
+        z, y, x, maxzoom, density_zoom_levels):
+    """Renders a tile of a segmentation layer in binary form, i.e. as
+    density grid or vector tile depending on the zoom level.
+
+    Parameters
+    ----------
+    experiment_id: int
+        ID of the experiment
+    segmentation_layer_id: int
+        ID of the segmentation layer
+    z: int
+        zero-based zoom level index
+    y: int
+        zero-based row index
+    x: int
+        zero-based column index
+    maxzoom: int
+        maximal zoom level index
+    density_zoom_levels: int
+        see :func:`is_density_zoom_level`
+
+    Returns
+    -------
+    str
+        encoded tile or ``None`` when the tile contains no mapobjects
+    """
+    if is_density_zoom_level(z, maxzoom, density_zoom_levels):
+        data = get_segmentation_layer_density_grid(
+            experiment_id, segmentation_layer_id, z, y, x, maxzoom, 'binary'
+        )
+        counts, _ = decode_density_grid(data)
+        if not counts.any():
+            return None
+        return data
+    _, outlines = get_segmentation_layer_outlines(
+        experiment_id, segmentation_layer_id, z, y, x, maxzoom, 'wkb'
+    )
+    if len(outlines) == 0:
+        return None
+    return encode_vector_tile(outlines)
+
+
+def get_empty_segmentation_layer_tile(z, y, x, maxzoom, density_zoom_levels):
+    """Gets a tile of a segmentation layer without mapobjects in binary
+    form.
+
+    Parameters
+    ----------
+    z: int
+        zero-based zoom level index
+    y: int
+        zero-based row index
+    x: int
+        zero-based column index
+    maxzoom: int
+        maximal zoom level index
+    density_zoom_levels: int
+        see :func:`is_density_zoom_level`
+
+    Returns
+    -------
+    str
+        encoded tile
+    """
+    if is_density_zoom_level(z, maxzoom, density_zoom_levels):
+        minx, miny, maxx, maxy = tm.SegmentationLayer.get_tile_bounding_box(
+            x, y, z, maxzoom
+        )
+        bbox = (
+            min(minx, maxx), min(miny, maxy), max(minx, maxx), max(miny, maxy)
+        )
+        counts = np.zeros(DENSITY_GRID_SHAPE, dtype=np.uint32)
+        return encode_density_grid(counts, bbox)
+    return encode_vector_tile([])
@@ -0,0 +1,99 @@
+# TmServer - TissueMAPS server application.
+# Copyright (C) 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Coalescing of identical concurrent computations within a process."""
+import sys
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exc_info = None
+        self.n_waiting = 0
+
+
+class SingleFlight(object):
+
+    """Executes a function at most once at a time per key.
+
+    Callers that request a key while a call for the same key is in flight
+    wait for this call and receive its result or exception instead of
+    calling the function themselves. Results are not retained once the call
+    has completed, i.e. this is not a cache. Works with threads as well as
+    with greenlets of monkey patched *gevent* workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = dict()
+
+    def do(self, key, func, *args, **kwargs):
+        """Calls a function unless a call with the same key is in flight,
+        in which case that call's outcome is awaited.
+
+        Parameters
+        ----------
+        key: hashable
+            identity of the computation
+        func: function
+            function that performs the computation
+        *args:
+            positional arguments of `func`
+        **kwargs:
+            keyword arguments of `func`
+
+        Returns
+        -------
+        return value of `func`
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.n_waiting += 1
+                is_leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                is_leader = True
+        if not is_leader:
+            logger.debug('wait for call in flight: %r', key)
+            call.done.wait()
+            if call.exc_info is not None:
+                raise call.exc_info[0], call.exc_info[1], call.exc_info[2]
+            return call.result
+        try:
+            call.result = func(*args, **kwargs)
+        except:
+            call.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            if call.n_waiting > 0:
+                logger.debug(
+                    'shared result of call with %d waiting callers',
+                    call.n_waiting
+                )
+        return call.result
+
+    def __len__(self):
+        return len(self._calls)
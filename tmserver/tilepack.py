@@ -0,0 +1,352 @@
+# TmServer - TissueMAPS server application.
+# Copyright (C) 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Packed archives of the pyramid tiles of a layer.
+
+A pack is a single file that holds all tiles of a layer, such that tiles can
+be served from a memory map of the file without accessing the database.
+The file starts with a header of 24 bytes::
+
+    magic "TMTP" | format version (uint16) | padding (uint16) |
+    layer version (int64) | number of tiles *n* (uint64)
+
+followed by the index, which consists of *n* sorted tile keys (uint64),
+*n* offsets (uint64) and *n* sizes (uint32), and finally the concatenated
+tiles. Offsets are relative to the end of the index. All numbers are
+little-endian.
+"""
+import os
+import errno
+import mmap
+import shutil
+import struct
+import logging
+import tempfile
+import threading
+import collections
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = 'TMTP'
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct('<4sHxxqQ')
+
+# The umask can only be read by setting it. It is read once on import, before
+# any threads are started, rather than each time a pack is written.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _encode_keys(z, y, x):
+    z = np.asarray(z, dtype=np.uint64)
+    y = np.asarray(y, dtype=np.uint64)
+    x = np.asarray(x, dtype=np.uint64)
+    return (z << np.uint64(56)) | (y << np.uint64(28)) | x
+
+
+def write_tile_pack(path, tiles, layer_version=0):
+    """Writes tiles into a pack. The file is replaced atomically, such that
+    processes that have the previous pack mapped into memory can continue to
+    use it.
+
+    Parameters
+    ----------
+    path: str
+        absolute path to the pack file
+    tiles: Iterable[Tuple[int, int, int, str]]
+        *z*, *y*, *x* coordinates and data of each tile
+    layer_version: int, optional
+        version of the layer the tiles belong to (default: ``0``)
+
+    Returns
+    -------
+    int
+        number of packed tiles
+    """
+    dirname = os.path.dirname(path)
+    if not os.path.exists(dirname):
+        try:
+            os.makedirs(dirname)
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+    coordinates = list()
+    offsets = list()
+    sizes = list()
+    offset = 0
+    with tempfile.TemporaryFile(dir=dirname) as data:
+        for z, y, x, pixels in tiles:
+            data.write(pixels)
+            coordinates.append((z, y, x))
+            offsets.append(offset)
+            sizes.append(len(pixels))
+            offset += len(pixels)
+        n = len(coordinates)
+        coordinates = np.array(coordinates, dtype=np.uint64).reshape(-1, 3)
+        keys = _encode_keys(
+            coordinates[:, 0], coordinates[:, 1], coordinates[:, 2]
+        )
+        order = np.argsort(keys, kind='mergesort')
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        try:
+            # "mkstemp" creates the file with mode 0600, which would prevent
+            # the server from reading packs written by another user.
+            os.fchmod(fd, 0o666 & ~_UMASK)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_HEADER.pack(_MAGIC, _FORMAT_VERSION, layer_version, n))
+                f.write(keys[order].astype('<u8').tostring())
+                f.write(
+                    np.array(offsets, dtype='<u8')[order].tostring()
+                )
+                f.write(np.array(sizes, dtype='<u4')[order].tostring())
+                data.seek(0)
+                shutil.copyfileobj(data, f)
+            os.rename(tmp_path, path)
+        except:
+            os.remove(tmp_path)
+            raise
+    return n
+
+
+class TilePack(object):
+
+    """Read access to a pack via a memory map of the file.
+
+    The index is copied into memory and tiles are copied out of the map when
+    they are read, such that no object refers to the memory map once the
+    pack got closed. Tiles are thus read without any system call, but not
+    without copying them.
+    """
+
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        path: str
+            absolute path to the pack file
+
+        Raises
+        ------
+        ValueError
+            when the file is not a pack or has an unsupported format version
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, format_version, self.layer_version, n = _HEADER.unpack_from(
+            self._mmap, 0
+        )
+        if magic != _MAGIC or format_version != _FORMAT_VERSION:
+            self._mmap.close()
+            raise ValueError('File "%s" is not a supported tile pack.' % path)
+        offset = _HEADER.size
+        self._keys = np.frombuffer(self._mmap, '<u8', n, offset).copy()
+        offset += 8 * n
+        self._offsets = np.frombuffer(self._mmap, '<u8', n, offset).copy()
+        offset += 8 * n
+        self._sizes = np.frombuffer(self._mmap, '<u4', n, offset).copy()
+        self._data_offset = offset + 4 * n
+        self.closed = False
+
+    def __len__(self):
+        return len(self._keys)
+
+    def close(self):
+        """Unmaps the file and releases its file descriptor."""
+        self.closed = True
+        self._mmap.close()
+
+    def get(self, z, y, x):
+        """Gets a tile.
+
+        Parameters
+        ----------
+        z: int
+            zero-based zoom level index
+        y: int
+            zero-based row index
+        x: int
+            zero-based column index
+
+        Returns
+        -------
+        str
+            copy of the tile data or ``None`` if the pack doesn't contain the
+            tile
+
+        Raises
+        ------
+        ValueError
+            when the pack is closed
+
+        Note
+        ----
+        The data is copied, because a ``buffer`` of the memory map would
+        point to unmapped memory once the pack gets closed, e.g. when it is
+        evicted by :class:`TilePackStore` while a response is still being
+        sent.
+        """
+        if self.closed:
+            raise ValueError('Tile pack "%s" is closed.' % self.path)
+        if z < 0 or y < 0 or x < 0:
+            return None
+        key = _encode_keys(z, y, x)
+        i = np.searchsorted(self._keys, key)
+        if i == len(self._keys) or self._keys[i] != key:
+            return None
+        start = self._data_offset + int(self._offsets[i])
+        return self._mmap[start:start + int(self._sizes[i])]
+
+
+class TilePackStore(object):
+
+    """Directory of packs, one per layer, which keeps the most recently used
+    packs mapped and reopens them when they got rebuilt. Packs that are
+    evicted, replaced or removed get closed, which releases their file
+    descriptors.
+    """
+
+    def __init__(self, directory, max_open=64):
+        """
+        Parameters
+        ----------
+        directory: str
+            absolute path to the root directory of the packs
+        max_open: int, optional
+            maximal number of packs that are kept open (default: ``64``)
+        """
+        self.directory = directory
+        self.max_open = max_open
+        self._packs = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_path(self, experiment_id, layer_id):
+        """Gets the location of a pack.
+
+        Parameters
+        ----------
+        experiment_id: int
+            ID of the experiment
+        layer_id: int
+            ID of the layer
+
+        Returns
+        -------
+        str
+            absolute path to the pack file
+        """
+        return os.path.join(
+            self.directory, 'experiment_%d' % experiment_id,
+            'layer_%d.tilepack' % layer_id
+        )
+
+    def open(self, experiment_id, layer_id):
+        """Opens the pack of a layer.
+
+        Parameters
+        ----------
+        experiment_id: int
+            ID of the experiment
+        layer_id: int
+            ID of the layer
+
+        Returns
+        -------
+        tmserver.tilepack.TilePack
+            pack or ``None`` if the layer has no pack
+
+        Note
+        ----
+        A pack may get closed by another thread while it is used, in which
+        case :meth:`TilePack.get <tmserver.tilepack.TilePack.get>` raises
+        :class:`ValueError`.
+        """
+        path = self.get_path(experiment_id, layer_id)
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+        with self._lock:
+            entry = self._packs.pop(path, None)
+            if st is None:
+                if entry is not None:
+                    entry[1].close()
+                return None
+            identity = (st.st_ino, st.st_mtime, st.st_size)
+            if entry is not None and entry[0] == identity:
+                self._packs[path] = entry
+                return entry[1]
+            if entry is not None:
+                logger.debug('close replaced tile pack "%s"', path)
+                entry[1].close()
+            try:
+                pack = TilePack(path)
+            except (IOError, OSError, ValueError) as err:
+                logger.error('cannot open tile pack "%s": %s', path, err)
+                return None
+            self._packs[path] = (identity, pack)
+            while len(self._packs) > self.max_open:
+                evicted_path, (_, evicted) = self._packs.popitem(last=False)
+                logger.debug('close tile pack "%s"', evicted_path)
+                evicted.close()
+        return pack
+
+    def close(self):
+        """Closes all open packs."""
+        with self._lock:
+            for _, pack in self._packs.values():
+                pack.close()
+            self._packs.clear()
+
+    def build(self, experiment_id, layer_id, tiles, layer_version=0):
+        """Builds or replaces the pack of a layer.
+
+        Parameters
+        ----------
+        experiment_id: int
+            ID of the experiment
+        layer_id: int
+            ID of the layer
+        tiles: Iterable[Tuple[int, int, int, str]]
+            *z*, *y*, *x* coordinates and data of each tile
+        layer_version: int, optional
+            version of the layer the tiles belong to (default: ``0``)
+
+        Returns
+        -------
+        int
+            number of packed tiles
+        """
+        path = self.get_path(experiment_id, layer_id)
+        return write_tile_pack(path, tiles, layer_version)
+
+    def remove(self, experiment_id, layer_id=None):
+        """Removes the pack of a layer or all packs of an experiment.
+
+        Parameters
+        ----------
+        experiment_id: int
+            ID of the experiment
+        layer_id: int, optional
+            ID of the layer (default: ``None``)
+        """
+        if layer_id is None:
+            path = os.path.dirname(self.get_path(experiment_id, 0))
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            path = self.get_path(experiment_id, layer_id)
+            if os.path.exists(path):
+                os.remove(path)
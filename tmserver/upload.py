@@ -0,0 +1,161 @@
+# TmServer - TissueMAPS server application.
+# Copyright (C) 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Reading of the label images, which clients upload in binary form rather
+than base64 encoded within JSON objects.
+
+An uploaded image is either a file in NPY or NPZ format, where an NPZ file
+must contain the array "segmentation", or a raw typed array in row-major
+order. Uploads are read from the request as they arrive.
+"""
+import shutil
+import tempfile
+import numpy as np
+from flask import request
+
+#: number of bytes that are read from the request at once
+CHUNK_SIZE = 2**20
+
+
+def get_upload_stream(name):
+    """Gets the uploaded data, which is either the request body or a part of
+    a ``multipart/form-data`` request.
+
+    Parameters
+    ----------
+    name: str
+        name of the part
+
+    Returns
+    -------
+    file-like
+
+    Raises
+    ------
+    ValueError
+        when a multipart request lacks the part
+    """
+    if request.mimetype == 'multipart/form-data':
+        f = request.files.get(name)
+        if not f:
+            raise ValueError('Missing part "%s" in the upload request.' % name)
+        return f.stream
+    return request.stream
+
+
+def parse_dtype(name):
+    """Parses the type of the labels of a raw array.
+
+    Parameters
+    ----------
+    name: str
+        type in the notation of NumPy, e.g. ``"<i4"`` for little-endian
+        32-bit integers
+
+    Returns
+    -------
+    numpy.dtype
+
+    Raises
+    ------
+    ValueError
+        when the type is unknown or not an integer type
+    """
+    try:
+        dtype = np.dtype(str(name))
+    except TypeError:
+        raise ValueError('Unknown type "%s".' % name)
+    if dtype.kind not in {'i', 'u'}:
+        raise ValueError('Labels must have an integer type.')
+    return dtype
+
+
+def read_raw_array(f, shape, dtype):
+    """Reads a raw typed array from a stream into a single buffer.
+
+    Parameters
+    ----------
+    f: file-like
+        stream
+    shape: Tuple[int]
+        shape of the array
+    dtype: numpy.dtype
+        type of the array
+
+    Returns
+    -------
+    numpy.ndarray
+
+    Raises
+    ------
+    ValueError
+        when the stream doesn't have the size of the array
+    """
+    size = int(np.prod(shape)) * dtype.itemsize
+    data = bytearray(size)
+    view = memoryview(data)
+    offset = 0
+    while offset < size:
+        chunk = f.read(min(size - offset, CHUNK_SIZE))
+        if not chunk:
+            break
+        view[offset:offset + len(chunk)] = chunk
+        offset += len(chunk)
+    if offset != size or f.read(1):
+        raise ValueError(
+            'Image must have %d bytes for shape %s and type "%s".' % (
+                size, shape, dtype.name
+            )
+        )
+    return np.frombuffer(data, dtype=dtype).reshape(shape)
+
+
+def load_array(f, spool=False):
+    """Loads an array from a stream in NPY or NPZ format. Pickled objects
+    are rejected.
+
+    Parameters
+    ----------
+    f: file-like
+        stream
+    spool: bool, optional
+        whether the stream must be copied to a temporary file first, since
+        NPZ files can only be read from seekable files (default: ``False``)
+
+    Returns
+    -------
+    numpy.ndarray
+
+    Raises
+    ------
+    ValueError
+        when the stream holds no array or an NPZ file lacks the array
+        "segmentation"
+    """
+    if spool:
+        with tempfile.TemporaryFile() as spooled:
+            shutil.copyfileobj(f, spooled)
+            spooled.seek(0)
+            return load_array(spooled)
+    try:
+        content = np.load(f, allow_pickle=False)
+    except (IOError, ValueError) as err:
+        raise ValueError('Image could not be loaded: %s' % err)
+    if isinstance(content, np.ndarray):
+        return content
+    try:
+        return content['segmentation']
+    except KeyError:
+        raise ValueError('NPZ file must contain an array "segmentation".')
@@ -18,11 +18,12 @@ Various utility functions used by view functions and other parts of the
 server application.
 
 """
+import datetime
 import functools
 import logging
 import os
 
-from flask import request, current_app
+from flask import request, current_app, Response
 from flask_jwt import current_identity
 
 import tmlib.models as tm
@@ -242,6 +243,93 @@ def decode_query_ids(permission='write'):
     return decorator
 
 
+def get_not_modified_response(etag, last_modified, max_age=None,
+        private=False):
+    """Evaluates the conditional headers "If-None-Match" and
+    "If-Modified-Since" of the current request against the validators of the
+    requested resource. This allows view functions to respond before they
+    load the resource.
+
+    Parameters
+    ----------
+    etag: str
+        entity tag of the requested resource
+    last_modified: Union[float, datetime.datetime]
+        time of the last modification of the requested resource either in
+        seconds since the epoch or as UTC datetime
+    max_age: int, optional
+        see :func:`set_cache_validators` (default: ``None``)
+    private: bool, optional
+        see :func:`set_cache_validators` (default: ``False``)
+
+    Returns
+    -------
+    flask.Response
+        empty response with status code 304 if the client already has the
+        current representation of the resource or ``None`` otherwise
+    """
+    last_modified = _get_http_date(last_modified)
+    if request.if_none_match:
+        # "If-Modified-Since" must be ignored when "If-None-Match" is given.
+        not_modified = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since is not None:
+        not_modified = last_modified <= request.if_modified_since
+    else:
+        not_modified = False
+    if not not_modified:
+        return None
+    response = Response(status=304)
+    return set_cache_validators(
+        response, etag, last_modified, max_age, private
+    )
+
+
+def set_cache_validators(response, etag, last_modified, max_age=None,
+        private=False):
+    """Sets the validators and caching directives of a response.
+
+    Parameters
+    ----------
+    response: flask.Response
+        response to a GET request
+    etag: str
+        entity tag of the requested resource
+    last_modified: Union[float, datetime.datetime]
+        time of the last modification of the requested resource either in
+        seconds since the epoch or as UTC datetime
+    max_age: int, optional
+        number of seconds shared caches and clients may use the response
+        without revalidating it; the response must be revalidated upon each
+        use when not provided (default: ``None``)
+    private: bool, optional
+        whether only the client may store the response, e.g. because it
+        requires authentication (default: ``False``)
+
+    Returns
+    -------
+    flask.Response
+        `response`
+    """
+    response.set_etag(etag)
+    response.last_modified = _get_http_date(last_modified)
+    if private:
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+    if max_age is not None:
+        response.cache_control.max_age = max_age
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+def _get_http_date(timestamp):
+    # HTTP dates have a resolution of seconds.
+    if isinstance(timestamp, datetime.datetime):
+        return timestamp.replace(microsecond=0)
+    return datetime.datetime.utcfromtimestamp(int(timestamp))
+
+
 def is_exe(path):
     """
     Return true if *path* points to an executable file.
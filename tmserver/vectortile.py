@@ -0,0 +1,221 @@
+# TmServer - TissueMAPS server application.
+# Copyright (C) 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Compact binary encoding of the geometries of segmentation layer tiles.
+
+A vector tile starts with a header of 12 bytes::
+
+    magic "TMVT" | format version (uint16) | padding (uint16) |
+    number of features *n* (uint32)
+
+followed by
+
+- the *n* feature IDs (int64),
+- the number of rings of each feature (uint32),
+- the number of vertices of each ring (uint32) and
+- the *x* and *y* coordinates of each vertex (int32).
+
+Coordinates are rounded to integers. The first vertex of each ring holds
+absolute coordinates, all subsequent vertices of the ring hold the
+difference to the previous vertex. Points are encoded as rings with a
+single vertex and empty rings are omitted. The rings of multi-part
+geometries are concatenated, such that clients should fill polygons using
+the even-odd rule. All numbers are little-endian, which allows clients to
+read the arrays as typed arrays.
+Since most deltas are small, the arrays compress well with the content
+codings of the server.
+
+Geometries are given either in Well-Known Binary (WKB) format, as returned
+by ``ST_AsBinary``, or as GeoJSON. WKB geometries are read without creating
+a Python object per vertex.
+"""
+import json
+import struct
+import numpy as np
+
+#: media type of vector tiles
+MIMETYPE = 'application/vnd.tissuemaps.vector-tile'
+
+_MAGIC = 'TMVT'
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct('<4sHxxI')
+
+
+_WKB_BYTE_ORDERS = {'\x00': '>', '\x01': '<'}
+
+
+def _get_geojson_rings(geometry):
+    geometry = json.loads(geometry)
+    geometry_type = geometry['type']
+    coordinates = geometry['coordinates']
+    if geometry_type == 'Point':
+        rings = [[coordinates]]
+    elif geometry_type in {'LineString', 'MultiPoint'}:
+        rings = [coordinates]
+    elif geometry_type in {'Polygon', 'MultiLineString'}:
+        rings = coordinates
+    elif geometry_type == 'MultiPolygon':
+        rings = [ring for polygon in coordinates for ring in polygon]
+    else:
+        raise ValueError(
+            'Geometry type "%s" is not supported.' % geometry_type
+        )
+    return [np.array(ring, dtype=np.float64).reshape(-1, 2) for ring in rings]
+
+
+def _read_wkb_rings(data, offset, rings):
+    byte_order = _WKB_BYTE_ORDERS.get(data[offset:offset + 1])
+    if byte_order is None:
+        raise ValueError('Geometry is not valid WKB.')
+    geometry_type, = struct.unpack_from(byte_order + 'I', data, offset + 1)
+    offset += 5
+    if geometry_type == 1:
+        rings.append(
+            np.frombuffer(data, byte_order + 'f8', 2, offset).reshape(1, 2)
+        )
+        return offset + 16
+    elif geometry_type in {2, 3}:
+        n_rings = 1
+        if geometry_type == 3:
+            n_rings, = struct.unpack_from(byte_order + 'I', data, offset)
+            offset += 4
+        for i in range(n_rings):
+            n, = struct.unpack_from(byte_order + 'I', data, offset)
+            offset += 4
+            rings.append(
+                np.frombuffer(data, byte_order + 'f8', 2 * n, offset).
+                reshape(n, 2)
+            )
+            offset += 16 * n
+        return offset
+    elif geometry_type in {4, 5, 6}:
+        n, = struct.unpack_from(byte_order + 'I', data, offset)
+        offset += 4
+        for i in range(n):
+            offset = _read_wkb_rings(data, offset, rings)
+        return offset
+    raise ValueError('WKB geometry type %d is not supported.' % geometry_type)
+
+
+def _get_rings(geometry):
+    if geometry[:1] in _WKB_BYTE_ORDERS:
+        rings = list()
+        try:
+            _read_wkb_rings(geometry, 0, rings)
+        except struct.error:
+            raise ValueError('Geometry is not valid WKB.')
+        return rings
+    return _get_geojson_rings(geometry)
+
+
+def encode_vector_tile(outlines):
+    """Encodes geometries as vector tile.
+
+    Parameters
+    ----------
+    outlines: Iterable[Tuple[int, Union[str, buffer]]]
+        ID and WKB or GeoJSON geometry of each feature
+
+    Returns
+    -------
+    str
+        encoded vector tile
+
+    Raises
+    ------
+    ValueError
+        when a geometry is invalid or of an unsupported type
+    """
+    ids = list()
+    ring_counts = list()
+    ring_sizes = list()
+    vertices = list()
+    for feature_id, geometry in outlines:
+        # Empty rings, e.g. of empty polygons, have no vertex that could
+        # hold the absolute coordinates of the ring.
+        rings = [ring for ring in _get_rings(geometry) if len(ring) > 0]
+        ids.append(feature_id)
+        ring_counts.append(len(rings))
+        for ring in rings:
+            ring_sizes.append(len(ring))
+            vertices.append(ring)
+    if len(vertices) > 0:
+        vertices = np.round(np.concatenate(vertices)).astype('<i4')
+    else:
+        vertices = np.empty((0, 2), dtype='<i4')
+    if len(vertices) > 0:
+        deltas = np.empty_like(vertices)
+        deltas[0] = vertices[0]
+        deltas[1:] = vertices[1:] - vertices[:-1]
+        ring_starts = np.cumsum([0] + ring_sizes[:-1])
+        deltas[ring_starts] = vertices[ring_starts]
+    else:
+        deltas = vertices
+    return ''.join([
+        _HEADER.pack(_MAGIC, _FORMAT_VERSION, len(ids)),
+        np.array(ids, dtype='<i8').tostring(),
+        np.array(ring_counts, dtype='<u4').tostring(),
+        np.array(ring_sizes, dtype='<u4').tostring(),
+        deltas.tostring()
+    ])
+
+
+def decode_vector_tile(data):
+    """Decodes a vector tile.
+
+    Parameters
+    ----------
+    data: str
+        encoded vector tile
+
+    Returns
+    -------
+    List[Tuple[int, List[numpy.ndarray[numpy.int32]]]]
+        ID and rings of each feature, where each ring is an array of
+        absolute vertex coordinates with shape ``(n, 2)``
+
+    Raises
+    ------
+    ValueError
+        when `data` is not a vector tile of a supported format version
+    """
+    if len(data) < _HEADER.size:
+        raise ValueError('Data is not a supported vector tile.')
+    magic, format_version, n = _HEADER.unpack_from(data, 0)
+    if magic != _MAGIC or format_version != _FORMAT_VERSION:
+        raise ValueError('Data is not a supported vector tile.')
+    offset = _HEADER.size
+    ids = np.frombuffer(data, '<i8', n, offset)
+    offset += 8 * n
+    ring_counts = np.frombuffer(data, '<u4', n, offset)
+    offset += 4 * n
+    n_rings = int(ring_counts.sum())
+    ring_sizes = np.frombuffer(data, '<u4', n_rings, offset)
+    offset += 4 * n_rings
+    deltas = np.frombuffer(
+        data, '<i4', 2 * int(ring_sizes.sum()), offset
+    ).reshape(-1, 2)
+    features = list()
+    ring_index = 0
+    vertex_index = 0
+    for feature_id, ring_count in zip(ids, ring_counts):
+        rings = list()
+        for size in ring_sizes[ring_index:ring_index + ring_count]:
+            ring = deltas[vertex_index:vertex_index + size]
+            rings.append(np.cumsum(ring, axis=0, dtype=np.int32))
+            vertex_index += size
+        ring_index += ring_count
+        features.append((int(feature_id), rings))
+    return features